@@ -1,14 +1,17 @@
+import atexit
+import os
+import sys
 from flask import Flask, jsonify
 
+# control_state.py lives at the top of the repo, next to curvedLine.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from control_state import SharedControls
+
 app = Flask(__name__)
 
-# robot controls state
-controls = {
-    "forward": False,
-    "backward": False,
-    "left": False,
-    "right": False
-}
+# robot controls state, in shared memory so every worker process sees the same thing
+controls = SharedControls()
+atexit.register(controls.close)
 
 @app.route("/<direction>", methods=["POST"])
 def move(direction):
@@ -21,10 +24,10 @@ def move(direction):
     Return:
     json file of the new status
     """
-    for value in controls:
-        controls[value] = False
-    controls[direction] = not controls[direction]
-    return jsonify({direction: controls[direction]})
+    if direction not in controls:
+        return jsonify({"error": "Invalid direction"}), 400
+    controls.set_direction(direction)
+    return jsonify({direction: True})
 
 @app.route("/stop", methods=["POST"])
 def stop():
@@ -35,10 +38,10 @@ def stop():
     None
     
     Return:
-    None
+    json file of the new status
     """
-    for value in controls:
-        controls[value] = False
+    controls.stop()
+    return jsonify(controls.as_dict())
 
 
 @app.route("/status", methods=["GET"])
@@ -52,7 +55,7 @@ def status():
     Return:
     The new status of the controls
     """
-    return controls
+    return jsonify(controls.as_dict())
 
 if __name__ == "__main__":
     app.run(debug = True, host = "0.0.0.0", port=5000)
@@ -0,0 +1,177 @@
+import queue
+import sys
+import threading
+import tkinter
+import requests
+
+# (connect, read) timeouts in seconds for every command
+REQUEST_TIMEOUT = (1.0, 2.0)
+
+# how often the Tk loop picks up finished requests (ms)
+RESULT_POLL_MS = 50
+
+
+class CommandDispatcher:
+    """
+    Sends robot commands from a background thread so the Tk window never waits on the API.
+    Uses one keep-alive session, a small bounded queue, and collapses presses that pile up
+    while a request is in flight into the newest one (only the latest intent matters).
+    Results come back to the Tk thread through widget.after().
+
+    Parameters:
+    widget - any Tk widget (used for after())
+    api_url - base url of the API
+    on_result - called on the Tk thread as on_result(direction, ok, detail)
+    max_pending - how many commands can wait before the oldest is dropped
+    session - optional requests.Session (a new one is made if not given)
+
+    Return:
+    None
+    """
+    def __init__(self, widget, api_url, on_result=None, max_pending=4, session=None):
+        self.widget = widget
+        self.api_url = api_url
+        self.on_result = on_result
+        self.session = session if session is not None else requests.Session()
+        self.sent = 0
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._results = queue.Queue()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        # id of the pending after() callback, cancelled by close()
+        self._after_id = self.widget.after(RESULT_POLL_MS, self._poll_results)
+
+    def send(self, direction):
+        """
+        Queue a command without blocking; drops the oldest one if the queue is full.
+
+        Parameters:
+        direction - "forward", "left", "stop", ...
+
+        Return:
+        None
+        """
+        while True:
+            try:
+                self._pending.put_nowait(direction)
+                return
+            except queue.Full:
+                try:
+                    self._pending.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def close(self):
+        """
+        Stop the worker thread and close the session; no result is delivered after this.
+        """
+        self._closed = True
+        if self._after_id is not None:
+            try:
+                self.widget.after_cancel(self._after_id)
+            except tkinter.TclError:
+                pass  # the widget is already destroyed: nothing left to cancel
+            self._after_id = None
+        self.send(None)
+
+    def _run(self):
+        """
+        Worker thread: take the newest waiting command, post it, hand the result to Tk.
+        """
+        while True:
+            direction = self._pending.get()
+            # coalesce: anything queued behind it is a newer intent, keep only the last one
+            while direction is not None:
+                try:
+                    direction = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+            if direction is None:
+                break
+
+            try:
+                response = self.session.post(f"{self.api_url}/{direction}", timeout=REQUEST_TIMEOUT)
+                self.sent += 1
+                self._results.put((direction, response.ok, response.status_code))
+            except requests.RequestException as e:
+                self._results.put((direction, False, e.__class__.__name__))
+        self.session.close()
+
+    def _poll_results(self):
+        """
+        Tk thread: deliver finished results, then check again later.
+        """
+        self._after_id = None
+        if self._closed:
+            return
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if self.on_result and not self._closed:
+                self.on_result(*result)
+        if not self._closed:
+            self._after_id = self.widget.after(RESULT_POLL_MS, self._poll_results)
+
+
+def main():
+    """
+    Check that the Tk loop keeps running while the API stalls:
+    starts a fake API that takes 1.5 s per request, mashes buttons, and counts
+    how many 10 ms timer ticks the window still handled.
+    """
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from tkinter import Tk
+
+    class SlowApi(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            time.sleep(1.5)
+            body = b"{}"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    root = Tk()
+    results = []
+    dispatcher = CommandDispatcher(root, f"http://127.0.0.1:{server.server_port}",
+                                   on_result=lambda *r: results.append(r))
+    ticks = [0]
+
+    def tick():
+        ticks[0] += 1
+        root.after(10, tick)
+
+    presses = ["forward", "left", "right", "forward", "backward"] * 4
+    for i, direction in enumerate(presses):
+        root.after(20 * i, dispatcher.send, direction)
+    root.after(10, tick)
+    root.after(4000, root.quit)
+
+    start = time.perf_counter()
+    root.mainloop()
+    elapsed = time.perf_counter() - start
+    dispatcher.close()
+    server.shutdown()
+
+    print(f"UI ticks handled: {ticks[0]} in {elapsed:.1f} s (~{int(elapsed * 100)} possible)")
+    print(f"button presses: {len(presses)}, requests sent: {dispatcher.sent}, results: {results}")
+    # the window must keep ticking, and rapid presses must collapse into a few requests
+    return 0 if ticks[0] > elapsed * 100 * 0.8 and dispatcher.sent < len(presses) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
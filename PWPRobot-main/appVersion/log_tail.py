@@ -0,0 +1,96 @@
+import queue
+import threading
+from tkinter import *
+import requests
+
+# lines kept in the widget; older ones are trimmed off the top
+MAX_LOG_LINES = 500
+
+# seconds between polls when there is nothing new
+POLL_INTERVAL = 1.0
+
+# how often the Tk loop picks up fetched lines (ms)
+DRAW_INTERVAL_MS = 200
+
+
+class LogTail:
+    """
+    Live view of the server's event log. A background thread asks /log for the lines
+    after its cursor only, and the Tk loop appends them and trims the widget to
+    MAX_LOG_LINES, so memory and redraw cost stay the same however long it runs.
+
+    Parameters:
+    parent - Tk frame to draw in
+    api_url - base url of the API
+    max_lines - lines kept in the widget
+
+    Return:
+    None
+    """
+    def __init__(self, parent, api_url, max_lines=MAX_LOG_LINES):
+        self.parent = parent
+        self.url = f"{api_url}/log"
+        self.max_lines = max_lines
+        self.cursor = -1  # -1 = start with the newest lines
+        self.session = requests.Session()
+        self._lines = queue.Queue()
+
+        scrollbar = Scrollbar(parent)
+        scrollbar.pack(side="right", fill="y")
+        self.text = Text(parent, height=20, wrap="none", state="disabled", yscrollcommand=scrollbar.set)
+        self.text.pack(fill="both", expand=True, padx=5, pady=5)
+        scrollbar.config(command=self.text.yview)
+
+        self._stop = threading.Event()
+        threading.Thread(target=self._fetch_loop, daemon=True).start()
+        self.parent.after(DRAW_INTERVAL_MS, self._draw)
+
+    def _fetch_loop(self):
+        """
+        Background thread: fetch new lines since the cursor, right away again if the server has more.
+        """
+        while not self._stop.is_set():
+            more = False
+            try:
+                response = self.session.get(self.url, params={"cursor": self.cursor}, timeout=(1, 3))
+                response.raise_for_status()
+                data = response.json()
+                # only come straight back if the server actually moved on
+                more = data["more"] and data["cursor"] != self.cursor
+                self.cursor = data["cursor"]
+                if data["lines"]:
+                    self._lines.put(data["lines"])
+            except (requests.RequestException, ValueError, KeyError):
+                pass
+            if not more:
+                self._stop.wait(POLL_INTERVAL)
+        self.session.close()
+
+    def _draw(self):
+        """
+        Tk thread: append fetched lines and trim the widget back to max_lines
+        """
+        if self._stop.is_set():
+            return  # closed: the widget may already be destroyed
+        new_lines = []
+        while True:
+            try:
+                new_lines.extend(self._lines.get_nowait())
+            except queue.Empty:
+                break
+        if new_lines:
+            # only keep what will survive the trim anyway
+            new_lines = new_lines[-self.max_lines:]
+            at_bottom = self.text.yview()[1] >= 0.999
+            self.text.config(state="normal")
+            self.text.insert("end", "\n".join(new_lines) + "\n")
+            line_count = int(self.text.index("end-1c").split(".")[0]) - 1
+            if line_count > self.max_lines:
+                self.text.delete("1.0", f"{line_count - self.max_lines + 1}.0")
+            self.text.config(state="disabled")
+            if at_bottom:
+                self.text.see("end")
+        self.parent.after(DRAW_INTERVAL_MS, self._draw)
+
+    def close(self):
+        self._stop.set()
@@ -1,5 +1,7 @@
 from tkinter import *
-import requests
+from command_dispatcher import CommandDispatcher
+from video_pane import VideoPane
+from log_tail import LogTail
 
 api_url = "http://127.0.0.1:5000"
 
@@ -38,10 +40,56 @@ def open_robot_gui(username):
     Label(videoStream2, text="Video Stream 2", font=("Arial", 16)).pack(pady=5)
     Label(userLog, text="User Log", font=("Arial", 16)).pack(pady=5)
 
+    # live video: processed stream on top, raw camera below
+    videoPanes = [VideoPane(videoStream1, f"{api_url}/video_feed"),
+                  VideoPane(videoStream2, f"{api_url}/video_feed_raw")]
+
+    # everyone's logins and commands, fetched incrementally from /log
+    userLogTail = LogTail(userLog, api_url)
+
     controlPanel = Frame(controller)
     controlPanel.place(relx=0.5, rely=0.5, anchor="center")
     arrow_font = ("Arial", 28)
 
+    commandStatus = Label(controller, text="", font=("Arial", 12))
+    commandStatus.pack(side="bottom", pady=5)
+
+    def show_result(direction, ok, detail):
+        """
+        Show how the last command went (runs on the Tk thread)
+        
+        Parameters:
+        direction, ok, detail
+        
+        Return:
+        None
+        """
+        if ok:
+            commandStatus.config(text=f"{direction}: sent", fg="green")
+        else:
+            commandStatus.config(text=f"{direction}: failed ({detail})", fg="red")
+
+    # posts happen on a background thread so a slow API can't freeze the window
+    dispatcher = CommandDispatcher(robot_window, api_url, on_result=show_result)
+
+    def close_window():
+        """
+        Stop the dispatcher, video and log threads and close the window
+        
+        Parameters:
+        None
+        
+        Return:
+        None
+        """
+        dispatcher.close()
+        for pane in videoPanes:
+            pane.close()
+        userLogTail.close()
+        robot_window.destroy()
+
+    robot_window.protocol("WM_DELETE_WINDOW", close_window)
+
     def toggle_direction(direction):
         """
         Toggle the direction and update API
@@ -52,7 +100,7 @@ def open_robot_gui(username):
         Return:
         None
         """
-        response = requests.post(f"{api_url}/{direction}")
+        dispatcher.send(direction)
 
     
     upBtn = Button(controlPanel, text="↑", font=arrow_font, command=lambda: toggle_direction("forward"))
@@ -0,0 +1,269 @@
+import io
+import sys
+import threading
+import time
+from tkinter import *
+import requests
+
+try:
+    from PIL import Image, ImageTk
+except ImportError:  # video panes just show a hint without Pillow
+    Image = None
+    ImageTk = None
+
+# size the frames are drawn at inside a pane
+DISPLAY_SIZE = (480, 360)
+
+# never redraw faster than this, whatever the stream sends
+MAX_DISPLAY_FPS = 30
+
+# seconds to wait before reconnecting a dropped stream
+RECONNECT_DELAY = 1.0
+
+SOI = b"\xff\xd8"  # start of a jpeg
+EOI = b"\xff\xd9"  # end of a jpeg
+
+
+def newest_jpeg(buffer):
+    """
+    Find the newest complete jpeg in the bytes read so far.
+    Everything before it is backlog and gets thrown away.
+
+    Parameters:
+    buffer - bytearray of stream data (trimmed in place)
+
+    Return:
+    bytes of the newest complete jpeg, or None
+    """
+    newest = None
+    start = buffer.find(SOI)
+    while start != -1:
+        end = buffer.find(EOI, start + 2)
+        if end == -1:
+            break
+        newest = (start, end + 2)
+        start = buffer.find(SOI, end + 2)
+
+    if newest is None:
+        return None
+    jpeg = bytes(buffer[newest[0]:newest[1]])
+    del buffer[:newest[1]]
+    return jpeg
+
+
+def decode_jpeg(jpeg, size=DISPLAY_SIZE):
+    """
+    Decode a jpeg straight to the display size (draft() lets libjpeg scale while decoding).
+
+    Parameters:
+    jpeg - bytes
+    size - (width, height)
+
+    Return:
+    PIL image of exactly size
+    """
+    image = Image.open(io.BytesIO(jpeg))
+    image.draft("RGB", size)
+    image = image.convert("RGB")
+    if image.size != size:
+        image = image.resize(size)
+    return image
+
+
+class LatestFrameReader:
+    """
+    Background threads for one MJPEG url: one reads the stream and keeps only the
+    newest jpeg, the other decodes whichever jpeg is newest, at most MAX_DISPLAY_FPS
+    times a second. Frames that arrive in between are skipped, never queued.
+
+    Parameters:
+    url - MJPEG stream url (/video_feed or /video_feed_raw); None to call feed() yourself
+    session - optional requests.Session
+
+    Return:
+    None
+    """
+    def __init__(self, url=None, session=None):
+        self.url = url
+        self.session = session
+        self.received = 0
+        self.decoded = 0
+        self.image = None
+        self.image_seq = 0
+        self._jpeg = None
+        self._jpeg_seq = 0
+        self._cond = threading.Condition()
+        self._running = True
+
+        threading.Thread(target=self._decode_loop, daemon=True).start()
+        if url is not None:
+            if self.session is None:
+                self.session = requests.Session()
+            threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def feed(self, chunks):
+        """
+        Read stream chunks, publishing the newest complete jpeg after each one.
+
+        Parameters:
+        chunks - iterable of bytes
+
+        Return:
+        None
+        """
+        buffer = bytearray()
+        for chunk in chunks:
+            if not self._running:
+                return
+            buffer += chunk
+            jpeg = newest_jpeg(buffer)
+            if jpeg is not None:
+                with self._cond:
+                    self._jpeg = jpeg
+                    self._jpeg_seq += 1
+                    self.received += 1
+                    self._cond.notify()
+
+    def _read_loop(self):
+        while self._running:
+            try:
+                with self.session.get(self.url, stream=True, timeout=(2, 5)) as response:
+                    self.feed(response.iter_content(chunk_size=16384))
+            except requests.RequestException:
+                pass
+            time.sleep(RECONNECT_DELAY)
+
+    def _decode_loop(self):
+        last = 0
+        next_decode = 0.0
+        while self._running:
+            # no point decoding faster than the pane redraws
+            wait = next_decode - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            with self._cond:
+                while self._running and self._jpeg_seq == last:
+                    self._cond.wait(0.5)
+                jpeg, last = self._jpeg, self._jpeg_seq
+            if jpeg is None:
+                continue
+            next_decode = time.perf_counter() + 1.0 / MAX_DISPLAY_FPS
+            try:
+                image = decode_jpeg(jpeg)
+            except Exception:
+                continue  # a broken frame; the next one will do
+            self.image = image
+            self.image_seq = last
+            self.decoded += 1
+
+    def close(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify()
+        if self.session is not None:
+            self.session.close()
+
+
+class VideoPane:
+    """
+    Shows a live MJPEG stream inside a Tk frame. One PhotoImage is made up front
+    and every new frame is pasted into it; redraws are capped at MAX_DISPLAY_FPS.
+
+    Parameters:
+    parent - Tk frame to draw in
+    url - MJPEG stream url
+
+    Return:
+    None
+    """
+    def __init__(self, parent, url):
+        self.parent = parent
+        self.reader = None
+        self.drawn = 0
+        self._shown_seq = 0
+
+        if Image is None:
+            Label(parent, text="Install Pillow to see the video stream").pack(expand=True)
+            return
+
+        self.photo = ImageTk.PhotoImage("RGB", DISPLAY_SIZE)
+        self.label = Label(parent, image=self.photo)
+        self.label.pack(expand=True)
+        self.reader = LatestFrameReader(url)
+        self.parent.after(0, self._redraw)
+
+    def _redraw(self):
+        """
+        Paste the newest decoded frame into the PhotoImage, at most MAX_DISPLAY_FPS times a second
+        """
+        if self.reader is None:
+            return
+        if self.reader.image_seq != self._shown_seq:
+            self._shown_seq = self.reader.image_seq
+            self.photo.paste(self.reader.image)
+            self.drawn += 1
+        self.parent.after(int(1000 / MAX_DISPLAY_FPS), self._redraw)
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+def main():
+    """
+    Compare CPU time for a 100 fps stream: decoding every frame vs decoding only the newest.
+    """
+    seconds = 5
+    stream_fps = 100
+    frames = []
+    for i in range(10):
+        image = Image.new("RGB", (640, 480), (i * 20, 80, 160))
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=80)
+        frames.append(b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + out.getvalue() + b"\r\n")
+
+    def stream():
+        end = time.perf_counter() + seconds
+        i = 0
+        while time.perf_counter() < end:
+            yield frames[i % len(frames)]
+            i += 1
+            time.sleep(1 / stream_fps)
+
+    # naive: decode every frame at full size, one new image per frame
+    start = time.process_time()
+    buffer = bytearray()
+    naive = 0
+    for chunk in stream():
+        buffer += chunk
+        while True:
+            jpeg = newest_jpeg(buffer)
+            if jpeg is None:
+                break
+            Image.open(io.BytesIO(jpeg)).convert("RGB").resize(DISPLAY_SIZE)
+            naive += 1
+    naive_cpu = time.process_time() - start
+
+    # latest only: the reader's decode thread, sampled at the display rate
+    start = time.process_time()
+    reader = LatestFrameReader()
+    drawn = 0
+    shown = 0
+    feeder = threading.Thread(target=reader.feed, args=(stream(),))
+    feeder.start()
+    while feeder.is_alive():
+        if reader.image_seq != shown:
+            shown = reader.image_seq
+            drawn += 1
+        time.sleep(1 / MAX_DISPLAY_FPS)
+    reader.close()
+    latest_cpu = time.process_time() - start
+
+    print(f"decode every frame: {naive} decodes, {naive_cpu:.2f} s CPU")
+    print(f"decode newest only: {reader.decoded} decodes, {drawn} redraws, {latest_cpu:.2f} s CPU")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
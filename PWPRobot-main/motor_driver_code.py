@@ -29,7 +29,24 @@ MOTOR_SPEED = 75
 
 
 #api url
-API_STATUS_URL = "http://192.168.240.8:5000/status" 
+API_URL = "http://192.168.240.8:5000"
+
+#fleet mode: set this to the robot's id so it reads /robots/<id>/status (None = single robot)
+ROBOT_ID = None
+#fleet mode: the server's fleet token (PWP_FLEET_TOKEN on the server), needed to register
+ROBOT_TOKEN = None
+
+if ROBOT_ID:
+    API_STATUS_URL = f"{API_URL}/robots/{ROBOT_ID}/status"
+else:
+    API_STATUS_URL = f"{API_URL}/status"
+
+
+def register_robot():
+    #fleet mode: the server only knows robots that registered (again after every server restart)
+    response = requests.post(f"{API_URL}/robots/{ROBOT_ID}/register",
+                             headers={"X-Robot-Token": ROBOT_TOKEN or ""}, timeout=1)
+    response.raise_for_status()
 
 
 
@@ -50,8 +67,8 @@ class MotorDriver():
     None
     """
     def __init__(self):
-		"""
-		This is what creates all of the variables used for this class
+        """
+        This is what creates all of the variables used for this class
         
         Parameters:
         self
@@ -70,7 +87,7 @@ class MotorDriver():
 
     def MotorRun(self, motor_id, index, speed):
         """
-		This is the function that sends the power to the motor
+        This is the function that sends the power to the motor
         
         Parameters:
         self, motor_id, index, speed
@@ -129,8 +146,8 @@ class MotorDriver():
 
 
     def MotorStop(self, motor_id):
-		"""
-		Stops the motor from moving
+        """
+        Stops the motor from moving
         
         Parameters:
         Self, motor_id
@@ -204,7 +221,7 @@ current_state = 'stop'
 
 
 
-print("Raspberry Pi Motor Client Starting. \nConnecting to API...")
+print(f"Raspberry Pi Motor Client Starting (robot id: {ROBOT_ID}). \nConnecting to API...")
 
 while True:
 
@@ -214,24 +231,28 @@ while True:
 
         response = requests.get(API_STATUS_URL, timeout=1)
 
+        if ROBOT_ID and response.status_code == 404:
+            register_robot()
+            response = requests.get(API_STATUS_URL, timeout=1)
+
         response.raise_for_status()
 
         
 
-		#Store this new data into a variable
+        #Store this new data into a variable
         data=response.json()
         print(f"JSON Data: {data}")
 
         new_state = "stop"
 
 
-		#set new_state to new direction
+        #set new_state to new direction
         for direction in data:
                 if data[direction] == True:
 
                         new_state = direction
 
-		#Only change the motor function if the state is changed
+        #Only change the motor function if the state is changed
 
         if new_state != current_state:
 
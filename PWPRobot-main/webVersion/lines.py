@@ -1,3 +1,6 @@
+import sys
+import time
+from collections import namedtuple
 import cv2
 import numpy as np
 
@@ -14,6 +17,56 @@ def region_of_interest(img, vertices):
     masked_image = cv2.bitwise_and(img, mask)
     return masked_image
 
+class LaneROI:
+    """
+    Trapezoid region of interest for the lane lines, built once per frame size.
+    Keeps the mask only for the trapezoid's bounding box, so grayscale, Canny and
+    HoughLinesP run on that box (the top of the frame is never touched) and the
+    segments found are shifted back to full-frame coordinates.
+    Corners are fractions of the frame: (bottom left, top left, top right, bottom right) x, plus the top y.
+    """
+    def __init__(self, bottom_left=0.1, top_left=0.4, top_right=0.6, bottom_right=0.9, top=0.6):
+        self.fractions = (bottom_left, top_left, top_right, bottom_right, top)
+        self.shape = None
+
+    def _build(self, height, width):
+        bl, tl, tr, br, top = self.fractions
+        # Vertices (bottom left, top left, top right, bottom right)
+        self.vertices = np.array([[(width*bl, height), (width*tl, height*top), (width*tr, height*top), (width*br, height)]], dtype=np.int32)
+        x, y, w, h = cv2.boundingRect(self.vertices)
+        x, y = max(x, 0), max(y, 0)
+        w, h = min(w, width - x), min(h, height - y)
+        self.box = (x, y, w, h)
+        self.offset = np.array([x, y, x, y], dtype=np.int32)
+        self.mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(self.mask, self.vertices - np.array([x, y], dtype=np.int32), 255)
+        self.shape = (height, width)
+
+    def detect_segments(self, frame, canny_low=50, canny_high=150):
+        """
+        Finds lane line segments inside the trapezoid.
+        Returns (HoughLinesP array in full-frame coordinates or None, masked edges of the box).
+        """
+        if frame.shape[:2] != self.shape:
+            self._build(*frame.shape[:2])
+        x, y, w, h = self.box
+        gray = cv2.cvtColor(frame[y:y+h, x:x+w], cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(gray, canny_low, canny_high)
+        masked_edges = cv2.bitwise_and(edges, self.mask)
+        lines = cv2.HoughLinesP(masked_edges, 1, np.pi/180, 50, minLineLength=10, maxLineGap=50)
+        if lines is not None:
+            lines += self.offset
+        return lines, masked_edges
+
+    def full_frame(self, box_image):
+        """
+        Puts an image of the bounding box back in a full-size black frame (for display only).
+        """
+        full = np.zeros(self.shape + box_image.shape[2:], dtype=box_image.dtype)
+        x, y, w, h = self.box
+        full[y:y+h, x:x+w] = box_image
+        return full
+
 def make_points(image, line):
     """
     Extends the line segment to full lane line length based on slope/intercept.
@@ -29,26 +82,44 @@ def make_points(image, line):
     x2 = int((y2 - intercept) / slope)
     return [[x1, y1, x2, y2]]
 
+# segments flatter than MIN_ABS_SLOPE (|dy/dx|) are cracks/shadows, steeper than MAX_ABS_SLOPE count as vertical
+MIN_ABS_SLOPE = 0.3
+MAX_ABS_SLOPE = 10.0
+
+def _weighted_fit(slopes, intercepts, weights, keep):
+    """
+    Length-weighted average (slope, intercept) of the segments picked by keep.
+    """
+    if not keep.any():
+        return None
+    w = weights[keep]
+    return np.array([np.average(slopes[keep], weights=w),
+                     np.average(intercepts[keep], weights=w)])
+
 def average_slope_intercept(image, lines):
     """
     Averages the left and right lane lines to single solid lines.
+    All segments are handled in one NumPy pass over the (N,1,4) HoughLinesP array:
+    near-horizontal and vertical segments are dropped, a segment is left only if it
+    slopes left AND sits in the left half (same for right), and longer segments count more.
     """
-    left_fit = []
-    right_fit = []
-    if lines is None:
+    if lines is None or len(lines) == 0:
         return None, None
-    for line in lines:
-        x1, y1, x2, y2 = line.reshape(4)
-        parameters = np.polyfit((x1, x2), (y1, y2), 1)
-        slope = parameters[0]
-        intercept = parameters[1]
-        # Slope logic assumes image origin (0,0) is top-left
-        if slope < 0:
-            left_fit.append((slope, intercept))
-        else:
-            right_fit.append((slope, intercept))
-    left_fit_average = np.average(left_fit, axis=0) if left_fit else None
-    right_fit_average = np.average(right_fit, axis=0) if right_fit else None
+    x1, y1, x2, y2 = lines.reshape(-1, 4).astype(np.float64).T
+    dx = x2 - x1
+    dy = y2 - y1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = dy / dx
+        # vertical segments give inf - inf = nan here; keep drops them
+        intercepts = y1 - slopes * x1
+    keep = (dx != 0) & (np.abs(slopes) >= MIN_ABS_SLOPE) & (np.abs(slopes) <= MAX_ABS_SLOPE)
+    lengths = np.hypot(dx, dy)
+    mid_x = (x1 + x2) / 2
+    center_x = image.shape[1] / 2
+
+    # Slope logic assumes image origin (0,0) is top-left
+    left_fit_average = _weighted_fit(slopes, intercepts, lengths, keep & (slopes < 0) & (mid_x < center_x))
+    right_fit_average = _weighted_fit(slopes, intercepts, lengths, keep & (slopes > 0) & (mid_x > center_x))
     left_line = make_points(image, left_fit_average)
     right_line = make_points(image, right_fit_average)
     return left_line, right_line
@@ -81,57 +152,142 @@ def calculate_center_line_points(left_line, right_line):
 
     return [[mx1, my1, mx2, my2]]
 
-# Initialize video capture (use 0 for primary camera)
-cap = cv2.VideoCapture(0)
-if not cap.isOpened():
-    print("Error: Cannot open camera.")
-    # Create a black image if camera fails for demonstration purposes
-    frame = np.zeros((480, 640, 3), dtype=np.uint8)
-    # In a real scenario, you'd exit or use a static image/video file
-    # For now, we'll break after the first loop iteration
-    cap = None
-
-while cap:
-    ret, frame = cap.read()
-    if not ret:
-        print("Error: Cannot receive frame.")
-        break
-    
-    # --- IMAGE PROCESSING ---
-    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    edges = cv2.Canny(gray_frame, 50, 150)
-
-    # Define region of interest vertices (a trapezoid covering the road)
-    height, width = frame.shape[:2]
-    # Vertices (bottom left, top left, top right, bottom right)
-    vertices = np.array([[(width*0.1, height), (width*0.4, height*0.6), (width*0.6, height*0.6), (width*0.9, height)]], dtype=np.int32)
-    masked_edges = region_of_interest(edges, vertices)
-
-    # Use Hough lines
-    lines = cv2.HoughLinesP(masked_edges, 1, np.pi/180, 50, minLineLength=10, maxLineGap=50)
-
-    # Calculate averaged lane lines
-    left_line, right_line = average_slope_intercept(frame, lines)
-
-    # Create an overlay image for drawing lines
-    line_image = np.zeros_like(frame)
-    draw_lines(line_image, [left_line, right_line], color=(0, 255, 0), thickness=5)
-
-    # Calculate and draw center line
-    center_line = calculate_center_line_points(left_line, right_line)
-    draw_lines(line_image, [center_line], color=(0, 0, 255), thickness=3)
-
-    # Combine original image with the line image overlay
-    combo_image = cv2.addWeighted(frame, 0.8, line_image, 1, 1)
-
-    # --- DISPLAY ---
-    cv2.imshow('Lane and Center Line Detection', combo_image)
-    cv2.imshow('Masked Edges (Processing View)', masked_edges)
-
-    # Exit on 'q' press
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-if cap:
-    cap.release()
-cv2.destroyAllWindows()
+def benchmark_average_slope_intercept(segments=500, repeats=200):
+    """
+    Times average_slope_intercept on a busy frame (hundreds of Hough segments)
+    against the old per-segment np.polyfit loop.
+    """
+    rng = np.random.default_rng(0)
+    image = np.zeros((480, 640, 3), dtype=np.uint8)
+    x1 = rng.integers(0, 640, segments)
+    y1 = rng.integers(240, 480, segments)
+    x2 = x1 + rng.integers(-80, 80, segments)
+    y2 = y1 - rng.integers(5, 120, segments)
+    lines = np.stack([x1, y1, x2, y2], axis=1).reshape(-1, 1, 4).astype(np.int32)
+
+    def polyfit_loop(image, lines):
+        left_fit, right_fit = [], []
+        for line in lines:
+            x1, y1, x2, y2 = line.reshape(4)
+            if x1 == x2:
+                continue
+            slope, intercept = np.polyfit((x1, x2), (y1, y2), 1)
+            (left_fit if slope < 0 else right_fit).append((slope, intercept))
+        return (make_points(image, np.average(left_fit, axis=0) if left_fit else None),
+                make_points(image, np.average(right_fit, axis=0) if right_fit else None))
+
+    for name, fn in (("polyfit loop", polyfit_loop), ("vectorized", average_slope_intercept)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn(image, lines)
+        ms = (time.perf_counter() - start) / repeats * 1000
+        print(f"{name:>14}: {ms:.3f} ms per frame ({segments} segments)")
+
+# What LaneDetector gives back for each frame (lines are [[x1, y1, x2, y2]] or None)
+LaneResult = namedtuple("LaneResult", ["left", "right", "center", "segments", "masked_edges"])
+
+class LaneDetector:
+    """
+    Lane + center line detection on any frames, no camera or window needed.
+    detect() handles one frame; stream() takes any iterable of frames (camera,
+    video file, list of images) and yields a LaneResult per frame, lazily.
+    Showing the frames is optional: pass a sink such as DisplaySink to stream().
+    """
+    def __init__(self, roi=None, canny_low=50, canny_high=150):
+        self.roi = roi if roi is not None else LaneROI()
+        self.canny_low = canny_low
+        self.canny_high = canny_high
+
+    def detect(self, frame):
+        """
+        Runs the whole pipeline on one BGR frame and returns a LaneResult.
+        """
+        segments, masked_edges = self.roi.detect_segments(frame, self.canny_low, self.canny_high)
+        left_line, right_line = average_slope_intercept(frame, segments)
+        center_line = calculate_center_line_points(left_line, right_line)
+        return LaneResult(left_line, right_line, center_line, segments, masked_edges)
+
+    def stream(self, frames, sink=None):
+        """
+        Yields a LaneResult for each frame as it is pulled.
+        sink(frame, result) is called for every frame if given; returning False stops the stream.
+        """
+        for frame in frames:
+            result = self.detect(frame)
+            if sink is not None and sink(frame, result) is False:
+                return
+            yield result
+
+    def draw(self, frame, result):
+        """
+        Returns the frame with the lane lines (green) and center line (red) drawn over it.
+        """
+        # Create an overlay image for drawing lines
+        line_image = np.zeros_like(frame)
+        draw_lines(line_image, [result.left, result.right], color=(0, 255, 0), thickness=5)
+        draw_lines(line_image, [result.center], color=(0, 0, 255), thickness=3)
+        # Combine original image with the line image overlay
+        return cv2.addWeighted(frame, 0.8, line_image, 1, 1)
+
+class DisplaySink:
+    """
+    Sink for LaneDetector.stream() that shows the overlay and the masked edges; 'q' stops.
+    """
+    def __init__(self, detector):
+        self.detector = detector
+
+    def __call__(self, frame, result):
+        cv2.imshow('Lane and Center Line Detection', self.detector.draw(frame, result))
+        cv2.imshow('Masked Edges (Processing View)', self.detector.roi.full_frame(result.masked_edges))
+        # Exit on 'q' press
+        return not (cv2.waitKey(1) & 0xFF == ord('q'))
+
+    def close(self):
+        cv2.destroyAllWindows()
+
+def capture_frames(source=0):
+    """
+    Yields frames from a camera index or a video file path until it runs out.
+    """
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        print(f"Error: Cannot open {source}.")
+        return
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+def main():
+    """
+    Run lane detection on the camera (or a video file given as an argument).
+    --headless: no windows, just report the frame rate. --bench: time the segment averaging.
+    """
+    if "--bench" in sys.argv:
+        benchmark_average_slope_intercept()
+        return 0
+
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    # a number is a camera index; VideoCapture("1") would look for a file called 1
+    source = (int(args[0]) if args[0].isdigit() else args[0]) if args else 0
+    detector = LaneDetector()
+    sink = None if "--headless" in sys.argv else DisplaySink(detector)
+
+    frames = 0
+    start = time.perf_counter()
+    for result in detector.stream(capture_frames(source), sink):
+        frames += 1
+    elapsed = time.perf_counter() - start
+
+    if sink is not None:
+        sink.close()
+    if frames:
+        print(f"{frames} frames, {frames / elapsed:.1f} fps")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
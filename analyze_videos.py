@@ -0,0 +1,172 @@
+"""
+Offline Video Analysis
+v1.0.0
+1. Take one or more recorded videos and a detector name ("lanes" or "can")
+2. Split every video into chunks of frame ranges
+3. Run the chunks in a process pool; each worker opens the file itself, seeks
+   to its first frame and runs the detector headless (no windows)
+4. Time the detector on every frame
+5. Merge all chunk results back in file / frame order into one table
+6. Write the table as CSV (or Parquet if the output ends in .parquet and
+   pandas is installed), one column per field
+7. Print frames per second for every worker and for the whole run
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+# lines.py (LaneDetector) lives in the web version folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "PWPRobot-main", "webVersion"))
+
+LINE_FIELDS = ("x1", "y1", "x2", "y2")
+
+# columns each detector adds after file, frame, detect_ms, found
+DETECTOR_COLUMNS = {
+    "lanes": [f"{side}_{f}" for side in ("left", "right", "center") for f in LINE_FIELDS],
+    "can": ["cx", "cy", "radius"],
+}
+
+
+def make_detector(name):
+    """
+    Build a detector inside the worker process.
+
+    Parameters:
+    name : "lanes" or "can"
+
+    Return:
+    function frame -> tuple of values for DETECTOR_COLUMNS[name], or None if nothing found
+    """
+    if name == "lanes":
+        from lines import LaneDetector
+        detector = LaneDetector()
+
+        def detect_lanes(frame):
+            result = detector.detect(frame)
+            if result.left is None and result.right is None:
+                return None
+            values = []
+            for line in (result.left, result.right, result.center):
+                values.extend(line[0] if line is not None else [None] * 4)
+            return tuple(values)
+        return detect_lanes
+
+    if name == "can":
+        from movingCircle import find_can_bottom
+        return find_can_bottom
+
+    raise ValueError(f"unknown detector: {name}")
+
+
+def analyze_chunk(path, start, end, detector_name):
+    """
+    Run one detector over frames [start, end) of one video.
+
+    Parameters:
+    path : video file
+    start, end : frame range (end=None means until the file ends)
+    detector_name : key of DETECTOR_COLUMNS
+
+    Return:
+    dict with the rows, the worker pid, frames done and seconds spent
+    """
+    # one OpenCV thread per worker, the pool already uses every core
+    cv2.setNumThreads(1)
+    detect = make_detector(detector_name)
+    width = len(DETECTOR_COLUMNS[detector_name])
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video file: {path}")
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    rows = []
+    began = time.perf_counter()
+    frame_number = start
+    while end is None or frame_number < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        t0 = time.perf_counter()
+        found = detect(frame)
+        detect_ms = (time.perf_counter() - t0) * 1000
+        values = found if found is not None else (None,) * width
+        rows.append((path, frame_number, round(detect_ms, 3), found is not None) + tuple(values))
+        frame_number += 1
+    cap.release()
+
+    return {"rows": rows, "pid": os.getpid(), "frames": len(rows),
+            "seconds": time.perf_counter() - began}
+
+
+def split_video(path, chunk_frames):
+    """
+    Split a video into (start, end) frame ranges of chunk_frames each.
+    The last range is open ended in case the container's frame count is off.
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video file: {path}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    starts = list(range(0, max(total, 1), chunk_frames))
+    return [(s, starts[i + 1] if i + 1 < len(starts) else None) for i, s in enumerate(starts)]
+
+
+def write_table(output, columns, rows):
+    """
+    Write the merged rows as CSV, or Parquet when output ends in .parquet.
+    """
+    if output.endswith(".parquet"):
+        import pandas as pd
+        pd.DataFrame.from_records(rows, columns=columns).to_parquet(output, index=False)
+        return
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a detector over recorded videos on every core.")
+    parser.add_argument("videos", nargs="+", help="video files to analyze")
+    parser.add_argument("--detector", choices=sorted(DETECTOR_COLUMNS), default="lanes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-frames", type=int, default=300, help="frames per chunk")
+    parser.add_argument("--output", default="analysis.csv", help=".csv or .parquet")
+    args = parser.parse_args(argv)
+
+    jobs = [(path, start, end) for path in args.videos for start, end in split_video(path, args.chunk_frames)]
+    print(f"{len(args.videos)} video(s), {len(jobs)} chunks, {args.workers} workers, detector={args.detector}")
+
+    began = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # map() hands results back in submission order, so rows stay in file / frame order
+        results = list(pool.map(analyze_chunk,
+                                [j[0] for j in jobs], [j[1] for j in jobs], [j[2] for j in jobs],
+                                [args.detector] * len(jobs)))
+    elapsed = time.perf_counter() - began
+
+    columns = ["file", "frame", "detect_ms", "found"] + DETECTOR_COLUMNS[args.detector]
+    rows = [row for result in results for row in result["rows"]]
+    write_table(args.output, columns, rows)
+
+    per_worker = {}
+    for result in results:
+        frames, seconds = per_worker.get(result["pid"], (0, 0.0))
+        per_worker[result["pid"]] = (frames + result["frames"], seconds + result["seconds"])
+    for pid, (frames, seconds) in sorted(per_worker.items()):
+        print(f"worker {pid}: {frames} frames, {frames / seconds if seconds else 0:.1f} fps")
+    print(f"total: {len(rows)} frames in {elapsed:.1f} s, {len(rows) / elapsed if elapsed else 0:.1f} fps -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
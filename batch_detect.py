@@ -0,0 +1,262 @@
+"""
+Batch Can Detection
+v1.0.0
+1. Take a folder (or files) of inspection photos, a detector ("newCircle" or
+   "circle") and its engine
+2. On a thread pool (hashing, decoding and OpenCV all release the GIL), for
+   every photo:
+   a. read the file once and hash its bytes (SHA-256)
+   b. look the hash + detector + parameters up in the result cache; on a hit
+      we are done, the image is never decoded
+   c. on a miss decode the bytes, run the detector headless and store the result
+3. The cache is a small SQLite file; every hit refreshes an entry's last-used
+   time and the least recently used entries are evicted past max_entries
+4. Write one row per photo (CSV), optionally annotated copies of the photos,
+   and print how many were cached and how long the run took
+Changing CACHE_VERSION (or any parameter) makes old entries miss.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# bump when a detector's code changes in a way that changes its answers
+CACHE_VERSION = 1
+
+CACHE_FILE = "can_cache.db"
+CACHE_MAX_ENTRIES = 10000
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def _new_circle(image, engine="hough"):
+    from newCircle import find_can
+    return find_can(image, engine)
+
+
+def _soda_can(image, engine="hough"):
+    from circle import find_soda_can
+    return find_soda_can(image, engine)
+
+
+# detector name -> function(image, **params) -> (x, y, r) or None
+DETECTORS = {"newCircle": _new_circle, "circle": _soda_can}
+
+
+class ResultCache:
+    """
+    Detector results on disk, keyed by image content hash + detector + parameters.
+    Safe to share between threads. Keeps at most max_entries, dropping the least recently used.
+
+    Parameters:
+    path : SQLite file
+    max_entries : entries kept after each eviction
+
+    Return:
+    None
+    """
+    def __init__(self, path=CACHE_FILE, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY,
+            result TEXT,
+            last_used REAL
+        )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(digest, detector, params):
+        """
+        Cache key for one image hash under one detector configuration.
+        """
+        config = json.dumps({"v": CACHE_VERSION, "detector": detector, "params": params}, sort_keys=True)
+        return f"{digest}:{hashlib.sha256(config.encode()).hexdigest()[:16]}"
+
+    def get(self, key):
+        """
+        Return (True, result) on a hit (result may be None = no can), (False, None) on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM results WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return False, None
+            self._conn.execute("UPDATE results SET last_used=? WHERE key=?", (time.time(), key))
+            self.hits += 1
+            return True, json.loads(row[0])
+
+    def put(self, key, result):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO results (key, result, last_used) VALUES (?,?,?)",
+                               (key, json.dumps(result), time.time()))
+
+    def evict(self):
+        """
+        Drop the least recently used entries beyond max_entries.
+
+        Return:
+        number of entries removed
+        """
+        with self._lock:
+            removed = self._conn.execute("""
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )""", (self.max_entries,)).rowcount
+            self._conn.commit()
+            return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def list_images(paths):
+    """
+    Expand folders into the image files inside them (sorted); files are taken as given.
+    """
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            images.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                 if name.lower().endswith(IMAGE_EXTENSIONS)))
+        else:
+            images.append(path)
+    return images
+
+
+def detect_one(path, detector, params, cache=None):
+    """
+    Detect the can in one photo, through the cache if given.
+
+    Parameters:
+    path : image file
+    detector : key of DETECTORS
+    params : dict of keyword arguments for the detector
+    cache : ResultCache or None
+
+    Return:
+    dict: {"file", "sha256", "cached", "ms", "circle": [x, y, r] or None, "error": str or None}
+    """
+    t0 = time.perf_counter()
+    row = {"file": path, "sha256": None, "cached": False, "ms": None, "circle": None, "error": None}
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        row["sha256"] = hashlib.sha256(data).hexdigest()
+        key = ResultCache.key(row["sha256"], detector, params)
+        if cache is not None:
+            hit, result = cache.get(key)
+            if hit:
+                row.update(cached=True, circle=result, ms=round((time.perf_counter() - t0) * 1000, 3))
+                return row
+
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("not a readable image")
+        found = DETECTORS[detector](image, **params)
+        row["circle"] = None if found is None else [round(float(v), 2) for v in found]
+        if cache is not None:
+            cache.put(key, row["circle"])
+    except (OSError, ValueError, cv2.error) as e:
+        row["error"] = f"{e.__class__.__name__}: {e}"
+    row["ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    return row
+
+
+def detect_batch(paths, detector="newCircle", params=None, cache=None, workers=None):
+    """
+    Detect the can in many photos on a thread pool.
+
+    Parameters:
+    paths : image files
+    detector : key of DETECTORS
+    params : dict of keyword arguments for the detector
+    cache : ResultCache or None
+    workers : threads (default: one per core)
+
+    Return:
+    list of rows from detect_one, in the order of paths
+    """
+    params = params or {}
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        rows = list(pool.map(lambda path: detect_one(path, detector, params, cache), paths))
+    if cache is not None:
+        cache.evict()
+    return rows
+
+
+def annotate(row, folder):
+    """
+    Write a copy of the photo with the detected circle drawn on it.
+    """
+    image = cv2.imread(row["file"])
+    if image is None or row["circle"] is None:
+        return
+    cx, cy, r = (int(round(v)) for v in row["circle"])
+    cv2.circle(image, (cx, cy), r, (0, 255, 67), 7)
+    cv2.circle(image, (cx, cy), 4, (0, 255, 67), 5)
+    cv2.imwrite(os.path.join(folder, os.path.basename(row["file"])), image)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless can detection over a folder of photos, with a result cache.")
+    parser.add_argument("paths", nargs="+", help="image files or folders")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="newCircle")
+    parser.add_argument("--engine", choices=("hough", "ransac"), default="hough")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--cache", default=CACHE_FILE, help="SQLite cache file")
+    parser.add_argument("--max-entries", type=int, default=CACHE_MAX_ENTRIES)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", default="can_results.csv")
+    parser.add_argument("--annotate", metavar="FOLDER", help="also write photos with the circle drawn")
+    args = parser.parse_args(argv)
+
+    paths = list_images(args.paths)
+    cache = None if args.no_cache else ResultCache(args.cache, args.max_entries)
+
+    start = time.perf_counter()
+    rows = detect_batch(paths, args.detector, {"engine": args.engine}, cache, args.workers)
+    elapsed = time.perf_counter() - start
+
+    with open(args.output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file", "sha256", "cached", "ms", "cx", "cy", "radius", "error"])
+        for row in rows:
+            writer.writerow([row["file"], row["sha256"], row["cached"], row["ms"]]
+                            + (row["circle"] or [None] * 3) + [row["error"]])
+
+    if args.annotate:
+        os.makedirs(args.annotate, exist_ok=True)
+        for row in rows:
+            annotate(row, args.annotate)
+
+    cached = sum(row["cached"] for row in rows)
+    found = sum(row["circle"] is not None for row in rows)
+    errors = sum(row["error"] is not None for row in rows)
+    print(f"{len(rows)} images ({cached} from cache), {found} cans found, {errors} errors "
+          f"in {elapsed:.2f} s -> {args.output}")
+    if cache is not None:
+        cache.close()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""
+Detector Benchmark
+v1.0.0
+1. Generate synthetic scenes with known answers (synthetic.py) under every
+   condition in synthetic.CONDITIONS (clean, noise, blur, glare, motion, hard)
+2. Run every detector over the scene it is made for:
+   still can images   -> circle.find_soda_can, newCircle.find_can (hough / ransac)
+   rolling can video  -> movingCircle.find_can_bottom (hough / ransac), movingCircle.CanTracker
+   lane video         -> lanes.detect_lanes (curvedLine's fitter), lines.LaneDetector
+3. Time each call (mean / median / p95 ms per frame), then run a few frames
+   again under tracemalloc for the peak memory allocated per frame
+4. Score each result against the truth: center and radius error for circles,
+   mean horizontal line error for lanes, and a hit rate (found and within
+   tolerance)
+5. Save everything as JSON (with the git commit) and, given an older result
+   file, print the changes and fail if a detector got slower or less accurate
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+import synthetic
+
+# lines.py (LaneDetector) lives in the web version folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "PWPRobot-main", "webVersion"))
+
+# a detection counts as a hit within these errors (px)
+CENTER_TOLERANCE = 5.0
+RADIUS_TOLERANCE = 5.0
+LANE_TOLERANCE = 10.0
+
+# frames run under tracemalloc for the memory figure
+MEMORY_FRAMES = 3
+
+# --compare fails when the median time grows by more than this fraction or the hit rate drops by more than this
+SLOWER_LIMIT = 0.2
+HIT_RATE_DROP_LIMIT = 0.05
+
+
+def _circle_detector(find):
+    # every circle detector answers (cx, cy, r) or None
+    def detect(frame, index):
+        return find(frame)
+    return detect
+
+
+def make_detectors():
+    """
+    Build every detector as detect(frame, frame_index) -> result, keyed by name.
+
+    Return:
+    dict name -> (scene, factory); factory() makes a fresh (possibly stateful) detector
+    """
+    def soda_can(engine):
+        from circle import find_soda_can
+        return _circle_detector(lambda frame: find_soda_can(frame, engine))
+
+    def new_circle(engine):
+        from newCircle import find_can
+        return _circle_detector(lambda frame: find_can(frame, engine))
+
+    def moving(engine):
+        from movingCircle import find_can_bottom
+        return _circle_detector(lambda frame: find_can_bottom(frame, engine=engine))
+
+    def tracker():
+        from movingCircle import CanTracker
+        can_tracker = CanTracker()
+        return can_tracker.detect
+
+    def curved_lanes():
+        import lanes
+        sides = {lanes.LEFT_COLOR: "left", lanes.RIGHT_COLOR: "right", lanes.CENTER_COLOR: "center"}
+
+        def detect(frame, index):
+            found = {side: None for side in sides.values()}
+            for p1, p2, color in lanes.detect_lanes(frame):
+                found[sides[color]] = (p1, p2)
+            return found
+        return detect
+
+    def lane_detector():
+        from lines import LaneDetector
+        detector = LaneDetector()
+
+        def detect(frame, index):
+            result = detector.detect(frame)
+            found = {}
+            for side in ("left", "right", "center"):
+                line = getattr(result, side)
+                found[side] = None if line is None else (tuple(line[0][:2]), tuple(line[0][2:]))
+            return found
+        return detect
+
+    return {
+        "circle.find_soda_can": ("can_image", lambda: soda_can("hough")),
+        "circle.find_soda_can[ransac]": ("can_image", lambda: soda_can("ransac")),
+        "newCircle.find_can": ("can_image", lambda: new_circle("hough")),
+        "newCircle.find_can[ransac]": ("can_image", lambda: new_circle("ransac")),
+        "movingCircle.find_can_bottom": ("can_video", lambda: moving("hough")),
+        "movingCircle.find_can_bottom[ransac]": ("can_video", lambda: moving("ransac")),
+        "movingCircle.CanTracker": ("can_video", tracker),
+        "lanes.detect_lanes": ("lanes_video", curved_lanes),
+        "lines.LaneDetector": ("lanes_video", lane_detector),
+    }
+
+
+def make_scene(scene, frames, seed, trouble):
+    """
+    Generate the frames and truth for one scene under one condition (same seed = same frames).
+
+    Return:
+    list of (frame, truth)
+    """
+    rng = np.random.default_rng(seed)
+    if scene == "can_image":
+        return [synthetic.can_image(rng, **trouble) for _ in range(frames)]
+    if scene == "can_video":
+        return list(synthetic.can_frames(rng, frames, **trouble))
+    if scene == "lanes_video":
+        return list(synthetic.lane_frames(rng, frames, **trouble))
+    raise ValueError(f"unknown scene: {scene}")
+
+
+def score(scene, results, samples):
+    """
+    Compare detector results with the truth.
+
+    Return:
+    dict of accuracy figures
+    """
+    found = hits = 0
+    if scene in ("can_image", "can_video"):
+        center_err, radius_err = [], []
+        for result, (_, (cx, cy, r)) in zip(results, samples):
+            if result is None:
+                continue
+            found += 1
+            ce = float(np.hypot(result[0] - cx, result[1] - cy))
+            re = abs(float(result[2]) - r)
+            center_err.append(ce)
+            radius_err.append(re)
+            hits += ce <= CENTER_TOLERANCE and re <= RADIUS_TOLERANCE
+        return {"found_rate": found / len(samples), "hit_rate": hits / len(samples),
+                "center_err_px": float(np.median(center_err)) if center_err else None,
+                "radius_err_px": float(np.median(radius_err)) if radius_err else None}
+
+    errors = {"left": [], "right": [], "center": []}
+    for result, (_, truth) in zip(results, samples):
+        frame_errors = {side: synthetic.line_x_error(result[side], truth[side]) for side in errors}
+        if frame_errors["left"] is not None and frame_errors["right"] is not None:
+            found += 1
+            hits += frame_errors["left"] <= LANE_TOLERANCE and frame_errors["right"] <= LANE_TOLERANCE
+        for side, error in frame_errors.items():
+            if error is not None:
+                errors[side].append(error)
+    scores = {"found_rate": found / len(samples), "hit_rate": hits / len(samples)}
+    for side, values in errors.items():
+        scores[f"{side}_err_px"] = float(np.median(values)) if values else None
+    return scores
+
+
+def run_one(factory, scene, samples):
+    """
+    Time one detector over the samples, measure its memory, and score it.
+
+    Return:
+    dict with timing, memory and accuracy figures
+    """
+    detect = factory()
+    results = []
+    times = []
+    for index, (frame, _) in enumerate(samples):
+        t0 = time.perf_counter()
+        results.append(detect(frame, index))
+        times.append((time.perf_counter() - t0) * 1000)
+
+    # memory on a fresh detector, so state kept from the timing run is not counted as free
+    detect = factory()
+    tracemalloc.start()
+    peak = 0
+    for index, (frame, _) in enumerate(samples[:MEMORY_FRAMES]):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        detect(frame, index)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    times = np.array(times)
+    row = {"frames": len(samples),
+           "ms_mean": round(float(times.mean()), 3),
+           "ms_p50": round(float(np.percentile(times, 50)), 3),
+           "ms_p95": round(float(np.percentile(times, 95)), 3),
+           "peak_kb": round(peak / 1024, 1)}
+    for key, value in score(scene, results, samples).items():
+        row[key] = None if value is None else round(value, 3)
+    return row
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(old, new):
+    """
+    Print what changed against an older result file and list the regressions.
+
+    Return:
+    list of regression messages (empty = no regressions)
+    """
+    before = {(r["detector"], r["condition"]): r for r in old["results"]}
+    regressions = []
+    print(f"\ncompared with {old.get('commit')} ({old.get('created')}):")
+    for row in new["results"]:
+        key = (row["detector"], row["condition"])
+        if key not in before:
+            continue
+        prev = before[key]
+        slower = (row["ms_p50"] - prev["ms_p50"]) / max(prev["ms_p50"], 1e-6)
+        hit_drop = prev["hit_rate"] - row["hit_rate"]
+        print(f"{row['detector']:>38} {row['condition']:>7}: {slower:+7.1%} time, hit rate "
+              f"{prev['hit_rate']:.0%} -> {row['hit_rate']:.0%}")
+        if slower > SLOWER_LIMIT:
+            regressions.append(f"{key[0]} ({key[1]}) is {slower:.0%} slower")
+        if hit_drop > HIT_RATE_DROP_LIMIT:
+            regressions.append(f"{key[0]} ({key[1]}) hit rate dropped by {hit_drop:.0%}")
+    return regressions
+
+
+def main(argv=None):
+    detectors = make_detectors()
+    parser = argparse.ArgumentParser(description="Speed, memory and accuracy of every detector on synthetic scenes.")
+    parser.add_argument("--frames", type=int, default=30, help="frames per detector and condition")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--detectors", default=",".join(detectors), help="comma separated names")
+    parser.add_argument("--conditions", default=",".join(synthetic.CONDITIONS), help="comma separated names")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", help="older result file; exit 1 if anything regressed")
+    args = parser.parse_args(argv)
+
+    names = [n for n in args.detectors.split(",") if n]
+    conditions = [c for c in args.conditions.split(",") if c]
+    for name in names:
+        if name not in detectors:
+            parser.error(f"unknown detector {name} (choose from {', '.join(detectors)})")
+    for condition in conditions:
+        if condition not in synthetic.CONDITIONS:
+            parser.error(f"unknown condition {condition} (choose from {', '.join(synthetic.CONDITIONS)})")
+
+    rows = []
+    scenes = {}
+    print(f"{'detector':>38} {'cond':>7} {'ms p50':>8} {'ms p95':>8} {'peak KB':>9} {'found':>6} {'hit':>6}  error px")
+    for condition in conditions:
+        for name in names:
+            scene, factory = detectors[name]
+            key = (scene, condition)
+            if key not in scenes:
+                scenes[key] = make_scene(scene, args.frames, args.seed, synthetic.CONDITIONS[condition])
+            row = {"detector": name, "condition": condition, "scene": scene}
+            row.update(run_one(factory, scene, scenes[key]))
+            rows.append(row)
+            errors = ", ".join(f"{k[:-7]}={v}" for k, v in row.items() if k.endswith("_err_px"))
+            print(f"{name:>38} {condition:>7} {row['ms_p50']:>8.2f} {row['ms_p95']:>8.2f} {row['peak_kb']:>9.1f} "
+                  f"{row['found_rate']:>6.0%} {row['hit_rate']:>6.0%}  {errors}")
+
+    report = {"commit": git_commit(), "created": datetime.now().isoformat(timespec="seconds"),
+              "frames": args.frames, "seed": args.seed, "results": rows}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"-> {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report)
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
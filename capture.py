@@ -0,0 +1,289 @@
+"""
+Frame Capture
+v1.0.1
+1. A frame source gives (jpeg, image) per read: the frame as FRAME_W x
+   FRAME_H JPEG bytes or as a decoded BGR image. The vision loop makes the
+   other one when it needs it: encode_frame() (resize + encode) for the raw
+   stream, decode_jpeg() only for frames the detectors process
+2. CameraSource asks the camera for MJPEG (FOURCC "MJPG") and turns off
+   OpenCV's conversion (CAP_PROP_CONVERT_RGB = 0), so read() hands back the
+   camera's compressed bytes. If they are a JPEG of the right size they go
+   to the raw stream untouched (passthrough) and the vision loop decodes
+   them once for the detectors; no resize, no re-encode
+3. If the camera sends something else (raw YUYV, or MJPEG at another size)
+   it falls back to decoded frames, like before: conversion is only turned
+   off once the camera reports MJPG back, and turned on again as soon as a
+   frame turns out not to be a JPEG
+4. FileSource replays an .mjpeg file (JPEGs back to back, what recorder.py
+   writes) at a fixed fps, as compressed frames or as decoded ones (a camera
+   without MJPEG); used for tests and for the CPU comparison
+5. Running this file directly measures CPU per frame for the raw stream +
+   detector input, passthrough vs decode / resize / re-encode
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from frame_history import jpeg_size
+
+CAMERA_INDEX = 0
+FRAME_W = 640
+FRAME_H = 480
+
+# ask the camera for MJPEG and pass its JPEGs through to the raw stream
+CAMERA_MJPEG = True
+
+JPEG_START = b"\xff\xd8"
+JPEG_END = b"\xff\xd9"
+
+
+def split_mjpeg(data):
+    """
+    Split JPEGs stored back to back into a list of frames.
+    (0xFF in the compressed data is always stuffed, so the end marker only appears at the end
+    of a frame; OpenCV-encoded frames carry no thumbnails that could contain one.)
+
+    Parameters:
+    data : bytes of the .mjpeg file
+
+    Return:
+    list of bytes, one per frame
+    """
+    frames = []
+    start = data.find(JPEG_START)
+    while start != -1:
+        end = data.find(JPEG_END, start + 2)
+        if end == -1:
+            break
+        frames.append(data[start:end + 2])
+        start = data.find(JPEG_START, end + 2)
+    return frames
+
+
+class CameraSource:
+    """
+    The robot's camera, preferring its compressed MJPEG frames.
+
+    Parameters:
+    index : camera index
+    width, height : frame size asked for (and sent on)
+    mjpeg : try MJPEG passthrough
+
+    Return:
+    None
+    """
+    def __init__(self, index=CAMERA_INDEX, width=FRAME_W, height=FRAME_H, mjpeg=CAMERA_MJPEG):
+        import cv2
+        self.cv2 = cv2
+        self.size = (width, height)
+        self.cap = cv2.VideoCapture(index)
+        fourcc = cv2.VideoWriter_fourcc(*"MJPG")
+        if mjpeg:
+            self.cap.set(cv2.CAP_PROP_FOURCC, fourcc)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        # the loop is paced (vision.FrameGovernor): keep only the newest frame queued, not stale ones
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        # without conversion the V4L2 backend returns the buffer as it came (one row of bytes for MJPEG);
+        # only when the camera really switched to MJPEG, a YUYV buffer is of no use to anything
+        self.compressed = (mjpeg and int(self.cap.get(cv2.CAP_PROP_FOURCC)) == fourcc
+                           and self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0))
+        self.passthrough = None  # decided on the first frame
+        self.passed = 0
+        self.decoded = 0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        """
+        Grab one frame.
+
+        Return:
+        tuple: (jpeg bytes or None, image or None); (None, None) if nothing was grabbed
+        """
+        ret, frame = self.cap.read()
+        if not ret or frame is None:
+            return None, None
+        if self.compressed and (frame.ndim == 1 or frame.shape[0] == 1):
+            data = frame.tobytes()
+            if self.passthrough is None:
+                self.passthrough = jpeg_size(data) == self.size
+                print(f"camera sends MJPEG {jpeg_size(data)}: raw stream "
+                      f"{'passed through' if self.passthrough else 'decoded and re-encoded'}")
+            if self.passthrough:
+                self.passed += 1
+                return data, None
+            # JPEG at another size: decode here, the loop resizes and re-encodes
+            self.decoded += 1
+            return None, self.cv2.imdecode(frame.reshape(-1), self.cv2.IMREAD_COLOR)
+        if self.compressed:
+            # not a JPEG after all: turn the conversion back on, and grab again unless the
+            # backend already decoded it to BGR (a raw YUYV buffer has 2 channels)
+            self.compressed = False
+            self.cap.set(self.cv2.CAP_PROP_CONVERT_RGB, 1)
+            if frame.ndim != 3 or frame.shape[2] != 3:
+                return self.read()
+        self.passthrough = False
+        self.decoded += 1
+        return None, frame
+
+    def stats(self):
+        return {"source": "camera", "passthrough": bool(self.passthrough),
+                "passed_through": self.passed, "decoded": self.decoded}
+
+    def release(self):
+        self.cap.release()
+
+
+class FileSource:
+    """
+    Stand-in camera: replays an .mjpeg file in a loop.
+
+    Parameters:
+    path : .mjpeg file (JPEGs back to back)
+    fps : replay rate (None = as fast as read() is called)
+    decoded : hand out decoded images instead of the JPEGs, like a camera without MJPEG
+    loop : start over at the end (False = read() returns (None, None) from then on)
+
+    Return:
+    None
+    """
+    def __init__(self, path, fps=30.0, decoded=False, loop=True):
+        with open(path, "rb") as f:
+            self.frames = split_mjpeg(f.read())
+        if not self.frames:
+            raise ValueError(f"no JPEG frames in {path}")
+        self.fps = fps
+        self.decoded = decoded
+        self.loop = loop
+        self.passthrough = not decoded
+        self.index = 0
+        self._next = None
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        if self.index >= len(self.frames):
+            if not self.loop:
+                return None, None
+            self.index = 0
+        if self.fps:
+            now = time.perf_counter()
+            self._next = now if self._next is None else self._next + 1 / self.fps
+            if self._next > now:
+                time.sleep(self._next - now)
+        data = self.frames[self.index]
+        self.index += 1
+        if not self.decoded:
+            return data, None
+        return None, decode_jpeg(data)
+
+    def stats(self):
+        return {"source": "file", "passthrough": self.passthrough, "frames": len(self.frames)}
+
+    def release(self):
+        pass
+
+
+def open_source(source=None):
+    """
+    The frame source for the vision loop: the camera, or an .mjpeg file to replay.
+
+    Parameters:
+    source : None / camera index for the camera, a path to an .mjpeg file, or a source
+             object (anything with read() and isOpened(), e.g. a FileSource with its own fps),
+             which is used as it is
+
+    Return:
+    CameraSource, FileSource or the given source
+    """
+    if hasattr(source, "read") and hasattr(source, "isOpened"):
+        return source
+    if isinstance(source, str) and not source.isdigit():
+        return FileSource(source)
+    return CameraSource(CAMERA_INDEX if source is None else int(source))
+
+
+def decode_jpeg(jpeg):
+    """
+    Decode a passed-through JPEG for the detectors (only frames they actually process).
+
+    Return:
+    BGR image, or None if the bytes are not a readable JPEG
+    """
+    import cv2
+    import numpy as np
+    return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def encode_frame(image):
+    """
+    Without passthrough: bring a decoded frame to FRAME_W x FRAME_H and encode it for the raw stream.
+
+    Return:
+    tuple: (jpeg bytes or None, resized image)
+    """
+    import cv2
+    # ensure frame is expected size (some cameras ignore set())
+    image = cv2.resize(image, (FRAME_W, FRAME_H))
+    ret, encoded = cv2.imencode('.jpg', image)
+    return (encoded.tobytes() if ret else None), image
+
+
+def write_test_clip(path, frames=120, seed=0):
+    """
+    Write an .mjpeg file of synthetic lane frames (synthetic.py) to replay.
+    """
+    import cv2
+    import numpy as np
+    from synthetic import lane_frames
+    rng = np.random.default_rng(seed)
+    with open(path, "wb") as f:
+        for image, _ in lane_frames(rng, frames):
+            f.write(cv2.imencode('.jpg', image)[1].tobytes())
+
+
+def main(argv=None):
+    """
+    CPU per frame to produce the raw-stream JPEG + the detector image, with the camera's
+    JPEGs passed through vs a camera that hands out decoded frames (decode happens in the
+    source there, as the camera driver would do it; it is counted too).
+    """
+    parser = argparse.ArgumentParser(description="Measure the CPU saved by MJPEG passthrough.")
+    parser.add_argument("clip", nargs="?", help=".mjpeg file to replay (default: synthetic lane frames)")
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args(argv)
+
+    path = args.clip
+    if path is None:
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), "lanes.mjpeg")
+        write_test_clip(path)
+
+    results = {}
+    for name, decoded in (("passthrough", False), ("re-encode", True)):
+        source = FileSource(path, fps=None, decoded=decoded)
+        cpu = time.process_time()
+        for _ in range(args.frames):
+            jpeg, image = source.read()
+            if image is None:
+                image = decode_jpeg(jpeg)
+            else:
+                jpeg, image = encode_frame(image)
+            assert jpeg is not None and image is not None
+        results[name] = (time.process_time() - cpu) / args.frames * 1000
+
+    saved = results["re-encode"] - results["passthrough"]
+    for name, ms in results.items():
+        print(f"{name:12s} {ms:6.2f} ms CPU per frame")
+    print(f"passthrough saves {saved:.2f} ms CPU per frame "
+          f"({saved / results['re-encode'] * 100:.0f}%, {saved * 30 / 10:.1f}% of a core at 30 fps)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
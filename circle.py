@@ -1,87 +1,100 @@
 """
 Circle Detection
-v1.0.0
+v1.2.0
 --- PSEUDOCODE ---
 1. Import necessary libraries: OpenCV and NumPy.
-2. Define the path to the image file.
+2. Take the path to the image file from the command line (soda_can.jpeg next to this script if none).
 3. Load the image from the specified path.
 4. Check if the image was loaded successfully; exit if not found.
-5. Resize the image to a consistent maximum dimension (800 pixels) to standardize Hough Circle parameters across different input images.
-6. Create a copy of the original image to draw the results on.
-7. Pre-process the image for circle detection:
-    a. Convert the image to grayscale.
-    b. Apply a heavy median blur to reduce noise, suppress small details (like a pull-tab), and smooth the metallic surface.
-8. Use the Hough Circle Transform (HoughCircles) to detect potential circles:
-    a. Use the HOUGH_GRADIENT method.
-    b. Define strict parameters for 'minDist', 'minRadius', and 'maxRadius' to specifically target only the large outer edge of the can.
-    c. Use Canny edge threshold (param1) and accumulator threshold (param2) suitable for the pre-processed image.
-9. Check if any circles were detected:
-    a. If circles are found:
-        i. Convert the circle parameters (x, y, radius) to integers.
-        ii. Sort the detected circles by radius in descending order.
-        iii. Select the largest detected circle (the first entry after sorting).
-        iv. Draw the selected circle's circumference in green and its center in red on the output image.
-        v. Print the detected center coordinates and radius.
-    b. If no circles are found:
+5. Make a copy of the image resized to a maximum dimension of 800 pixels to draw the results on.
+6. Convert the full-resolution image to grayscale.
+7. Detect the can with find_soda_can -> detect_circle (circle_detect.py); the default "hough" engine works coarse-to-fine
+   ("ransac" instead fits circles straight to the Canny edge points):
+    a. Shrink the image to a ~200 px pyramid level and apply a median blur there to suppress small details (like a pull-tab) and the metallic surface.
+    b. Run HoughCircles (HOUGH_GRADIENT) on that level with strict 'minDist', 'minRadius' and 'maxRadius' (relative to image size) to target only the large outer edge of the can.
+    c. Take the largest candidate and refine its center and radius on small full-resolution patches along its edge.
+8. Check if a circle was detected:
+    a. If a circle is found:
+        i. Scale it to the display image.
+        ii. Draw the circle's circumference in green and its center in red on the output image.
+        iii. Print the detected center coordinates and radius.
+    b. If no circle is found:
         i. Print an error message suggesting a parameter adjustment.
-10. Display the image with the drawn circle until a key is pressed.
-11. Close all OpenCV windows.
+9. Display the image with the drawn circle until a key is pressed.
+10. Close all OpenCV windows.
+find_soda_can() needs no window, so benchmark.py (and anything else) can import it.
 """
 
+import os
+import sys
 import cv2
-import numpy as np
+from circle_detect import detect_circle
 
 # --- COMMENTED CODE ---
-# Define the path to the input image
-path = '/Users/pl1021319/Documents/circle/soda_can.jpeg'
+# Default input image: the fixture next to this script
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'soda_can.jpeg')
 
-# Load the image from the specified file path
-img = cv2.imread(path)
+# Circle engine: "hough" (coarse-to-fine HoughCircles) or "ransac" (fit to edge points)
+ENGINE = 'hough'
 
-# Check if the image variable is empty (meaning the file was not found)
-if img is None:
-    print(f"Error: Image not found at {path}")
-else:
-    # 1. Resize for consistent parameter behavior across different image resolutions
-    height, width = img.shape[:2]
-    max_dim = 800
-    # Calculate the scaling factor to ensure the largest dimension fits within max_dim
-    scale = max_dim / max(height, width)
-    # Resize the image using the calculated scale
-    img = cv2.resize(img, (int(width * scale), int(height * scale)))
 
-    # Create a copy of the resized image to draw detection results on
-    output = img.copy()
+def find_soda_can(img, engine=ENGINE):
+    """
+    Find the big outer circumference of the can in a BGR image (no drawing, no windows).
+
+    Parameters:
+    img : BGR image at full resolution
+    engine : "hough" or "ransac"
 
-    # 2. Advanced Pre-processing for Metal Surfaces
-    # Convert the image from BGR (OpenCV default) to grayscale for edge detection
+    Return:
+    (x, y, r) as floats in full-resolution pixels, or None
+    """
+    height, width = img.shape[:2]
+
+    # Pre-processing: convert the image from BGR (OpenCV default) to grayscale.
+    # No full-size blur: the coarse pyramid level is median blurred inside detect_circle_pyramid,
+    # which suppresses pull-tabs, text and glare on the metal at a fraction of the cost.
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    # Apply a heavy median blur (11x11 kernel) to suppress high-frequency noise,
-    # small details (like pull-tabs or text), and smooth the reflective metallic surface.
-    blurred = cv2.medianBlur(gray, 11)
-
-    # 3. Detect ONLY the big circumference using the Hough Gradient method
-    circles = cv2.HoughCircles(
-        blurred,              # Input image (grayscale and blurred)
-        cv2.HOUGH_GRADIENT,   # Detection method
-        dp=1.2,               # Inverse ratio of the accumulator resolution to the image resolution (1 is same res, 2 is half)
-        minDist=int(max_dim / 2),  # Minimum distance between the centers of detected circles (prevents multiple detections of the same can)
-        param1=50,            # Canny edge detection upper threshold (lower threshold is half of this)
-        param2=40,            # Accumulator threshold for the circle centers (lower values detect more circles, higher values detect fewer but 'better' ones)
-        minRadius=int(max_dim * 0.25),  # Minimum radius in pixels (must be at least 25% of image size)
-        maxRadius=int(max_dim * 0.5)    # Maximum radius in pixels (no larger than 50% of image size)
+
+    # Detect ONLY the big circumference, with the chosen engine:
+    # "hough" = HoughCircles on a ~200 px pyramid level, then refinement on small full-resolution patches
+    # "ransac" = RANSAC + least-squares circle fit on the Canny edge points
+    full_dim = max(height, width)
+    return detect_circle(
+        gray,
+        min_radius=int(full_dim * 0.25),  # Minimum radius (at least 25% of image size)
+        max_radius=int(full_dim * 0.5),   # Maximum radius (no larger than 50% of image size)
+        engine=engine,                    # Which circle engine to use
+        min_dist=int(full_dim / 2),       # Minimum distance between centers (one can per image)
+        param1=50,                        # Canny edge detection upper threshold (lower threshold is half of this)
+        param2=40                         # Accumulator threshold for the circle centers
     )
 
-    # 4. Process the detection results
-    if circles is not None:
-        # Convert the floating point circle parameters (x, y, radius) to unsigned 16-bit integers
-        circles = np.uint16(np.around(circles))
 
-        # Sort detected circles by radius in descending order to prioritize the largest one
-        circles_sorted = sorted(circles[0, :], key=lambda x: x[2], reverse=True)
+def show_soda_can(path, engine=ENGINE):
+    # Load the image from the specified file path
+    img = cv2.imread(path)
 
-        # Unpack the parameters of the largest circle
-        x, y, r = circles_sorted[0]
+    # Check if the image variable is empty (meaning the file was not found)
+    if img is None:
+        print(f"Error: Image not found at {path}")
+        return 1
+
+    # 1. Keep the full-resolution image for detection, and a copy resized to max_dim for display
+    height, width = img.shape[:2]
+    max_dim = 800
+    # Calculate the scaling factor to ensure the largest dimension fits within max_dim
+    scale = max_dim / max(height, width)
+    # Create a resized copy of the image to draw detection results on
+    output = cv2.resize(img, (int(width * scale), int(height * scale)))
+
+    # 2. Detect the can on the full-resolution image
+    circle = find_soda_can(img, engine)
+
+    # 3. Process the detection result
+    if circle is not None:
+        # Scale the full-resolution circle down to the display image
+        x, y, r = (int(round(v * scale)) for v in circle)
 
         # Draw the big circumference on the output image (Green color, thickness 4)
         cv2.circle(output, (x, y), r, (0, 255, 0), 4)
@@ -90,15 +103,27 @@ else:
         # Draw the center point on the output image (Red color, filled circle)
         cv2.circle(output, (x, y), 5, (0, 0, 255), -1) # Corrected syntax for thickness argument
 
-        # Print the results to the console
-        print(f"Detected: Center({x}, {y}), Radius {r}")
+        # Print the results to the console (full-resolution pixels)
+        print(f"Detected: Center({circle[0]:.1f}, {circle[1]:.1f}), Radius {circle[2]:.1f}")
     else:
         # Message if no circles met the strict criteria
         print("No circle found. Try lowering param2 to 30.")
 
-    # 5. Display the results
+    # 4. Display the results
     cv2.imshow("Corrected Detection", output)
     # Wait indefinitely until a key is pressed
     cv2.waitKey(0)
     # Close all open OpenCV windows
     cv2.destroyAllWindows()
+    return 0
+
+
+def main():
+    # Image path from the command line (the bundled soda_can.jpeg if none); --ransac picks the edge-fit engine
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    path = args[0] if args else DEFAULT_PATH
+    return show_soda_can(path, engine="ransac" if "--ransac" in sys.argv else ENGINE)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,470 @@
+"""
+Shared Circle Detection
+v1.1.1
+1. Shrink the grayscale image (image pyramid) until its longest side is about
+   COARSE_DIM pixels, and scale the radius range and minimum distance with it
+2. Lightly blur the small level and run HoughCircles there: the accumulator is
+   a tiny fraction of the full-resolution one, so this step is cheap
+3. Keep the largest candidate (the can's outer edge) and scale it back up
+4. Refine at full resolution: cut small patches centered on points of the
+   estimated circumference, find Canny edges in each patch, and keep only
+   edge points near the estimated radius
+5. Fit a circle to those points with an algebraic least-squares fit, drop
+   points that do not agree with it, and fit again
+6. Return the refined (x, y, radius) in full-resolution pixels
+7. Second engine for when there is one dominant can (detect_circle_ransac):
+   on the same small pyramid level, take the Canny edge points (only those
+   inside the expected radius band when the center is roughly known) and
+   try thousands of random 3-point circles at once with NumPy (RANSAC);
+   shortlist the ones with the most inliers, refit each, and keep the
+   largest of those whose inliers cover (nearly) the whole circumference.
+   The random generator is seeded, so an image always gives the same circle.
+   Then refine at full resolution like steps 4-6
+8. detect_circle() lets callers pick the engine with a parameter
+9. Running this file directly benchmarks both engines (pyramid and ransac)
+   against plain full-resolution HoughCircles
+"""
+
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# longest side of the coarse pyramid level both engines run on
+COARSE_DIM = 200
+
+# full-resolution patches cut along the circumference for refinement
+REFINE_PATCHES = 32
+
+# RANSAC: random circles tried, edge points used to score them, how many of the best on a
+# fifth of those points are scored on all of them, and inlier distance (px on the coarse level)
+RANSAC_ITERATIONS = 2000
+RANSAC_SCORE_POINTS = 1500
+RANSAC_SHORTLIST = 50
+RANSAC_TOLERANCE = 1.5
+# fraction of the circumference that must be covered by inlier edge points
+RANSAC_MIN_SUPPORT = 0.35
+# the circumference is scored in this many arcs; circles within RANSAC_COVERAGE_SLACK of the
+# best coverage count as complete, and the largest of those wins
+RANSAC_ARC_BINS = 64
+RANSAC_COVERAGE_SLACK = 0.1
+# default seed: the same image always gives the same circle
+RANSAC_SEED = 0
+
+ENGINES = ("hough", "ransac")
+
+
+def fit_circle(xs, ys):
+    """
+    Algebraic least-squares circle fit (Kasa): solves x^2 + y^2 + a*x + b*y + c = 0.
+
+    Parameters:
+    xs, ys : 1D arrays of point coordinates (at least 3 points)
+
+    Return:
+    tuple: (cx, cy, r) as floats, or None if the points are degenerate
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    A = np.column_stack((xs, ys, np.ones_like(xs)))
+    rhs = -(xs * xs + ys * ys)
+    (a, b, c), *_ = np.linalg.lstsq(A, rhs, rcond=None)
+    cx, cy = -a / 2, -b / 2
+    r2 = cx * cx + cy * cy - c
+    if not np.isfinite(r2) or r2 <= 0:
+        return None
+    return float(cx), float(cy), float(np.sqrt(r2))
+
+
+def fit_circles(xs, ys, members, fallback):
+    """
+    fit_circle() for many point subsets at once: one normal-equation solve per subset.
+
+    Parameters:
+    xs, ys : 1D arrays of point coordinates
+    members : (circles, points) bool, which points each circle is fitted to
+    fallback : (cx, cy, r) arrays kept for circles whose points are degenerate
+
+    Return:
+    tuple: (cx, cy, r) arrays
+    """
+    z = -(xs * xs + ys * ys)
+    features = np.column_stack((xs * xs, xs * ys, xs, ys * ys, ys, np.ones_like(xs), xs * z, ys * z, z))
+    sums = members.astype(np.float64) @ features
+    sxx, sxy, sx, syy, sy, n, sxz, syz, sz = sums.T
+    ata = np.stack((np.stack((sxx, sxy, sx), -1), np.stack((sxy, syy, sy), -1), np.stack((sx, sy, n), -1)), -2)
+    atb = np.stack((sxz, syz, sz), -1)
+    ok = (n >= 3) & (np.abs(np.linalg.det(ata)) > 1e-9)
+    abc = np.zeros_like(atb)
+    if ok.any():
+        abc[ok] = np.linalg.solve(ata[ok], atb[ok][..., None])[..., 0]
+    cx, cy = -abc[:, 0] / 2, -abc[:, 1] / 2
+    r2 = cx * cx + cy * cy - abc[:, 2]
+    ok &= np.isfinite(r2) & (r2 > 0)
+    return (np.where(ok, cx, fallback[0]), np.where(ok, cy, fallback[1]),
+            np.where(ok, np.sqrt(np.where(ok, r2, 1.0)), fallback[2]))
+
+
+def refine_circle(gray, circle, band, canny_high=100, patches=REFINE_PATCHES):
+    """
+    Refine a rough circle on small full-resolution patches along its circumference.
+
+    Parameters:
+    gray : full-resolution grayscale image
+    circle : rough (cx, cy, r)
+    band : how far (px) the true edge may be from the rough circle
+    canny_high : upper Canny threshold (lower is half of it)
+    patches : number of patches around the circle
+
+    Return:
+    tuple: refined (cx, cy, r), or None if too few edge points were found
+    """
+    cx, cy, r = circle
+    height, width = gray.shape[:2]
+    half = int(np.ceil(band))
+    xs, ys = [], []
+    for angle in np.linspace(0, 2 * np.pi, patches, endpoint=False):
+        px = int(round(cx + r * np.cos(angle)))
+        py = int(round(cy + r * np.sin(angle)))
+        x0, y0 = max(0, px - half), max(0, py - half)
+        x1, y1 = min(width, px + half + 1), min(height, py + half + 1)
+        if x1 - x0 < 5 or y1 - y0 < 5:
+            continue  # this part of the circle is off the image
+        patch = cv2.GaussianBlur(gray[y0:y1, x0:x1], (5, 5), 0)
+        edge_y, edge_x = np.nonzero(cv2.Canny(patch, canny_high // 2, canny_high))
+        xs.append(edge_x + x0)
+        ys.append(edge_y + y0)
+    if not xs:
+        return None
+    xs = np.concatenate(xs).astype(np.float64)
+    ys = np.concatenate(ys).astype(np.float64)
+
+    # only edges near the rough circumference belong to it
+    near = np.abs(np.hypot(xs - cx, ys - cy) - r) <= band
+    xs, ys = xs[near], ys[near]
+    if len(xs) < 10:
+        return None
+
+    fit = fit_circle(xs, ys)
+    if fit is None:
+        return None
+    # second pass without the points that disagree with the first fit (inner rims, glare)
+    residual = np.abs(np.hypot(xs - fit[0], ys - fit[1]) - fit[2])
+    keep = residual <= max(1.5, 2.5 * np.median(residual))
+    if keep.sum() >= 10:
+        fit = fit_circle(xs[keep], ys[keep]) or fit
+    return fit
+
+
+def pyramid_level(gray, coarse_dim=COARSE_DIM):
+    """
+    Shrink a grayscale image until its longest side is about coarse_dim, and median blur it.
+
+    Parameters:
+    gray : full-resolution grayscale image
+    coarse_dim : longest side of the coarse level
+
+    Return:
+    tuple: (coarse image, scale from coarse to full-resolution pixels)
+    """
+    coarse = gray
+    # halve until the longest side is about coarse_dim (pyrDown smooths as it shrinks)
+    while max(coarse.shape[:2]) / 2 >= coarse_dim:
+        coarse = cv2.pyrDown(coarse)
+    scale = max(gray.shape[:2]) / max(coarse.shape[:2])
+    return cv2.medianBlur(coarse, 5), scale
+
+
+def detect_circle_pyramid(gray, min_radius, max_radius, min_dist=None, param1=100, param2=30,
+                          coarse_dim=COARSE_DIM):
+    """
+    Find the largest circle coarse-to-fine: HoughCircles on a small pyramid level,
+    then refinement on full-resolution patches.
+
+    Parameters:
+    gray : full-resolution grayscale image (no blur needed)
+    min_radius, max_radius : radius range in full-resolution pixels
+    min_dist : minimum distance between centers in full-resolution pixels (default: min_radius)
+    param1 : Canny upper threshold (used for the Hough step and the refinement)
+    param2 : Hough accumulator threshold at the coarse level
+    coarse_dim : longest side of the coarse level
+
+    Return:
+    tuple: (cx, cy, r) as floats in full-resolution pixels, or None if no circle was found
+    """
+    coarse, scale = pyramid_level(gray, coarse_dim)
+
+    circles = cv2.HoughCircles(
+        coarse,
+        cv2.HOUGH_GRADIENT,
+        dp=1.0,
+        minDist=max(1, int((min_dist if min_dist is not None else min_radius) / scale)),
+        param1=param1,
+        param2=param2,
+        minRadius=max(1, int(min_radius / scale)),
+        maxRadius=int(np.ceil(max_radius / scale)),
+    )
+    if circles is None:
+        return None
+
+    # the largest candidate is the can's outer edge
+    cx, cy, r = max(circles[0], key=lambda c: c[2])
+    rough = (float(cx) * scale, float(cy) * scale, float(r) * scale)
+    if scale == 1.0:
+        return rough
+
+    # the coarse estimate can be off by about one coarse pixel in each direction
+    refined = refine_circle(gray, rough, band=max(6.0, 3 * scale), canny_high=param1)
+    return refined if refined is not None else rough
+
+
+def edge_points(gray, canny_high=100, center=None, min_radius=None, max_radius=None):
+    """
+    Canny edge points of a grayscale image, optionally only those inside a radius band.
+
+    Parameters:
+    gray : grayscale image (blur it first if it is noisy)
+    canny_high : upper Canny threshold (lower is half of it)
+    center : (x, y) the circle is expected around, or None for every edge point
+    min_radius, max_radius : radius band around center to keep
+
+    Return:
+    tuple: (xs, ys) float arrays
+    """
+    ys, xs = np.nonzero(cv2.Canny(gray, canny_high // 2, canny_high))
+    xs = xs.astype(np.float64)
+    ys = ys.astype(np.float64)
+    if center is not None:
+        dist = np.hypot(xs - center[0], ys - center[1])
+        band = (dist >= min_radius) & (dist <= max_radius)
+        xs, ys = xs[band], ys[band]
+    return xs, ys
+
+
+def circle_inliers(xs, ys, cx, cy, r, tolerance):
+    """
+    Which points lie within tolerance of each of many circles (squared distances in float32,
+    no square root per pair: this is the hot loop of the RANSAC scoring).
+
+    Parameters:
+    xs, ys : 1D arrays of point coordinates
+    cx, cy, r : 1D arrays, one circle per entry
+    tolerance : max distance (px) from a circle
+
+    Return:
+    tuple: (dx, dy, inliers), each (circles, points): offsets from the centers and the bool mask
+    """
+    dx = xs.astype(np.float32)[None, :] - cx.astype(np.float32)[:, None]
+    dy = ys.astype(np.float32)[None, :] - cy.astype(np.float32)[:, None]
+    d2 = dx * dx + dy * dy
+    inner = np.square(np.maximum(r - tolerance, 0.0)).astype(np.float32)[:, None]
+    outer = np.square(r + tolerance).astype(np.float32)[:, None]
+    return dx, dy, (d2 >= inner) & (d2 <= outer)
+
+
+def arc_coverage(dx, dy, inliers, bins=RANSAC_ARC_BINS):
+    """
+    Share of each circle's circumference that has inlier points on it.
+
+    Parameters:
+    dx, dy : (circles, points) offsets of the points from each circle's center
+    inliers : (circles, points) bool, the points close to each circle
+    bins : the circumference is cut into this many equal arcs
+
+    Return:
+    1D array: fraction of arcs (0-1) per circle with at least one inlier
+    """
+    rows, cols = np.nonzero(inliers)
+    arc = ((np.arctan2(dy[rows, cols], dx[rows, cols]) + np.pi) / (2 * np.pi) * bins).astype(np.intp) % bins
+    covered = np.zeros((inliers.shape[0], bins), dtype=bool)
+    covered[rows, arc] = True
+    return covered.mean(axis=1)
+
+
+def ransac_circle(xs, ys, min_radius, max_radius, iterations=RANSAC_ITERATIONS,
+                  tolerance=RANSAC_TOLERANCE, min_support=RANSAC_MIN_SUPPORT, rng=None):
+    """
+    Vectorized RANSAC circle fit followed by algebraic least-squares refinement.
+
+    Parameters:
+    xs, ys : edge point coordinates
+    min_radius, max_radius : allowed radius range
+    iterations : random 3-point circles tried (all scored in one NumPy pass)
+    tolerance : max distance (px) from the circle for a point to count as an inlier
+    min_support : fraction of the circumference that inliers must cover
+    rng : numpy Generator (default: seeded with RANSAC_SEED, so a frame always gives the same answer)
+
+    Return:
+    tuple: (cx, cy, r) as floats, or None if no circle has enough support
+    """
+    if len(xs) < 3:
+        return None
+    rng = rng if rng is not None else np.random.default_rng(RANSAC_SEED)
+
+    # circumcircles of `iterations` random point triples
+    idx = rng.integers(0, len(xs), size=(iterations, 3))
+    ax, bx, cx = xs[idx].T
+    ay, by, cy = ys[idx].T
+    d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    ok = np.abs(d) > 1e-9
+    d = np.where(ok, d, 1.0)
+    a2, b2, c2 = ax * ax + ay * ay, bx * bx + by * by, cx * cx + cy * cy
+    ux = (a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / d
+    uy = (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / d
+    r = np.hypot(ax - ux, ay - uy)
+    ok &= (r >= min_radius) & (r <= max_radius)
+    if not ok.any():
+        return None
+    ux, uy, r = ux[ok], uy[ok], r[ok]
+
+    # shortlist the hypotheses with the most inliers among a few points, then score those by how
+    # much of their circumference has edges on it among many (a clutter line crossing a big circle
+    # gives many inliers on one short arc, a real rim covers the whole way round)
+    sample = rng.permutation(len(xs))[:RANSAC_SCORE_POINTS]
+    px, py = xs[sample], ys[sample]
+    few = RANSAC_SCORE_POINTS // 5
+    _, _, near = circle_inliers(px[:few], py[:few], ux, uy, r, tolerance)
+    shortlist = np.argsort(near.sum(axis=1))[::-1][:RANSAC_SHORTLIST]
+    ux, uy, r = ux[shortlist], uy[shortlist], r[shortlist]
+    # circles through 3 neighbouring pixels are a pixel or two off: refit each on its inliers
+    _, _, near = circle_inliers(px, py, ux, uy, r, 2 * tolerance)
+    ux, uy, r = fit_circles(px, py, near, (ux, uy, r))
+    coverage = arc_coverage(*circle_inliers(px, py, ux, uy, r, tolerance))
+    # of the (nearly) complete circles, the largest is the can's outer edge, like the Hough engine
+    best = int(np.argmax(np.where(coverage >= coverage.max() - RANSAC_COVERAGE_SLACK, r, -1.0)))
+    circle = (ux[best], uy[best], r[best])
+
+    # refine on all inliers of the winner, twice (the second pass uses the refined circle); the
+    # first pass is wider so both Canny edges of a thin rim pull it to the middle, not just one
+    for band in (3 * tolerance, tolerance):
+        inliers = np.abs(np.hypot(xs - circle[0], ys - circle[1]) - circle[2]) <= band
+        if inliers.sum() < 3:
+            return None
+        fit = fit_circle(xs[inliers], ys[inliers])
+        if fit is None:
+            return None
+        circle = fit
+
+    # edges all the way round, not a lucky fit through clutter
+    inliers = np.abs(np.hypot(xs - circle[0], ys - circle[1]) - circle[2]) <= tolerance
+    support = arc_coverage((xs - circle[0])[None, :], (ys - circle[1])[None, :], inliers[None, :])[0]
+    if support < min_support or not min_radius <= circle[2] <= max_radius:
+        return None
+    return circle
+
+
+def detect_circle_ransac(gray, min_radius, max_radius, param1=100, center=None, rng=None,
+                         coarse_dim=COARSE_DIM):
+    """
+    Find the one dominant circle with RANSAC on edge points instead of a Hough accumulator:
+    on the same small pyramid level as detect_circle_pyramid, then refinement on
+    full-resolution patches.
+
+    Parameters:
+    gray : full-resolution grayscale image (no blur needed)
+    min_radius, max_radius : radius range in full-resolution pixels
+    param1 : Canny upper threshold, same meaning as in HoughCircles
+    center : rough (x, y) of the circle if known; only edges in the radius band around it are used
+    rng : numpy Generator (default: seeded, so the same image always gives the same circle)
+    coarse_dim : longest side of the coarse level
+
+    Return:
+    tuple: (cx, cy, r) as floats with sub-pixel precision, or None
+    """
+    coarse, scale = pyramid_level(gray, coarse_dim)
+    low, high = min_radius / scale, max_radius / scale
+    if center is not None:
+        # one tolerance of slack: the band edges are rounded to coarse pixels
+        xs, ys = edge_points(coarse, param1, (center[0] / scale, center[1] / scale),
+                             low - RANSAC_TOLERANCE, high + RANSAC_TOLERANCE)
+    else:
+        xs, ys = edge_points(coarse, param1)
+    found = ransac_circle(xs, ys, low, high, rng=rng)
+    if found is None:
+        return None
+    rough = (found[0] * scale, found[1] * scale, found[2] * scale)
+    if scale == 1.0:
+        return rough
+    refined = refine_circle(gray, rough, band=max(6.0, 3 * scale), canny_high=param1)
+    return refined if refined is not None else rough
+
+
+def detect_circle(gray, min_radius, max_radius, engine="hough", min_dist=None, param1=100, param2=30, center=None):
+    """
+    Find the largest / dominant circle with the chosen engine.
+
+    Parameters:
+    gray : grayscale image
+    min_radius, max_radius : radius range in pixels
+    engine : "hough" (coarse-to-fine HoughCircles) or "ransac" (edge points + RANSAC)
+    min_dist, param2 : only used by "hough"
+    param1 : Canny upper threshold for both
+    center : rough (x, y) of the circle if known (only used by "ransac")
+
+    Return:
+    tuple: (cx, cy, r) as floats, or None
+    """
+    if engine == "hough":
+        return detect_circle_pyramid(gray, min_radius, max_radius, min_dist, param1, param2)
+    if engine == "ransac":
+        return detect_circle_ransac(gray, min_radius, max_radius, param1, center)
+    raise ValueError(f"unknown circle engine: {engine} (choose from {ENGINES})")
+
+
+# ---------------- benchmark ----------------
+def _synthetic_can(rng, size=(480, 640), radius_range=(90, 105)):
+    """
+    Gray noisy image with one bright ring (the can bottom) plus clutter lines, and its true circle.
+    """
+    height, width = size
+    img = rng.normal(90, 12, size).clip(0, 255).astype(np.uint8)
+    r = rng.uniform(*radius_range)
+    cx = rng.uniform(r + 5, width - r - 5)
+    cy = rng.uniform(r + 5, height - r - 5)
+    # draw with 4 bits of sub-pixel precision so the truth is not rounded
+    shift = 16
+    cv2.circle(img, (int(cx * shift), int(cy * shift)), int(r * shift), 200, 3, cv2.LINE_AA, 4)
+    for _ in range(5):
+        p1 = tuple(int(v) for v in rng.uniform((0, 0), (width, height)))
+        p2 = tuple(int(v) for v in rng.uniform((0, 0), (width, height)))
+        cv2.line(img, p1, p2, 160, 2)
+    return cv2.GaussianBlur(img, (5, 5), 0), (cx, cy, r)
+
+
+def main():
+    images = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rng = np.random.default_rng(0)
+    samples = [_synthetic_can(rng) for _ in range(images)]
+
+    def hough(gray):
+        found = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, dp=1.2, minDist=gray.shape[0] // 2,
+                                 param1=120, param2=40, minRadius=85, maxRadius=110)
+        return None if found is None else tuple(max(found[0], key=lambda c: c[2]))
+
+    engines = {
+        "HoughCircles": hough,
+        "pyramid": lambda gray: detect_circle_pyramid(gray, 85, 110, min_dist=gray.shape[0] // 2,
+                                                      param1=120, param2=40),
+        "ransac": lambda gray: detect_circle_ransac(gray, 85, 110, param1=120, rng=rng),
+    }
+    print(f"{'engine':>14} {'ms/img':>8} {'found':>6} {'center err px':>14} {'radius err px':>14}")
+    for name, fn in engines.items():
+        center_err, radius_err, found = [], [], 0
+        start = time.perf_counter()
+        results = [fn(gray) for gray, _ in samples]
+        ms = (time.perf_counter() - start) / images * 1000
+        for result, (_, truth) in zip(results, samples):
+            if result is None:
+                continue
+            found += 1
+            center_err.append(np.hypot(result[0] - truth[0], result[1] - truth[1]))
+            radius_err.append(abs(result[2] - truth[2]))
+        print(f"{name:>14} {ms:>8.2f} {found:>3}/{images:<2} "
+              f"{np.mean(center_err) if center_err else float('nan'):>14.2f} "
+              f"{np.mean(radius_err) if radius_err else float('nan'):>14.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
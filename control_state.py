@@ -0,0 +1,376 @@
+"""
+Shared Control State
+v1.2.1
+1. Keep the robot's movement flags in a named shared memory segment so every
+   API worker process (uvicorn / gunicorn workers) sees the same controls
+2. The segment is a small file in /dev/shm (tmpfs, so it lives in RAM) mapped
+   into every process with mmap; layout:
+   [version u64][server generation u64][one byte per direction]
+3. Writers take an exclusive lock (a thread lock plus an flock on the segment
+   file, so both threads and other processes are kept out), bump the version
+   to an odd number, write the flags, then bump it to the next even number
+4. Readers do not lock: they read the version, copy the flags, read the version
+   again and retry if it changed or was odd (a "seqlock"); after
+   SNAPSHOT_RETRIES tries they take the lock, which also repairs a version a
+   killed writer left odd
+5. Every update gets a new version number, and an update can be made
+   conditional on the version the caller last saw (compare-and-set)
+6. Workers never remove the segment (a recycled worker would split the
+   controls from the ones still running); the first process of a new server
+   run (a different generation, see server_generation) resets the flags to
+   stopped and the version to an even number, so a crashed server does not
+   come back still driving (or with a half-finished update).
+   remove_segment() is for a master / deploy hook
+7. claim() is an exclusive lock one process of the machine holds, for things
+   only one worker may do (run the camera); the OS drops it when that
+   process exits
+8. Running this file directly starts a multi-process consistency and
+   throughput check
+"""
+
+import mmap
+import os
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # windows: only threads of one process are kept in sync
+    fcntl = None
+
+DIRECTIONS = ("forward", "backward", "left", "right")
+CONTROL_STATE_NAME = "pwp_controls"
+
+# lock-free read attempts before snapshot() falls back to a locked read
+SNAPSHOT_RETRIES = 100
+
+_GENERATION_OFFSET = 8  # after the u64 version
+_FLAGS_OFFSET = 16      # after the u64 server generation
+
+# tmpfs on linux (the Pi); plain temp dir elsewhere, still shared through the page cache
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def segment_path(name):
+    """
+    Where the shared segment called name lives on disk.
+    """
+    return os.path.join(SHM_DIR, name)
+
+
+def server_generation():
+    """
+    Number identifying this server run: its process group (uvicorn / gunicorn workers share
+    their master's), mixed with the group leader's start time where /proc has it, so a
+    reused pid after a crash does not look like the same run.
+    """
+    pgid = os.getpgrp() if hasattr(os, "getpgrp") else os.getpid()
+    try:
+        with open(f"/proc/{pgid}/stat") as f:
+            start = int(f.read().rsplit(")", 1)[1].split()[19])  # field 22, starttime
+    except (OSError, ValueError, IndexError):
+        start = 0
+    return ((start << 24) ^ pgid) & 0xFFFFFFFFFFFFFFFF or 1
+
+
+def segment_generation(name):
+    """
+    Server generation stored in a segment (see server_generation), without attaching to it.
+
+    Return:
+    int, or None if there is no such segment
+    """
+    try:
+        with open(segment_path(name), "rb") as f:
+            f.seek(_GENERATION_OFFSET)
+            data = f.read(8)
+    except FileNotFoundError:
+        return None
+    return int.from_bytes(data, sys.byteorder) if len(data) == 8 else 0
+
+
+def remove_segment(name=CONTROL_STATE_NAME):
+    """
+    Delete a segment. Only for when no process uses it any more (the server master's exit
+    hook, a deploy script); processes still attached keep their old copy.
+    """
+    try:
+        os.unlink(segment_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def claim(name):
+    """
+    Try to become the one process of the machine that holds name (non-blocking flock on a
+    file next to the segments). A crashed holder never leaves it taken: the OS drops the
+    lock with the process.
+
+    Parameters:
+    name : what is claimed, e.g. "pwp_camera"
+
+    Return:
+    the open lock file (keep it for as long as the claim should last, close() gives it up),
+    or None if another process holds it
+    """
+    f = open(segment_path(name), "a+b")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+    return f
+
+
+class SharedControls:
+    """
+    Movement flags shared between processes, with versioned atomic updates.
+
+    Parameters:
+    name : name of the shared memory segment (same name = same state)
+    directions : tuple of direction names stored in the segment
+    create : create the segment if it does not exist (False: FileNotFoundError instead)
+
+    Return:
+    None
+    """
+
+    def __init__(self, name=CONTROL_STATE_NAME, directions=DIRECTIONS, create=True):
+        self.name = name
+        self.directions = tuple(directions)
+        self._index = {d: i for i, d in enumerate(self.directions)}
+        size = _FLAGS_OFFSET + len(self.directions)
+
+        self.path = segment_path(name)
+
+        # first process to get here creates the segment; it is never removed by a worker
+        self._fd = os.open(self.path, (os.O_RDWR | os.O_CREAT) if create else os.O_RDWR, 0o600)
+        # growing a fresh file zero-fills it; on a file that is already big enough this is a no-op
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._mmap = mmap.mmap(self._fd, size)
+        self._buf = memoryview(self._mmap)
+        # one aligned 8 byte store / load, so a version is never seen half written
+        self._version = self._buf[:_GENERATION_OFFSET].cast("Q")
+        self._generation = self._buf[_GENERATION_OFFSET:_FLAGS_OFFSET].cast("Q")
+
+        self._thread_lock = threading.Lock()
+        self._attach()
+
+    def _attach(self):
+        # a segment left by an earlier server run (crash, kill -9): start stopped
+        generation = server_generation()
+        self._acquire()
+        try:
+            if self._generation[0] == generation:
+                return
+            # always end on an even version: a writer killed mid-update left it odd, which
+            # readers would take as "update in progress" for good
+            n = len(self.directions)
+            v = self._version[0] | 1
+            self._version[0] = v
+            self._buf[_FLAGS_OFFSET:_FLAGS_OFFSET + n] = bytes(n)
+            self._version[0] = v + 1
+            self._generation[0] = generation
+        finally:
+            self._release()
+
+    # ---------------- locking ----------------
+    def _acquire(self):
+        self._thread_lock.acquire()
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def _release(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    # ---------------- reading ----------------
+    def snapshot(self):
+        """
+        Read a consistent copy of the controls without taking the lock.
+
+        Parameters:
+        None
+
+        Return:
+        tuple: (version, dict of direction -> bool)
+        """
+        n = len(self.directions)
+        for _ in range(SNAPSHOT_RETRIES):
+            v1 = self._version[0]
+            if v1 & 1:
+                continue  # a writer is in the middle of an update
+            flags = bytes(self._buf[_FLAGS_OFFSET:_FLAGS_OFFSET + n])
+            v2 = self._version[0]
+            if v1 == v2:
+                return v1 // 2, {d: flags[i] == 1 for i, d in enumerate(self.directions)}
+        # still odd or changing: take the lock, which also waits out a live writer
+        self._acquire()
+        try:
+            v = self._version[0]
+            if v & 1:
+                # nobody holds the lock, so the writer that made it odd died mid-update
+                v += 1
+                self._version[0] = v
+            flags = bytes(self._buf[_FLAGS_OFFSET:_FLAGS_OFFSET + n])
+        finally:
+            self._release()
+        return v // 2, {d: flags[i] == 1 for i, d in enumerate(self.directions)}
+
+    def as_dict(self):
+        """
+        Return the current controls as a plain dict (what /status sends).
+        """
+        return self.snapshot()[1]
+
+    @property
+    def version(self):
+        """
+        Version of the last completed update (0 before the first one).
+        """
+        return self.snapshot()[0]
+
+    def __contains__(self, direction):
+        return direction in self._index
+
+    def __iter__(self):
+        return iter(self.directions)
+
+    # ---------------- writing ----------------
+    def update(self, flags, expected_version=None):
+        """
+        Atomically change some or all of the flags.
+
+        Parameters:
+        flags : dict of direction -> bool (directions left out keep their value)
+        expected_version : only apply if the state is still at this version
+
+        Return:
+        int new version, or None if expected_version was stale
+        """
+        for d in flags:
+            if d not in self._index:
+                raise KeyError(d)
+        self._acquire()
+        try:
+            v = self._version[0]
+            if expected_version is not None and v // 2 != expected_version:
+                return None
+            self._version[0] = v + 1
+            for d, value in flags.items():
+                self._buf[_FLAGS_OFFSET + self._index[d]] = 1 if value else 0
+            self._version[0] = v + 2
+            return v // 2 + 1
+        finally:
+            self._release()
+
+    def set_direction(self, direction, expected_version=None):
+        """
+        Turn one direction on and every other direction off in one update.
+
+        Parameters:
+        direction : one of self.directions
+        expected_version : optional compare-and-set version
+
+        Return:
+        int new version, or None if expected_version was stale
+        """
+        if direction not in self._index:
+            raise KeyError(direction)
+        return self.update({d: d == direction for d in self.directions}, expected_version)
+
+    def stop(self, expected_version=None):
+        """
+        Turn every direction off in one update.
+
+        Return:
+        int new version, or None if expected_version was stale
+        """
+        return self.update({d: False for d in self.directions}, expected_version)
+
+    # ---------------- cleanup ----------------
+    def close(self):
+        """
+        Detach from the segment. It stays for the other workers (and is reset to stopped
+        by the next server run, see _attach); remove_segment() deletes it.
+        """
+        if self._fd is None:
+            return
+        self._version.release()
+        self._generation.release()
+        self._buf.release()
+        self._mmap.close()
+        os.close(self._fd)
+        self._fd = None
+
+
+# ---------------- multi-process check ----------------
+def _writer(name, seconds, counter):
+    controls = SharedControls(name)
+    ops = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        controls.set_direction(controls.directions[ops % len(controls.directions)])
+        ops += 1
+    counter.put(("write", ops, 0))
+    controls.close()
+
+
+def _reader(name, seconds, counter):
+    controls = SharedControls(name)
+    ops = 0
+    errors = 0
+    last = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        version, state = controls.snapshot()
+        # set_direction() never leaves more than one flag on, and versions never go back
+        if sum(state.values()) > 1 or version < last:
+            errors += 1
+        last = version
+        ops += 1
+    counter.put(("read", ops, errors))
+    controls.close()
+
+
+def main():
+    import multiprocessing
+
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    seconds = 2.0
+    name = f"pwp_controls_check_{os.getpid()}"
+
+    controls = SharedControls(name)
+    start_version = controls.version  # attaching to a new segment is one update already
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_writer, args=(name, seconds, results)) for _ in range(writers)]
+    procs += [multiprocessing.Process(target=_reader, args=(name, seconds, results)) for _ in range(readers)]
+    for p in procs:
+        p.start()
+    totals = {"write": 0, "read": 0}
+    errors = 0
+    for _ in procs:
+        kind, ops, errs = results.get()
+        totals[kind] += ops
+        errors += errs
+    for p in procs:
+        p.join()
+
+    final_version = controls.version
+    controls.close()
+    remove_segment(name)
+    print(f"{writers} writers: {totals['write'] / seconds:,.0f} updates/s")
+    print(f"{readers} readers: {totals['read'] / seconds:,.0f} snapshots/s")
+    expected = start_version + totals["write"]
+    print(f"final version {final_version} (expected {expected}), inconsistent reads: {errors}")
+    return 0 if errors == 0 and final_version == expected else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import sqlite3
-import cv2
-import numpy as np
+import os
 import threading
 import asyncio
+import json
+import time
 from datetime import datetime
+from control_state import SharedControls, claim
+from fleet import FleetRegistry
+from vision import (DETECTOR_STAGES, ExchangeSink, FrameExchange, FrameFollower, FrameGovernor, SharedDemand,
+                    VisionSupervisor, run_vision)
+from frame_history import CLIP_FORMATS, HISTORY_SLOT_BYTES, FrameHistory
+from recorder import Recorder
+import profiler
+from static_assets import STATIC_DIR, StaticAsset
+from memory_watch import MemoryTracker
+from collections import Counter
 
 # ---------------- DB (sqlite) ----------------
 # store users locally, same as you used before
@@ -39,308 +50,226 @@ app.add_middleware(
 )
 
 # ---------------- Robot state ----------------
-controls = {"forward": False, "backward": False, "left": False, "right": False}
+# lives in shared memory so every uvicorn worker (--workers N) sees the same controls
+controls = SharedControls()
 
-# ---------------- Camera + Processing params ----------------
-FRAME_W = 640
-FRAME_H = 480
+# fleet mode: per-robot controls and video, keyed by robot id (/robots/{robot_id}/...)
+# robots register with the fleet token ($PWP_FLEET_TOKEN) in the X-Robot-Token header
+fleet = FleetRegistry()
 
-# stoering the variables (so i can fine tune them for testing)
-BLUR_K = 9
-TH_BLOCK = 51
-TH_C = 7
-MORPH_K = 7
+# biggest frame a robot may upload (same as a frame history slot)
+MAX_UPLOAD_BYTES = HISTORY_SLOT_BYTES
 
-# more variables - for contour
-MIN_ARCLEN = 150.0
-MIN_AREA = 200
+# ---------------- Vision (camera, detector stages: vision.py) ----------------
+# True: capture + detectors run in a supervised child process and hand frames over
+# through shared memory, so they never hold this process's GIL; False: a thread here
+VISION_IN_CHILD = False
 
-# number of samples that we gonna take for the line of best fit
-NUM_SAMPLES = 60
-SMOOTH_WIN = 7
+# None = the camera (MJPEG passthrough when it supports it, see capture.py),
+# or the path of an .mjpeg file to replay instead (e.g. a recording)
+VISION_SOURCE = None
 
-# drawing
-CROP_X, CROP_Y, CROP_W, CROP_H = 160, 120, 320, 240
-LINE_THICK = 3
+# the loop runs at vision.TARGET_FPS while its output is used: a /video_feed viewer, the robot
+# driving, or a command / detections poll in the last ACTIVE_HOLD seconds; else at vision.IDLE_FPS
+ACTIVE_HOLD = 30.0
+# an open video feed renews a VIEWER_LEASE seconds lease on every frame it sends
+VIEWER_LEASE = 1.0
+
+# with --workers N, viewers and commands in any worker count (vision.SharedDemand), and the
+# worker running the camera publishes its frames for the others (vision.FrameFollower)
+demand = SharedDemand("pwp_vision_demand")
+SHARED_RAW = "pwp_frames_raw"
+SHARED_PROCESSED = "pwp_frames_processed"
 
 # ---------------- Globals for frame sharing ----------------
 latest_frame = None        # will hold latest processed jpeg bytes
 latest_frame_raw = None
+latest_detections = None   # results of all detector stages for the latest frame
 latest_frame_lock = threading.Lock()
 
+# the last few seconds of processed frames + their stage results, for /frames and /clip
+history = FrameHistory()
+
+# continuous recording of the raw frames, done by a separate process (recorder.py);
+# started by startup_event, only in the worker that runs the camera
+RECORDING = True
+recorder = None
+
 LOG_FILE = "user_log.txt"
 log_lock = threading.Lock()
 
+# longest message / user-supplied name that goes into one log line
+LOG_MESSAGE_MAX = 1024
+LOG_NAME_MAX = 64
+
 def log_event(message: str):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     with log_lock:
         with open(LOG_FILE, "a") as f:
-            f.write(f"[{timestamp}] {message}\n")
+            f.write(f"[{timestamp}] {message[:LOG_MESSAGE_MAX]}\n")
 
+def log_name(name: str):
+    """
+    A user-supplied name as it may appear in the log: one line, at most LOG_NAME_MAX characters.
+    """
+    name = "".join(c if c.isprintable() else "?" for c in name[:LOG_NAME_MAX + 1])
+    return name if len(name) <= LOG_NAME_MAX else name[:LOG_NAME_MAX] + "..."
 
-# ---------------- OpenCV camera init ----------------
-cap = cv2.VideoCapture(0)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_W)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_H)
-
-# ---------------- Helper functions (with docstrings) ----------------
+# most lines / bytes one /log request hands back
+LOG_TAIL_LINES = 200
+LOG_TAIL_BYTES = 64 * 1024
 
-def pleaseWork(contour_pts):
+def read_log_since(cursor: int, limit: int = LOG_TAIL_LINES):
     """
-    Fit a line to contour points and return best vertical/horizontal line.
-    (tries both 'vertical' fit xs vs ys and 'horizontal' fit ys vs xs, picks the smaller error)
+    Read complete log lines starting at a byte offset, so clients only fetch what is new.
 
     Parameters:
-    contour_pts : numpy.ndarray of shape (N,1,2)
+    cursor : byte offset returned by the previous call (negative = start near the end)
+    limit : most lines to return
 
     Return:
-    tuple: (mode, slope m, intercept b, error)
-           mode is 'v' (x = m*y + b) or 'h' (y = m*x + b)
+    dict: {"cursor": offset to ask for next time, "lines": [...], "more": bool}
     """
-    pts = contour_pts.reshape(-1, 2).astype(float)
-    xs = pts[:, 0]
-    ys = pts[:, 1]
-    best = ("v", 0, 0, 1e12)
+    limit = max(1, min(limit, LOG_TAIL_LINES))
     try:
-        m_v, b_v = np.polyfit(ys, xs, 1)
-        err_v = np.mean((xs - (m_v*ys + b_v))**2)
-        best = ("v", m_v, b_v, err_v)
-    except Exception:
-        pass
-    try:
-        m_h, b_h = np.polyfit(xs, ys, 1)
-        err_h = np.mean((ys - (m_h*xs + b_h))**2)
-        if err_h < best[3]:
-            best = ("h", m_h, b_h, err_h)
-    except Exception:
-        pass
-    return best
-
-def checkIfMoving(a, n):
+        f = open(LOG_FILE, "rb")
+    except FileNotFoundError:
+        return {"cursor": 0, "lines": [], "more": False}
+
+    with f:
+        size = f.seek(0, 2)
+        if cursor > size:
+            cursor = 0  # the log was truncated or replaced, start over
+        if cursor < 0:
+            # first call: only the last `limit` lines
+            start = max(0, size - LOG_TAIL_BYTES)
+            f.seek(start)
+            data = f.read(size - start)
+            if start > 0:
+                skip = data.find(b"\n") + 1  # drop the partial first line
+                start += skip
+                data = data[skip:]
+            end = data.rfind(b"\n") + 1
+            lines = data[:end].split(b"\n")[:-1][-limit:]
+            return {"cursor": start + end,
+                    "lines": [line.decode("utf-8", "replace") for line in lines],
+                    "more": False}
+        f.seek(cursor)
+        data = f.read(LOG_TAIL_BYTES)
+        if len(data) == LOG_TAIL_BYTES and b"\n" not in data:
+            # one line longer than a whole read (written before lines were capped):
+            # hand out its start, marked, and move the cursor past the rest of it
+            end = cursor + len(data)
+            while True:
+                chunk = f.read(LOG_TAIL_BYTES)
+                if not chunk:
+                    # not finished yet: no progress possible now, so no "more" either
+                    return {"cursor": cursor, "lines": [], "more": False}
+                newline = chunk.find(b"\n")
+                if newline != -1:
+                    end += newline + 1
+                    break
+                end += len(chunk)
+            line = data[:LOG_MESSAGE_MAX].decode("utf-8", "replace") + " [truncated]"
+            return {"cursor": end, "lines": [line], "more": end < size}
+
+    # only hand out whole lines; a half written one is picked up next time
+    lines = data[:data.rfind(b"\n") + 1].split(b"\n")[:-1]
+    more = len(lines) > limit or len(data) == LOG_TAIL_BYTES
+    lines = lines[:limit]
+    return {"cursor": cursor + sum(len(line) + 1 for line in lines),
+            "lines": [line.decode("utf-8", "replace") for line in lines],
+            "more": more}
+
+
+# ---------------- Vision loop ----------------
+class FrameSink:
     """
-    Smooth the array using moving average so lines arent jittery.
-
-    Parameters:
-    a : 1D numpy array
-    n : int window size for moving average
-
-    Return:
-    numpy array (smoothed)
+    Where the vision loop (thread or child process) delivers frames: the latest_* globals,
+    the recorder and the frame history. In the worker running the camera it also publishes
+    them for the other workers (share: a vision.ExchangeSink), whose FrameFollower delivers
+    them to their own FrameSink.
     """
-    if len(a) < n:
-        return a
-    return np.convolve(a, np.ones(n)/n, mode='same')
-
-def extendLines(mode, m, b, width, height):
+    def __init__(self, share=None):
+        self.share = share
+
+    def raw(self, seq, timestamp, jpeg):
+        global latest_frame_raw
+        with latest_frame_lock:
+            latest_frame_raw = jpeg
+        # only a copy into shared memory; dropped (and counted) if the recorder is behind
+        if recorder is not None:
+            recorder.put(jpeg, timestamp)
+        if self.share is not None:
+            self.share.raw(seq, timestamp, jpeg)
+            self.share.raw_exchange.beat()
+
+    def processed(self, seq, timestamp, jpeg, detections):
+        global latest_frame, latest_detections
+        with latest_frame_lock:
+            latest_frame = jpeg
+            latest_detections = detections
+        history.put(seq, timestamp, jpeg, detections["results"])
+        if self.share is not None:
+            self.share.processed(seq, timestamp, jpeg, detections)
+
+live_streams = Counter()     # open MJPEG stream generators, by endpoint
+
+def vision_demand():
     """
-    Extend a fitted line (mode 'v' or 'h') to the rectangle edges and return two points.
-
-    Parameters:
-    mode : 'v' or 'h'
-    m, b : slope and intercept
-    width, height : dimensions of the image/crop
+    Whether anything uses the vision output right now, in any worker (else the loop idles).
+    """
+    return demand.wanted or any(controls.as_dict().values())
 
-    Return:
-    p1, p2 : (x,y) integer tuples
+def vision_activity():
     """
-    if mode == "v":
-        x0 = m*0 + b
-        x1 = m*(height-1) + b
-        p1 = (int(round(x0)), 0)
-        p2 = (int(round(x1)), height-1)
-    else:
-        y0 = m*0 + b
-        y1 = m*(width-1) + b
-        p1 = (0, int(round(y0)))
-        p2 = (width-1, int(round(y1)))
-    return p1, p2
+    A command or poll that needs current frames: keep the loop at full rate, waking it now
+    (from another worker, the idle governor sees the shared demand within vision.WAKE_POLL).
+    """
+    demand.want(ACTIVE_HOLD)
+    if governor is not None:
+        governor.wake()
+
+vision_stop = threading.Event()
 
 def process_and_update_frame():
     """
-    Main OpenCV loop: capture frames, run your line-detection + drawing,
-    encode to JPEG, and put into latest_frame (thread-safe).
-    Runs in a background thread.
+    In-process mode: run the vision loop (vision.run_vision) on this thread.
     """
-    global latest_frame, latest_frame_raw, cap
-
-    # if camera failed to open, bail out quietly
-    if not cap.isOpened():
-        print("ayyy camera not opened, check your camera index")
+    run_vision(FrameSink(frame_share), vision_stop, DETECTOR_STAGES, source=VISION_SOURCE, governor=governor)
+
+# with --workers N only one worker may open the camera: the one holding this claim
+# (control_state.claim) runs the vision loop and the recorder; startup_event sets these
+CAMERA_CLAIM = "pwp_camera"
+camera_claim = None
+governor = None            # in-process mode: the loop's FrameGovernor
+vision = None              # child mode: the VisionSupervisor
+processing_thread = None   # in-process mode: the thread running the loop
+frame_share = None         # camera worker: the ExchangeSink its frames are published through
+follower = None            # other workers: the FrameFollower bringing those frames here
+
+@app.on_event("startup")
+def startup_event():
+    global camera_claim, governor, vision, processing_thread, recorder, frame_share, follower
+    camera_claim = claim(CAMERA_CLAIM)
+    if camera_claim is None:
+        print("Another worker runs the camera: following its frames, no recording in this one")
+        follower = FrameFollower(FrameSink(), SHARED_RAW, SHARED_PROCESSED)
         return
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            continue  # skip if frame not grabbed
-
-        # ensure frame is expected size (some cameras ignore set())
-        frame = cv2.resize(frame, (FRAME_W, FRAME_H))
-        # save RAW frame (no drawings)
-        ret_raw, jpeg_raw = cv2.imencode('.jpg', frame)
-        if ret_raw:
-    	    with latest_frame_lock:
-                latest_frame_raw = jpeg_raw.tobytes()
-
-
-        # --------- cropping + processing -----------
-        x2 = min(CROP_X + CROP_W, FRAME_W)
-        y2 = min(CROP_Y + CROP_H, FRAME_H)
-        cropped = frame[CROP_Y:y2, CROP_X:x2].copy()
-        h = cropped.shape[0]
-        w = cropped.shape[1]
-
-        gray = cv2.cvtColor(cropped, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(gray, (BLUR_K, BLUR_K), 0)
-        mask = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                     cv2.THRESH_BINARY_INV, TH_BLOCK, TH_C)
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (MORPH_K, MORPH_K))
-        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
-
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        good = []
-        for cnt in contours:
-            al = cv2.arcLength(cnt, closed=False)
-            area = cv2.contourArea(cnt)
-            if al >= MIN_ARCLEN and area >= MIN_AREA:
-                good.append((al, cnt))
-
-        # fallback: if we don't have 2 big contours, take top few by area (like before)
-        if len(good) < 2:
-            contours_sorted = sorted(contours, key=lambda c: cv2.contourArea(c), reverse=True)
-            for cnt in contours_sorted[:3]:
-                if cv2.contourArea(cnt) >= 50:
-                    good.append((cv2.arcLength(cnt, False), cnt))
-
-        good = sorted(good, key=lambda x: x[0], reverse=True)[:2]
-
-        fullframe_lines = []
-
-        if len(good) >= 2:
-            cntA = good[0][1]
-            cntB = good[1][1]
-
-            def mean_x(cnt):
-                pts = cnt.reshape(-1,2)
-                return pts[:,0].mean()
-
-            if mean_x(cntA) <= mean_x(cntB):
-                left_cnt, right_cnt = cntA, cntB
-            else:
-                left_cnt, right_cnt = cntB, cntA
-
-            modeL, mL, bL, _ = pleaseWork(left_cnt)
-            modeR, mR, bR, _ = pleaseWork(right_cnt)
-
-            # draw the contours in the cropped frame only not main frame yet
-            cv2.drawContours(cropped, [left_cnt], -1, (0,0,255), 2)
-            cv2.drawContours(cropped, [right_cnt], -1, (255,0,0), 2)
-
-            # get midpoints to draw the best fit line using averaging of the slope
-            midpoints = []
-
-            if modeL == "v" and modeR == "v":
-                ys = np.linspace(0, h-1, NUM_SAMPLES)
-                for yy in ys:
-                    xL = mL*yy + bL
-                    xR = mR*yy + bR
-                    midpoints.append(((xL+xR)/2.0, yy))
-            elif modeL == "h" and modeR == "h":
-                xs = np.linspace(0, w-1, NUM_SAMPLES)
-                for xx in xs:
-                    yL = mL*xx + bL
-                    yR = mR*xx + bR
-                    midpoints.append((xx, (yL+yR)/2.0))
-            else:
-                ts = np.linspace(0.0, 1.0, NUM_SAMPLES)
-                for t in ts:
-                    xx = t*(w-1)
-                    yy = t*(h-1)
-                    if modeL == "v":
-                        xL = mL*yy + bL; yL = yy
-                    else:
-                        yL = mL*xx + bL; xL = xx
-                    if modeR == "v":
-                        xR = mR*yy + bR; yR = yy
-                    else:
-                        yR = mR*xx + bR; xR = xx
-                    midpoints.append(((xL+xR)/2.0, (yL+yR)/2.0))
-
-            if len(midpoints) >= 3:
-                pts = np.array(midpoints)
-                xs = checkIfMoving(pts[:,0], SMOOTH_WIN)
-                ys = checkIfMoving(pts[:,1], SMOOTH_WIN)
-                mid_s = np.vstack((xs, ys)).T
-
-                # bunch of try/except so code dont break
-                err_v = err_h = 1e12
-                try:
-                    mcv, bcv = np.polyfit(mid_s[:,1], mid_s[:,0], 1)
-                    err_v = np.mean((mid_s[:,0] - (mcv*mid_s[:,1] + bcv))**2)
-                except Exception:
-                    pass
-                try:
-                    mch, bch = np.polyfit(mid_s[:,0], mid_s[:,1], 1)
-                    err_h = np.mean((mid_s[:,1] - (mch*mid_s[:,0] + bch))**2)
-                except Exception:
-                    pass
-
-                if err_v <= err_h:
-                    p_top = (int(round(mcv*0 + bcv)), 0)
-                    p_bot = (int(round(mcv*(h-1) + bcv)), h-1)
-                else:
-                    p_top = (0, int(round(mch*0 + bch)))
-                    p_bot = (w-1, int(round(mch*(w-1) + bch)))
-
-                def clip(p):
-                    return (int(max(0,min(w-1,p[0]))), int(max(0,min(h-1,p[1]))))
-
-                p1 = clip(p_top)
-                p2 = clip(p_bot)
-
-                # draw center line in cropped
-                cv2.line(cropped, p1, p2, (0,255,0), LINE_THICK)
-
-                # add the cropped frame x and y to the lines so that the lines don't show in the wrong place for the main frame
-                p1_abs = (p1[0] + CROP_X, p1[1] + CROP_Y)
-                p2_abs = (p2[0] + CROP_X, p2[1] + CROP_Y)
-                fullframe_lines.append((p1_abs, p2_abs, (0,255,0)))
-
-            # draw left (red) line
-            pL1, pL2 = extendLines(modeL, mL, bL, w, h)
-            cv2.line(cropped, pL1, pL2, (0,0,255), LINE_THICK)
-            fullframe_lines.append(((pL1[0]+CROP_X, pL1[1]+CROP_Y),
-                                    (pL2[0]+CROP_X, pL2[1]+CROP_Y),
-                                    (0,0,255)))
-
-            # draw right (blue) line
-            pR1, pR2 = extendLines(modeR, mR, bR, w, h)
-            cv2.line(cropped, pR1, pR2, (255,0,0), LINE_THICK)
-            fullframe_lines.append(((pR1[0]+CROP_X, pR1[1]+CROP_Y),
-                                    (pR2[0]+CROP_X, pR2[1]+CROP_Y),
-                                    (255,0,0)))
-
-        # draw crop rectangle box
-        cv2.rectangle(frame, (CROP_X, CROP_Y), (x2, y2), (0,0,255), 2)
-
-        # draw all lines on the main frame instead of just crop
-        for (pa, pb, col) in fullframe_lines:
-            cv2.line(frame, pa, pb, col, LINE_THICK)
-
-        # --------- prepare jpeg and store to latest_frame (thread-safe) ---------
-        ret2, jpeg = cv2.imencode('.jpg', frame)
-        if ret2:
-            with latest_frame_lock:
-                latest_frame = jpeg.tobytes()
-
-        # small sleep to avoid hogging CPU - this controls frame rate approx
-        # if your camera gives 30fps you can reduce or remove this
-        # but keep a tiny sleep to let server threads breathe
-        cv2.waitKey(1)
-
-# start background processing thread
-processing_thread = threading.Thread(target=process_and_update_frame, daemon=True)
-processing_thread.start()
+    if not VISION_IN_CHILD:
+        governor = FrameGovernor(demand=vision_demand)
+    frame_share = ExchangeSink(FrameExchange(SHARED_RAW, create=True),
+                               FrameExchange(SHARED_PROCESSED, create=True), governor)
+    if VISION_IN_CHILD:
+        # the governor lives in the child; the supervisor passes vision_demand() on to it
+        vision = VisionSupervisor(FrameSink(frame_share), DETECTOR_STAGES, source=VISION_SOURCE,
+                                  demand=vision_demand)
+    else:
+        # start background processing thread
+        processing_thread = threading.Thread(target=process_and_update_frame, daemon=True)
+        processing_thread.start()
+    if RECORDING:
+        recorder = Recorder()
 
 # ---------------- Streaming endpoint ----------------
 @app.get("/video_feed")
@@ -349,36 +278,228 @@ async def video_feed():
     MJPEG stream of latest processed frames.
     """
     async def frame_stream():
-        while True:
-            data = None
-            with latest_frame_lock:
-                if latest_frame:
-                    data = latest_frame
-            if data:
-                yield (b"--frame\r\n"
-                       b"Content-Type: image/jpeg\r\n\r\n" +
-                       data + b"\r\n")
-            await asyncio.sleep(0.03)  # ~30 fps
+        live_streams["video_feed"] += 1
+        vision_activity()
+        try:
+            while True:
+                data = None
+                with latest_frame_lock:
+                    if latest_frame:
+                        data = latest_frame
+                if data:
+                    yield (b"--frame\r\n"
+                           b"Content-Type: image/jpeg\r\n\r\n" +
+                           data + b"\r\n")
+                demand.want(VIEWER_LEASE)
+                await asyncio.sleep(0.03)  # ~30 fps
+        finally:
+            live_streams["video_feed"] -= 1
     return StreamingResponse(frame_stream(), media_type="multipart/x-mixed-replace; boundary=frame")
 
 @app.get("/video_feed_raw")
 async def video_feed_raw():
     async def frame_stream():
-        while True:
-            data = None
-            with latest_frame_lock:
-                if latest_frame_raw:
-                    data = latest_frame_raw
-            if data:
-                yield (b"--frame\r\n"
-                       b"Content-Type: image/jpeg\r\n\r\n" +
-                       data + b"\r\n")
-            await asyncio.sleep(0.03)
+        live_streams["video_feed_raw"] += 1
+        vision_activity()
+        try:
+            while True:
+                data = None
+                with latest_frame_lock:
+                    if latest_frame_raw:
+                        data = latest_frame_raw
+                if data:
+                    yield (b"--frame\r\n"
+                           b"Content-Type: image/jpeg\r\n\r\n" +
+                           data + b"\r\n")
+                demand.want(VIEWER_LEASE)
+                await asyncio.sleep(0.03)
+        finally:
+            live_streams["video_feed_raw"] -= 1
     return StreamingResponse(
         frame_stream(),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
+@app.get("/detections")
+async def detections():
+    """
+    Results of every detector stage for the latest frame, all from the same frame:
+    {"seq", "timestamp", "results": {stage: result}, "ms": {stage: ms}}
+    """
+    vision_activity()
+    with latest_frame_lock:
+        data = latest_detections
+    if data is None:
+        raise HTTPException(status_code=503, detail="No frame processed yet")
+    return data
+
+# ---------------- Frame history ----------------
+def history_frame(request: Request, seq: int, cache_control: str):
+    """
+    One frame from the history, straight from its slot (no copy), with an ETag (304 if unchanged).
+    """
+    found = history.get(seq)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Frame is not in the history")
+    data, timestamp, _ = found
+    etag = history.etag(seq)
+    headers = {"ETag": etag, "Cache-Control": cache_control,
+               "X-Frame-Seq": str(seq), "X-Frame-Timestamp": f"{timestamp:.3f}"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+@app.get("/snapshot.jpg")
+async def snapshot(request: Request):
+    """
+    The latest processed frame as a single JPEG.
+    """
+    vision_activity()
+    if not history.last_seq:
+        raise HTTPException(status_code=503, detail="No frame processed yet")
+    return history_frame(request, history.last_seq, "no-cache")
+
+@app.get("/frames")
+async def frames():
+    """
+    What the history holds: first/last seq, their timestamps and the frame count.
+    """
+    return history.info()
+
+@app.get("/frames/{seq}")
+async def frame(seq: int, request: Request):
+    """
+    One processed frame by sequence number (404 once it has left the history).
+    """
+    return history_frame(request, seq, "private, max-age=3600")
+
+@app.get("/frames/{seq}/detections")
+async def frame_detections(seq: int):
+    """
+    The stage results (line geometry, can, ...) stored with one frame.
+    """
+    found = history.get(seq)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Frame is not in the history")
+    _, timestamp, meta = found
+    return {"seq": seq, "timestamp": timestamp, "results": meta}
+
+@app.get("/clip")
+def clip(start: float = None, end: float = None, seconds: float = None, format: str = "avi"):
+    """
+    Export a time range of the history as a clip: .avi (MJPG) or .mjpeg, without re-encoding.
+    Give start/end timestamps, or seconds for the last N seconds. Runs in a worker thread.
+    """
+    if format not in CLIP_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(CLIP_FORMATS)}")
+    if seconds is not None:
+        start, end = time.time() - seconds, None
+    data, count = history.clip(start, end, format)
+    if not count:
+        raise HTTPException(status_code=404, detail="No frames in that range")
+    media_type = "video/x-msvideo" if format == "avi" else "video/x-motion-jpeg"
+    return Response(content=data, media_type=media_type,
+                    headers={"Content-Disposition": f'attachment; filename="clip.{format}"',
+                             "X-Clip-Frames": str(count)})
+
+@app.get("/recording")
+async def recording():
+    """
+    Recorder state: frames queued / recorded / dropped and whether the process is alive.
+    """
+    if recorder is None:
+        return {"enabled": False}
+    return {"enabled": True, **recorder.stats()}
+
+@app.get("/vision")
+async def vision_status():
+    """
+    Where the vision loop runs, its target vs actual fps and time spent idle;
+    in child-process mode also its pid, restarts and frame age.
+    """
+    if camera_claim is None:
+        # frames from the worker that runs the camera
+        return follower.status()
+    if vision is None:
+        with latest_frame_lock:
+            data = latest_detections
+        return {"mode": "thread", "alive": processing_thread.is_alive(),
+                "last_seq": data["seq"] if data else 0, "governor": governor.report()}
+    return vision.status()
+
+# ---------------- Debug ----------------
+# off unless the file profiler.DEBUG_FLAG ("debug.enabled") exists; checked on every request
+def require_debug():
+    if not profiler.debug_enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.get("/debug/profile")
+def debug_profile(seconds: float = 5.0, format: str = "json"):
+    """
+    Sample every thread of this process (vision thread, event loop, ...) for a few seconds.
+    json: collapsed stacks + top functions by self time; collapsed: text for flamegraph.pl / speedscope.
+    A plain def on purpose: it runs in the threadpool, so the event loop is free to be sampled.
+    (With VISION_IN_CHILD the vision loop is in the child process and not in these stacks.)
+    """
+    require_debug()
+    if format not in ("json", "collapsed"):
+        raise HTTPException(status_code=400, detail="format must be json or collapsed")
+    result = profiler.profile(seconds)
+    if result is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    log_event(f"DEBUG | profile seconds={result['seconds']} samples={result['samples']}")
+    if format == "collapsed":
+        return PlainTextResponse(result["collapsed"] + "\n")
+    return result
+
+memory = MemoryTracker()
+
+def frame_buffers():
+    """
+    What the frame path holds on to: the long-lived buffers and the latest frames.
+    """
+    with latest_frame_lock:
+        latest = {"latest_frame": len(latest_frame or b""), "latest_frame_raw": len(latest_frame_raw or b"")}
+    buffers = {"history": history.slots * history.slot_bytes, **latest}
+    if recorder is not None:
+        buffers["recorder_ring"] = recorder.ring.slots * recorder.ring.slot_bytes
+    if vision is not None:
+        buffers["vision_exchanges"] = 2 * (vision.raw.capacity + vision.processed.capacity)
+    if frame_share is not None:
+        buffers["shared_exchanges"] = 2 * (frame_share.raw_exchange.capacity + frame_share.processed_exchange.capacity)
+    # each robot channel keeps its latest uploaded frame
+    buffers["robot_frames"] = fleet.frame_bytes()
+    return buffers
+
+@app.get("/debug/memory")
+def debug_memory(top: int = 20, group_by: str = "lineno"):
+    """
+    RSS, live stream generators and frame buffers; while tracing (POST /debug/memory/baseline)
+    also the top allocation sites by growth since the baseline.
+    """
+    require_debug()
+    if group_by not in ("lineno", "traceback", "filename"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, traceback or filename")
+    return {**memory.diff(top, group_by), "live_streams": {k: v for k, v in live_streams.items() if v},
+            "buffers": frame_buffers()}
+
+@app.post("/debug/memory/baseline")
+def debug_memory_baseline():
+    """
+    Start tracing allocations (if it is not on) and take the baseline /debug/memory compares to.
+    """
+    require_debug()
+    log_event("DEBUG | memory baseline")
+    return memory.start()
+
+@app.post("/debug/memory/stop")
+def debug_memory_stop():
+    """
+    Stop tracing allocations (tracemalloc slows every allocation while on).
+    """
+    require_debug()
+    return memory.stop()
+
 # ---------------- Login / Register endpoints ----------------
 @app.post("/register")
 async def register(user: User):
@@ -388,7 +509,7 @@ async def register(user: User):
     try:
         cursor.execute("INSERT INTO users (username,password) VALUES (?,?)", (user.username, user.password))
         conn.commit()
-        log_event(f"REGISTER | user={user.username}")
+        log_event(f"REGISTER | user={log_name(user.username)}")
         return {"message": "Registration successful"}
     except Exception:
         raise HTTPException(status_code=400, detail="Username already exists or invalid")
@@ -400,199 +521,221 @@ async def login(user: User):
     """
     cursor.execute("SELECT * FROM users WHERE username=? AND password=?", (user.username, user.password))
     if cursor.fetchone():
-        log_event(f"LOGIN success | user={user.username}")
+        log_event(f"LOGIN success | user={log_name(user.username)}")
         return {"message": "Login successful"}
 
-    log_event(f"LOGIN failed | user={user.username}")
+    log_event(f"LOGIN failed | user={log_name(user.username)}")
     raise HTTPException(status_code=401, detail="Invalid username/password")
 
+@app.get("/log")
+def log_tail(cursor: int = -1, limit: int = LOG_TAIL_LINES):
+    """
+    Incremental tail of the event log: pass back the returned cursor to get only new lines.
+    """
+    return read_log_since(cursor, limit)
+
 # ---------------- Controls ----------------
 @app.get("/status")
-async def status():
+async def status(response: Response):
     """
-    Return current control state dict.
+    Return current control state dict (version of the state in X-Control-Version).
     """
-    return controls
+    version, state = controls.snapshot()
+    response.headers["X-Control-Version"] = str(version)
+    return state
 
 @app.post("/stop")
-async def stop():
+async def stop(response: Response):
     """
     Reset movement controls.
     """
-    for k in controls:
-        controls[k] = False
+    response.headers["X-Control-Version"] = str(controls.stop())
+    vision_activity()
 
     log_event("CONTROL | stop")
     return {"message": "All movements stopped"}
 
 @app.post("/{direction}")
-async def move(direction: str):
+async def move(direction: str, response: Response):
     """
     Set a movement direction (forward/backward/left/right).
     """
     if direction not in controls:
         raise HTTPException(status_code=400, detail="Invalid direction")
-    for k in controls:
-        controls[k] = False
-    controls[direction] = True
+    response.headers["X-Control-Version"] = str(controls.set_direction(direction))
+    vision_activity()
 
     log_event(f"CONTROL | direction={direction}")
     return {direction: True}
 
+# ---------------- Fleet ----------------
+def get_robot(robot_id: str):
+    """
+    Look up a registered robot's channel, turning a bad id into a 400 and an unknown one into a 404.
+    """
+    try:
+        return fleet.get(robot_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid robot id")
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Robot not registered")
+
+def register_robot(robot_id: str, request: Request):
+    """
+    Register (or find) a robot that shows the fleet token.
+    """
+    if not fleet.check_token(request.headers.get("x-robot-token")):
+        raise HTTPException(status_code=403, detail="Invalid robot token")
+    try:
+        return fleet.register(robot_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid robot id")
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/robots")
+async def robots():
+    """
+    List the ids of every robot the server has seen.
+    """
+    return {"robots": fleet.robot_ids()}
+
+@app.post("/robots/{robot_id}/register")
+async def robot_register(robot_id: str, request: Request):
+    """
+    A robot announces itself (X-Robot-Token header); only registered robots have channels.
+    """
+    robot = register_robot(robot_id, request)
+    robot.touch()
+    log_event(f"FLEET | robot={robot_id} registered")
+    return {"robot": robot_id, "controls": robot.controls.as_dict()}
+
+@app.get("/robots/{robot_id}/status")
+async def robot_status(robot_id: str, response: Response):
+    """
+    Return one robot's control state dict (the motor client polls this).
+    """
+    robot = get_robot(robot_id)
+    robot.touch()
+    version, state = robot.controls.snapshot()
+    response.headers["X-Control-Version"] = str(version)
+    return state
+
+@app.get("/robots/{robot_id}/events")
+async def robot_events(robot_id: str):
+    """
+    Server-sent events: one message with the robot's controls every time they change.
+    """
+    get_robot(robot_id)
+
+    async def event_stream():
+        async for version, state in fleet.watch(robot_id):
+            yield f"id: {version}\ndata: {json.dumps(state)}\n\n"
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.post("/robots/{robot_id}/frame")
+async def robot_frame(robot_id: str, request: Request):
+    """
+    Ingest one JPEG frame uploaded by a robot (raw image/jpeg body, X-Robot-Token header,
+    at most MAX_UPLOAD_BYTES).
+    """
+    robot = register_robot(robot_id, request)
+    length = request.headers.get("content-length")
+    if length is not None and (not length.isdigit() or int(length) > MAX_UPLOAD_BYTES):
+        raise HTTPException(status_code=413, detail="Frame too large")
+    # chunked uploads have no length: stop reading as soon as it is too big
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Frame too large")
+    body = bytes(body)
+    if not body.startswith(b"\xff\xd8"):
+        raise HTTPException(status_code=400, detail="Body is not a JPEG")
+    robot.put_frame(body)
+    return {"seq": robot.frame_seq}
+
+@app.get("/robots/{robot_id}/video_feed")
+async def robot_video_feed(robot_id: str):
+    """
+    MJPEG stream of the frames uploaded by one robot.
+    """
+    robot = get_robot(robot_id)
+
+    async def frame_stream():
+        live_streams["robot_video_feed"] += 1
+        try:
+            last_seq = 0
+            while True:
+                seq, data = robot.get_frame()
+                if data and seq != last_seq:
+                    last_seq = seq
+                    yield (b"--frame\r\n"
+                           b"Content-Type: image/jpeg\r\n\r\n" +
+                           data + b"\r\n")
+                await asyncio.sleep(0.03)
+        finally:
+            live_streams["robot_video_feed"] -= 1
+    return StreamingResponse(frame_stream(), media_type="multipart/x-mixed-replace; boundary=frame")
+
+@app.post("/robots/{robot_id}/stop")
+async def robot_stop(robot_id: str, response: Response):
+    """
+    Reset one robot's movement controls.
+    """
+    robot = get_robot(robot_id)
+    response.headers["X-Control-Version"] = str(robot.controls.stop())
+
+    log_event(f"CONTROL | robot={robot_id} stop")
+    return {"message": "All movements stopped"}
+
+@app.post("/robots/{robot_id}/{direction}")
+async def robot_move(robot_id: str, direction: str, response: Response):
+    """
+    Set one robot's movement direction (forward/backward/left/right).
+    """
+    robot = get_robot(robot_id)
+    if direction not in robot.controls:
+        raise HTTPException(status_code=400, detail="Invalid direction")
+    response.headers["X-Control-Version"] = str(robot.controls.set_direction(direction))
+
+    log_event(f"CONTROL | robot={robot_id} direction={direction}")
+    return {direction: True}
+
 # ---------------- Serve the GUI HTML ----------------
+# the page lives in static/index.html; read and compressed once, here at startup
+gui = StaticAsset(os.path.join(STATIC_DIR, "index.html"))
+
 @app.get("/", response_class=HTMLResponse)
-async def index():
+async def index(request: Request):
     """
     Serve the web GUI: login screen -> on success shows 4 quadrants fed from /video_feed
+    (gzip / brotli as the browser accepts, 304 when its cached copy is current)
     """
-    return HTMLResponse("""
-<!DOCTYPE html>
-<html>
-<head>
-<meta charset="UTF-8">
-<title>PWP Robot Control</title>
-<style>
-  body { margin: 0; font-family: Arial; }
-  #login-screen { display:flex; flex-direction:column; align-items:center; justify-content:center; height:100vh; }
-  #app-screen { display:none; height:100vh; padding: 10px; box-sizing: border-box; }
-  table { width: 100%; height: 100%; border-collapse: collapse; }
-  td { border: 1px solid black; text-align:center; vertical-align:middle; }
-  img { display:block; margin: 0 auto; }
-</style>
-</head>
-<body>
-
-<!-- LOGIN SCREEN -->
-<div id="login-screen">
-  <h1>Robot Control Login</h1>
-  <input id="username" placeholder="Username" />
-  <input id="password" placeholder="Password" type="password" />
-  <br>
-  <button onclick="registerUser()">Register</button>
-  <button onclick="loginUser()">Login</button>
-  <p id="login-msg"></p>
-</div>
-
-<!-- MAIN GUI -->
-<div id="app-screen">
-  <table>
-    <tr height="50%">
-      <td width="50%">
-        <img src="/video_feed" width="480" height="320" alt="video"/>
-      </td>
-
-      <td width="50%">
-        <table style="margin: 0 auto;">
-          <tr align="center">
-            <td></td>
-            <td><button onclick="sendCommand('forward')">&#8593;</button></td>
-            <td></td>
-          </tr>
-          <tr align="center">
-            <td><button onclick="sendCommand('left')">&#8592;</button></td>
-            <td><button onclick="stopMotor()">&#9632;</button></td>
-            <td><button onclick="sendCommand('right')">&#8594;</button></td>
-          </tr>
-          <tr align="center">
-            <td></td>
-            <td><button onclick="sendCommand('backward')">&#8595;</button></td>
-            <td></td>
-          </tr>
-        </table>
-      </td>
-    </tr>
-
-    <tr height="50%">
-      <td width="50%">
-        <img src="/video_feed_raw" width="480" height="320" alt="video"/>
-      </td>
-      <td width="50%">
-        <h3>Console Log</h3>
-        <pre id="console-log" style="height:300px; overflow:auto; border:1px solid black;"></pre>
-      </td>
-    </tr>
-  </table>
-</div>
-
-<script>
-const API_BASE = "http://127.0.0.1:5000";
-
-/* ---------- LOGIN & REGISTER ---------- */
-async function registerUser() {
-  const u = document.getElementById("username").value.trim();
-  const p = document.getElementById("password").value.trim();
-  try {
-    const res = await fetch(API_BASE + "/register", {
-      method: "POST",
-      headers: {"Content-Type":"application/json"},
-      body: JSON.stringify({username: u, password: p})
-    });
-    const data = await res.json();
-    document.getElementById("login-msg").innerText = data.message || data.detail;
-  } catch (e) {
-    document.getElementById("login-msg").innerText = "Network error";
-  }
-}
-
-async function loginUser() {
-  const u = document.getElementById("username").value.trim();
-  const p = document.getElementById("password").value.trim();
-  try {
-    const res = await fetch(API_BASE + "/login", {
-      method: "POST",
-      headers: {"Content-Type":"application/json"},
-      body: JSON.stringify({username: u, password: p})
-    });
-    const data = await res.json();
-    document.getElementById("login-msg").innerText = data.message || data.detail;
-    if (res.ok) {
-      document.getElementById("login-screen").style.display = "none";
-      document.getElementById("app-screen").style.display = "block";
-    }
-  } catch (e) {
-    document.getElementById("login-msg").innerText = "Network error";
-  }
-}
-
-/* ---------- CONTROLS ---------- */
-async function sendCommand(direction) {
-  log("POST /" + direction);
-  try {
-    const res = await fetch(API_BASE + "/" + direction, {method: "POST"});
-    const data = await res.json();
-    log("Response: " + JSON.stringify(data));
-  } catch (e) {
-    log("Network error sending " + direction);
-  }
-}
-
-async function stopMotor() {
-  log("POST /stop");
-  try {
-    const res = await fetch(API_BASE + "/stop", {method: "POST"});
-    const data = await res.json();
-    log("Response: " + JSON.stringify(data));
-  } catch (e) {
-    log("Network error sending stop");
-  }
-}
-
-/* ---------- LOG ---------- */
-function log(msg) {
-  const box = document.getElementById("console-log");
-  box.textContent += msg + "\\n";
-  box.scrollTop = box.scrollHeight;
-}
-</script>
-
-</body>
-</html>
-""")
+    status, body, headers = gui.select(request.headers.get("accept-encoding"),
+                                       request.headers.get("if-none-match"))
+    if status == 304:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=gui.content_type, headers=headers)
 
 # ---------------- Shutdown cleanup ----------------
 @app.on_event("shutdown")
 def shutdown_event():
-    try:
-        cap.release()
-    except Exception:
-        pass
+    # stops the loop, which releases the camera and the stage workers
+    if processing_thread is not None:
+        vision_stop.set()
+        processing_thread.join(timeout=2.0)
+    if vision is not None:
+        vision.close()
+    if follower is not None:
+        follower.close()
+    if frame_share is not None:
+        frame_share.raw_exchange.close()
+        frame_share.processed_exchange.close()
+    if recorder is not None:
+        recorder.close()
+    if camera_claim is not None:
+        camera_claim.close()
+    controls.close()
+    demand.close()
+    fleet.close()
@@ -0,0 +1,340 @@
+"""
+Fleet Registry
+v1.2.0
+1. Keep one RobotChannel per robot id in a dict, so looking a robot up is O(1)
+   no matter how many robots are connected
+   A robot only gets a channel by registering with the fleet token
+   (register()); looking up an id nobody registered in this server run is a
+   KeyError, and at most MAX_ROBOTS ($PWP_MAX_ROBOTS) are registered
+2. Each channel holds that robot's controls in its own SharedControls segment
+   (named after the robot), so every API worker agrees on every robot's state
+3. Each channel also holds the last JPEG frame the robot uploaded, so every
+   robot has its own video stream. Frames are not shared between workers:
+   with --workers N, a robot's /video_feed only shows frames uploaded to the
+   same worker (controls are shared, see 2)
+4. Push channels: watch() yields a robot's controls every time their version
+   changes, which the server sends as server-sent events
+5. Running this file directly starts the server (uvicorn curvedLine:app) with
+   the cap raised to the biggest fleet size, registers hundreds of simulated
+   robots through its routes and prints HTTP control latency for growing
+   fleet sizes
+"""
+
+import asyncio
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from control_state import DIRECTIONS, SHM_DIR, SharedControls, remove_segment, segment_generation, server_generation
+
+ROBOT_SEGMENT_PREFIX = "pwp_robot_"
+ROBOT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+# robots present this token (X-Robot-Token) to register; no token set = fleet registration off
+FLEET_TOKEN_ENV = "PWP_FLEET_TOKEN"
+# most robots registered at once; $PWP_MAX_ROBOTS overrides it for bigger fleets
+MAX_ROBOTS_ENV = "PWP_MAX_ROBOTS"
+MAX_ROBOTS = 64
+
+# how often a push channel checks its robot's control version
+PUSH_INTERVAL = 0.05
+
+
+class RobotChannel:
+    """
+    Everything the server keeps for one robot: controls, last frame, last contact.
+    The controls are shared by all workers; the frame only lives in the worker that
+    received it.
+
+    Parameters:
+    robot_id : id the robot identifies itself with
+
+    Return:
+    None
+    """
+
+    def __init__(self, robot_id, create=True):
+        self.robot_id = robot_id
+        self.controls = SharedControls(ROBOT_SEGMENT_PREFIX + robot_id, create=create)
+        self.frame = None
+        self.frame_seq = 0
+        self.frame_lock = threading.Lock()
+        self.last_seen = None
+
+    def put_frame(self, jpeg):
+        """
+        Store the newest JPEG uploaded by the robot.
+        """
+        with self.frame_lock:
+            self.frame = jpeg
+            self.frame_seq += 1
+        self.touch()
+
+    def touch(self):
+        """
+        Remember when the robot last contacted the server.
+        """
+        self.last_seen = time.time()
+
+    def get_frame(self):
+        """
+        Return (sequence number, jpeg bytes) of the newest frame.
+        """
+        with self.frame_lock:
+            return self.frame_seq, self.frame
+
+    def close(self):
+        self.controls.close()
+
+
+class FleetRegistry:
+    """
+    Dict of robot id -> RobotChannel. Channels are made by register(); get() only finds
+    robots registered in this server run (by any worker).
+
+    Parameters:
+    token : fleet token robots register with (default: $PWP_FLEET_TOKEN; None = registration off)
+    max_robots : most robots registered at once (default: $PWP_MAX_ROBOTS, else MAX_ROBOTS)
+
+    Return:
+    None
+    """
+
+    def __init__(self, token=None, max_robots=None):
+        self.token = token if token is not None else os.environ.get(FLEET_TOKEN_ENV)
+        if max_robots is None:
+            max_robots = int(os.environ.get(MAX_ROBOTS_ENV) or MAX_ROBOTS)
+        self.max_robots = max_robots
+        self._robots = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _check_id(robot_id):
+        if not ROBOT_ID_PATTERN.match(robot_id):
+            raise ValueError(f"invalid robot id: {robot_id!r}")
+
+    def _registered(self, robot_id):
+        # registered by some worker of this server run (a segment left by an earlier run does not count)
+        return segment_generation(ROBOT_SEGMENT_PREFIX + robot_id) == server_generation()
+
+    def check_token(self, token):
+        """
+        True if token is the fleet token (always False while no token is configured).
+        """
+        return bool(self.token) and token is not None and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def register(self, robot_id):
+        """
+        Create (or reset, if left by an earlier run) the channel for robot_id.
+        The caller checks the robot's token first.
+
+        Parameters:
+        robot_id : str (letters, digits, '-' and '_', up to 32 chars)
+
+        Return:
+        RobotChannel
+
+        Raises:
+        ValueError for a bad id, RuntimeError if MAX_ROBOTS are registered already
+        """
+        self._check_id(robot_id)
+        with self._lock:
+            channel = self._robots.get(robot_id)
+            if channel is not None:
+                return channel
+            if not self._registered(robot_id) and len(self.robot_ids()) >= self.max_robots:
+                raise RuntimeError(f"fleet is full ({self.max_robots} robots)")
+            channel = RobotChannel(robot_id)
+            self._robots[robot_id] = channel
+        return channel
+
+    def get(self, robot_id):
+        """
+        Return the channel for a registered robot.
+
+        Parameters:
+        robot_id : str
+
+        Return:
+        RobotChannel
+
+        Raises:
+        ValueError for a bad id, KeyError if no worker registered it in this server run
+        """
+        channel = self._robots.get(robot_id)
+        if channel is not None:
+            return channel
+        self._check_id(robot_id)
+        with self._lock:
+            channel = self._robots.get(robot_id)
+            if channel is None:
+                # registered through another worker: attach to its segment, never create one
+                if not self._registered(robot_id):
+                    raise KeyError(robot_id)
+                try:
+                    channel = RobotChannel(robot_id, create=False)
+                except FileNotFoundError:
+                    raise KeyError(robot_id) from None
+                self._robots[robot_id] = channel
+        return channel
+
+    def robot_ids(self):
+        """
+        Ids of every robot registered with any worker in this server run (read from the shared segments).
+        """
+        ids = set(self._robots)
+        try:
+            for entry in os.listdir(SHM_DIR):
+                if entry.startswith(ROBOT_SEGMENT_PREFIX):
+                    robot_id = entry[len(ROBOT_SEGMENT_PREFIX):]
+                    if self._registered(robot_id):
+                        ids.add(robot_id)
+        except OSError:
+            pass
+        return sorted(ids)
+
+    def frame_bytes(self):
+        """
+        Bytes held by the robots' latest uploaded frames in this worker.
+        """
+        with self._lock:
+            channels = list(self._robots.values())
+        return sum(len(channel.get_frame()[1] or b"") for channel in channels)
+
+    def __len__(self):
+        return len(self._robots)
+
+    async def watch(self, robot_id):
+        """
+        Push channel for one robot: yields its controls each time they change.
+
+        Parameters:
+        robot_id : str
+
+        Return:
+        async generator of (version, dict of direction -> bool)
+        """
+        controls = self.get(robot_id).controls
+        last = None
+        while True:
+            version, state = controls.snapshot()
+            if version != last:
+                last = version
+                yield version, state
+            await asyncio.sleep(PUSH_INTERVAL)
+
+    def close(self):
+        with self._lock:
+            for channel in self._robots.values():
+                channel.close()
+            self._robots.clear()
+
+
+# ---------------- load test ----------------
+def _percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def _start_server(token, max_robots, workers):
+    """
+    Run curvedLine.py under uvicorn in a scratch folder (its users.db and log go there).
+
+    Return:
+    tuple: (subprocess.Popen, port)
+    """
+    import socket
+    import subprocess
+    import tempfile
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=here + os.pathsep + os.environ.get("PYTHONPATH", ""),
+               **{FLEET_TOKEN_ENV: token, MAX_ROBOTS_ENV: str(max_robots)})
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "curvedLine:app", "--port", str(port),
+                               "--workers", str(workers), "--log-level", "warning"],
+                              cwd=tempfile.mkdtemp(), env=env)
+    return server, port
+
+
+def main():
+    """
+    Load test through the real HTTP routes: start the server, register robots in growing
+    numbers (/robots/{id}/register), then time control round trips on random robots
+    (POST /robots/{id}/{direction}, then GET /robots/{id}/status, what the robot polls).
+
+    Arguments: fleet sizes (default 10 100 500), then --workers N for the server.
+    """
+    import http.client
+    import secrets
+    args = sys.argv[1:]
+    workers = 1
+    if "--workers" in args:
+        i = args.index("--workers")
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    sizes = sorted(int(n) for n in args) or [10, 100, 500]
+    commands = 2000
+    token = secrets.token_hex(16)
+    server, port = _start_server(token, sizes[-1], workers)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+
+    def call(method, path, headers=None):
+        conn.request(method, path, headers=headers or {})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+
+    ids = []
+    try:
+        for _ in range(300):  # wait for the server to come up
+            try:
+                call("GET", "/robots")
+                break
+            except OSError:
+                conn.close()
+                time.sleep(0.1)
+        else:
+            raise SystemExit("the server did not start")
+
+        print(f"{'robots':>8} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}   (POST direction + GET status, {workers} worker(s))")
+        for size in sizes:
+            while len(ids) < size:
+                robot_id = f"sim{os.getpid()}_{len(ids)}"
+                status = call("POST", f"/robots/{robot_id}/register", {"X-Robot-Token": token})
+                if status != 200:
+                    raise SystemExit(f"registering robot {len(ids) + 1} failed: HTTP {status}")
+                ids.append(robot_id)
+
+            directions = DIRECTIONS
+            samples = []
+            for i in range(commands):
+                robot_id = random.choice(ids)
+                start = time.perf_counter()
+                ok = call("POST", f"/robots/{robot_id}/{directions[i % len(directions)]}") == 200
+                ok = call("GET", f"/robots/{robot_id}/status") == 200 and ok
+                samples.append((time.perf_counter() - start) * 1e3)
+                if not ok:
+                    raise SystemExit(f"control round trip failed for {robot_id}")
+
+            print(f"{size:>8} {_percentile(samples, 0.5):>8.2f} {_percentile(samples, 0.99):>8.2f} "
+                  f"{sum(samples) / len(samples):>8.2f}")
+        # one past the cap must be refused
+        status = call("POST", f"/robots/sim{os.getpid()}_full/register", {"X-Robot-Token": token})
+        print(f"robot {sizes[-1] + 1} with the cap at {sizes[-1]}: HTTP {status}")
+        return 0 if status == 503 else 1
+    finally:
+        conn.close()
+        server.terminate()
+        server.wait(10)
+        for robot_id in ids:
+            remove_segment(ROBOT_SEGMENT_PREFIX + robot_id)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+import struct
+import sys
+import threading
+import time
+
+# how much history is kept, and the most bytes one encoded frame may take
+HISTORY_SECONDS = 10
+HISTORY_FPS = 30
+HISTORY_SLOT_BYTES = 96 * 1024
+
+# the oldest frames (this many) count as gone already: their slot is about to be reused,
+# so a response still sending from it could get overwritten halfway
+GUARD_SLOTS = HISTORY_FPS
+
+CLIP_FORMATS = ("avi", "mjpeg")
+
+
+def jpeg_size(jpeg):
+    """
+    Read width and height from a JPEG's start-of-frame header (no decoding).
+
+    Parameters:
+    jpeg : bytes-like
+
+    Return:
+    tuple: (width, height), or None if there is no SOF header
+    """
+    data = memoryview(jpeg).cast("B")
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack_from(">HH", data, i + 5)
+            return width, height
+        i += 2 + struct.unpack_from(">H", data, i + 2)[0]
+    return None
+
+
+def avi_from_jpegs(jpegs, fps, width, height):
+    """
+    Wrap JPEG frames in an MJPG AVI file as they are (nothing is decoded or re-encoded).
+
+    Parameters:
+    jpegs : list of bytes-like frames
+    fps : frame rate written to the header
+    width, height : frame size
+
+    Return:
+    bytes of the .avi file
+    """
+    fps = max(fps, 1e-3)
+    biggest = max((len(j) for j in jpegs), default=0)
+
+    movi = bytearray(b"movi")
+    index = bytearray()
+    for jpeg in jpegs:
+        index += struct.pack("<4sIII", b"00dc", 0x10, len(movi), len(jpeg))  # keyframe, offset from "movi"
+        movi += struct.pack("<4sI", b"00dc", len(jpeg)) + jpeg
+        if len(jpeg) % 2:
+            movi += b"\0"
+
+    def chunk(fourcc, payload):
+        return struct.pack("<4sI", fourcc, len(payload)) + payload
+
+    def riff_list(kind, payload):
+        return struct.pack("<4sI4s", b"LIST", len(payload) + 4, kind) + payload
+
+    usec = int(round(1e6 / fps))
+    avih = struct.pack("<IIIIIIIIII4I", usec, int(biggest * fps), 0, 0x10, len(jpegs), 0, 1,
+                       biggest, width, height, 0, 0, 0, 0)
+    strh = struct.pack("<4s4sIHHIIIIIIiI4h", b"vids", b"MJPG", 0, 0, 0, 0, 1000, int(round(fps * 1000)),
+                       0, len(jpegs), biggest, -1, 0, 0, 0, width, height)
+    strf = struct.pack("<IiiHHIIiiII", 40, width, height, 1, 24, int.from_bytes(b"MJPG", "little"),
+                       width * height * 3, 0, 0, 0, 0)
+    hdrl = riff_list(b"hdrl", chunk(b"avih", avih) + riff_list(b"strl", chunk(b"strh", strh) + chunk(b"strf", strf)))
+    body = b"AVI " + hdrl + struct.pack("<4sI", b"LIST", len(movi)) + bytes(movi) + chunk(b"idx1", bytes(index))
+    return struct.pack("<4sI", b"RIFF", len(body)) + body
+
+
+class FrameHistory:
+    """
+    The last few seconds of encoded frames in one preallocated buffer (fixed memory).
+    Frame seq lives in slot seq % slots; each slot keeps its seq, timestamp, length and
+    metadata (the stage results). get() hands back a memoryview of the slot, no copy.
+
+    Parameters:
+    seconds, fps : how much history to keep (seconds * fps slots)
+    slot_bytes : the most bytes one frame may take (bigger frames are skipped and counted)
+
+    Return:
+    None
+    """
+    def __init__(self, seconds=HISTORY_SECONDS, fps=HISTORY_FPS, slot_bytes=HISTORY_SLOT_BYTES):
+        self.slots = max(2, int(seconds * fps))
+        self.slot_bytes = slot_bytes
+        self.guard = min(GUARD_SLOTS, self.slots // 2)
+        self._buffer = bytearray(self.slots * slot_bytes)
+        self._view = memoryview(self._buffer)
+        self._seq = [0] * self.slots
+        self._length = [0] * self.slots
+        self._time = [0.0] * self.slots
+        self._meta = [None] * self.slots
+        self._lock = threading.Lock()
+        self.last_seq = 0
+        self.too_large = 0
+        # part of every ETag, so seq numbers from an earlier run never match
+        self.boot = format(int(time.time() * 1000) & 0xFFFFFFFF, "x")
+
+    def put(self, seq, timestamp, jpeg, meta=None):
+        """
+        Store one encoded frame (seq must grow from call to call).
+
+        Parameters:
+        seq : frame sequence number
+        timestamp : capture time
+        jpeg : bytes-like (bytes, or the array from cv2.imencode)
+        meta : anything to keep with the frame (e.g. the line geometry)
+
+        Return:
+        bool: False if the frame was too big for a slot
+        """
+        data = memoryview(jpeg).cast("B")
+        if len(data) > self.slot_bytes:
+            self.too_large += 1
+            return False
+        slot = seq % self.slots
+        start = slot * self.slot_bytes
+        with self._lock:
+            self._seq[slot] = 0  # readers see the slot as empty while it is rewritten
+            self._view[start:start + len(data)] = data
+            self._length[slot] = len(data)
+            self._time[slot] = timestamp
+            self._meta[slot] = meta
+            self._seq[slot] = seq
+            self.last_seq = seq
+        return True
+
+    def _available(self, seq):
+        return seq > 0 and seq + self.slots - self.guard > self.last_seq and self._seq[seq % self.slots] == seq
+
+    def get(self, seq):
+        """
+        Look up one frame.
+
+        Parameters:
+        seq : frame sequence number
+
+        Return:
+        tuple: (memoryview of the jpeg, timestamp, meta), or None if it is gone (or never was)
+        """
+        with self._lock:
+            if not self._available(seq):
+                return None
+            slot = seq % self.slots
+            start = slot * self.slot_bytes
+            return self._view[start:start + self._length[slot]], self._time[slot], self._meta[slot]
+
+    def etag(self, seq):
+        return f'"{self.boot}-{seq}"'
+
+    def seqs(self, start=None, end=None):
+        """
+        Sequence numbers of the frames kept, oldest first, optionally only those captured in [start, end].
+        """
+        with self._lock:
+            found = [s for s in self._seq if self._available(s)
+                     and (start is None or self._time[s % self.slots] >= start)
+                     and (end is None or self._time[s % self.slots] <= end)]
+        return sorted(found)
+
+    def info(self):
+        """
+        What is in the history: first/last seq and their timestamps.
+        """
+        seqs = self.seqs()
+        with self._lock:
+            times = [self._time[s % self.slots] for s in (seqs[0], seqs[-1])] if seqs else [None, None]
+        return {"first": seqs[0] if seqs else None, "last": seqs[-1] if seqs else None,
+                "first_time": times[0], "last_time": times[1], "frames": len(seqs),
+                "slots": self.slots, "too_large": self.too_large}
+
+    def clip(self, start=None, end=None, fmt="avi"):
+        """
+        Export the frames captured in [start, end] as one file. The frames are copied out under
+        the lock first (a memcpy), so the capture loop is never held up by the export itself.
+
+        Parameters:
+        start, end : timestamps (None = from the oldest / up to the newest)
+        fmt : "avi" (MJPG in AVI) or "mjpeg" (JPEGs back to back)
+
+        Return:
+        tuple: (bytes, number of frames); (b"", 0) if no frame is in the range
+        """
+        if fmt not in CLIP_FORMATS:
+            raise ValueError(f"unknown clip format: {fmt} (choose from {', '.join(CLIP_FORMATS)})")
+        jpegs, times = [], []
+        for seq in self.seqs(start, end):
+            with self._lock:
+                if not self._available(seq):
+                    continue
+                slot = seq % self.slots
+                begin = slot * self.slot_bytes
+                jpegs.append(bytes(self._view[begin:begin + self._length[slot]]))
+                times.append(self._time[slot])
+        if not jpegs:
+            return b"", 0
+        if fmt == "mjpeg":
+            return b"".join(jpegs), len(jpegs)
+        fps = (len(times) - 1) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else HISTORY_FPS
+        width, height = jpeg_size(jpegs[0]) or (0, 0)
+        return avi_from_jpegs(jpegs, fps, width, height), len(jpegs)
+
+
+def main():
+    """
+    Self-check: fill a small history past its size, check what is kept, and that a clip parses.
+    """
+    def fake_jpeg(n):
+        # SOI, SOF0 for 640x480, some payload, EOI
+        sof = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, 480, 640, 1) + b"\x01\x11\x00"
+        return b"\xff\xd8" + sof + bytes([n % 251]) * (1000 + n) + b"\xff\xd9"
+
+    history = FrameHistory(seconds=2, fps=10, slot_bytes=4096)
+    start = time.perf_counter()
+    for seq in range(1, 51):
+        history.put(seq, 1000.0 + seq / 10, fake_jpeg(seq), {"seq": seq})
+    put_us = (time.perf_counter() - start) / 50 * 1e6
+
+    kept = history.seqs()
+    assert kept == list(range(50 - history.slots + history.guard + 1, 51)), kept
+    assert history.get(1) is None and history.get(30) is None
+    view, stamp, meta = history.get(50)
+    assert bytes(view) == fake_jpeg(50) and meta == {"seq": 50}
+    assert jpeg_size(view) == (640, 480)
+    assert not history.put(51, 0, b"\xff\xd8" + b"x" * 5000)
+
+    avi, frames = history.clip(1004.55, 1005.0)
+    assert frames == 5 and avi[:4] == b"RIFF" and avi[8:12] == b"AVI "
+    assert struct.unpack_from("<I", avi, 4)[0] == len(avi) - 8
+    mjpeg, frames = history.clip(fmt="mjpeg")
+    assert mjpeg.count(b"\xff\xd9") == frames == len(kept)
+    print(f"ok: {len(kept)} frames kept of {history.slots} slots, {put_us:.1f} us per put, "
+          f"{len(avi)} byte avi for 5 frames")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
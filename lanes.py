@@ -0,0 +1,439 @@
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# ---------------- Processing params ----------------
+# stoering the variables (so i can fine tune them for testing)
+BLUR_K = 9
+TH_BLOCK = 51
+TH_C = 7
+MORPH_K = 7
+
+# more variables - for contour
+MIN_ARCLEN = 150.0
+MIN_AREA = 200
+
+# number of samples that we gonna take for the line of best fit
+NUM_SAMPLES = 60
+SMOOTH_WIN = 7
+
+# drawing
+CROP_X, CROP_Y, CROP_W, CROP_H = 160, 120, 320, 240
+LINE_THICK = 3
+
+# cached thresholding (BackgroundCache): the local-mean background is only rebuilt every
+# BG_REFRESH_FRAMES frames, or sooner when the mean brightness moves by BG_BRIGHTNESS_SHIFT;
+# it is built on a BG_SCALE times smaller image (1 = full size: a frame that rebuilt it gets
+# exactly adaptiveThreshold's mask, frames reusing it do not, see benchmark_background)
+BG_REFRESH_FRAMES = 15
+BG_BRIGHTNESS_SHIFT = 6.0
+BG_SCALE = 4
+
+# colors of the lines handed back by detect_lanes (BGR)
+CENTER_COLOR = (0, 255, 0)
+LEFT_COLOR = (0, 0, 255)
+RIGHT_COLOR = (255, 0, 0)
+
+# ---------------- Helper functions (with docstrings) ----------------
+
+def pleaseWork(contour_pts):
+    """
+    Fit a line to contour points and return best vertical/horizontal line.
+    (tries both 'vertical' fit xs vs ys and 'horizontal' fit ys vs xs, picks the smaller error)
+
+    Parameters:
+    contour_pts : numpy.ndarray of shape (N,1,2)
+
+    Return:
+    tuple: (mode, slope m, intercept b, error)
+           mode is 'v' (x = m*y + b) or 'h' (y = m*x + b)
+    """
+    pts = contour_pts.reshape(-1, 2).astype(float)
+    xs = pts[:, 0]
+    ys = pts[:, 1]
+    best = ("v", 0, 0, 1e12)
+    try:
+        m_v, b_v = np.polyfit(ys, xs, 1)
+        err_v = np.mean((xs - (m_v*ys + b_v))**2)
+        best = ("v", m_v, b_v, err_v)
+    except Exception:
+        pass
+    try:
+        m_h, b_h = np.polyfit(xs, ys, 1)
+        err_h = np.mean((ys - (m_h*xs + b_h))**2)
+        if err_h < best[3]:
+            best = ("h", m_h, b_h, err_h)
+    except Exception:
+        pass
+    return best
+
+def checkIfMoving(a, n):
+    """
+    Smooth the array using moving average so lines arent jittery.
+
+    Parameters:
+    a : 1D numpy array
+    n : int window size for moving average
+
+    Return:
+    numpy array (smoothed)
+    """
+    if len(a) < n:
+        return a
+    return np.convolve(a, np.ones(n)/n, mode='same')
+
+def extendLines(mode, m, b, width, height):
+    """
+    Extend a fitted line (mode 'v' or 'h') to the rectangle edges and return two points.
+
+    Parameters:
+    mode : 'v' or 'h'
+    m, b : slope and intercept
+    width, height : dimensions of the image/crop
+
+    Return:
+    p1, p2 : (x,y) integer tuples
+    """
+    if mode == "v":
+        x0 = m*0 + b
+        x1 = m*(height-1) + b
+        p1 = (int(round(x0)), 0)
+        p2 = (int(round(x1)), height-1)
+    else:
+        y0 = m*0 + b
+        y1 = m*(width-1) + b
+        p1 = (0, int(round(y0)))
+        p2 = (width-1, int(round(y1)))
+    return p1, p2
+
+def crop_box(frame_w, frame_h):
+    """
+    The lane crop clipped to the frame.
+
+    Parameters:
+    frame_w, frame_h : frame size
+
+    Return:
+    tuple: (x1, y1, x2, y2)
+    """
+    return CROP_X, CROP_Y, min(CROP_X + CROP_W, frame_w), min(CROP_Y + CROP_H, frame_h)
+
+class BackgroundCache:
+    """
+    Cached version of the adaptiveThreshold in lane_mask. adaptiveThreshold (gaussian, binary inv)
+    marks a pixel when pixel <= local mean - TH_C, and the local mean is a TH_BLOCK wide Gaussian
+    blur, the expensive part. Lighting changes over seconds, so the mean (the "background") is kept
+    and reused; frames in between only do a per-pixel compare against it.
+    It is rebuilt every refresh_frames frames, when the frame size changes, or when the average
+    brightness moves by more than brightness_shift.
+    The mask is only adaptiveThreshold's on frames that rebuild the background (and scale=1);
+    frames reusing it miss whatever moved since. On the synthetic "hard" clip
+    (python lanes.py) that is a foreground IoU of about 0.52 against adaptiveThreshold,
+    97% of pixels agreeing, for a 6-10x cheaper threshold at BG_SCALE.
+
+    Parameters:
+    refresh_frames : frames a background is reused for
+    brightness_shift : change in mean brightness (0-255) that forces a rebuild
+    scale : build the background on an image this many times smaller (1 = full size, the
+            same background adaptiveThreshold computes)
+
+    Return:
+    None
+    """
+    def __init__(self, refresh_frames=BG_REFRESH_FRAMES, brightness_shift=BG_BRIGHTNESS_SHIFT, scale=BG_SCALE):
+        self.refresh_frames = refresh_frames
+        self.brightness_shift = brightness_shift
+        self.scale = max(1, int(scale))
+        self.limit = None
+        self.brightness = None
+        self.age = 0
+        self.rebuilds = 0
+
+    def _build(self, blur):
+        h, w = blur.shape[:2]
+        if self.scale == 1:
+            # exactly what adaptiveThreshold does: blur in float32 (sigma from the block size),
+            # border pixels replicated from this image only, then round back to uint8
+            mean = cv2.GaussianBlur(blur.astype(np.float32), (TH_BLOCK, TH_BLOCK), 0,
+                                    borderType=cv2.BORDER_REPLICATE | cv2.BORDER_ISOLATED)
+            mean = cv2.convertScaleAbs(mean)
+        else:
+            # the same Gaussian on a smaller image, close but not identical
+            sigma = 0.3 * ((TH_BLOCK - 1) * 0.5 - 1) + 0.8
+            small = cv2.resize(blur, (max(1, w // self.scale), max(1, h // self.scale)), interpolation=cv2.INTER_AREA)
+            k = (TH_BLOCK // self.scale) | 1
+            small = cv2.GaussianBlur(small, (k, k), sigma / self.scale, borderType=cv2.BORDER_REPLICATE)
+            mean = cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+        # pixel <= mean - C  is  pixel < mean - (C - 1); subtract saturates at 0, where nothing passes
+        self.limit = cv2.subtract(mean, TH_C - 1)
+        self.age = 0
+        self.rebuilds += 1
+
+    def threshold(self, blur):
+        """
+        Stand-in for adaptiveThreshold(blur, 255, GAUSSIAN_C, THRESH_BINARY_INV, TH_BLOCK, TH_C),
+        with the background reused while it is still fresh (see the class docstring for how
+        close the masks are).
+
+        Parameters:
+        blur : blurred grayscale crop
+
+        Return:
+        numpy.ndarray uint8 mask (0 / 255)
+        """
+        # a sparse sample is enough to notice the lights changing
+        brightness = float(blur[::8, ::8].mean())
+        if (self.limit is None or self.limit.shape != blur.shape or self.age >= self.refresh_frames
+                or abs(brightness - self.brightness) > self.brightness_shift):
+            self._build(blur)
+            self.brightness = brightness
+        self.age += 1
+        return cv2.compare(blur, self.limit, cv2.CMP_LT)
+
+
+def lane_mask(blur, background=None):
+    """
+    Dark lane tape on a light floor -> white blobs on black.
+
+    Parameters:
+    blur : blurred grayscale crop
+    background : optional BackgroundCache (reuses the local mean between frames)
+
+    Return:
+    numpy.ndarray uint8 mask
+    """
+    if background is None:
+        mask = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                     cv2.THRESH_BINARY_INV, TH_BLOCK, TH_C)
+    else:
+        mask = background.threshold(blur)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (MORPH_K, MORPH_K))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+    return mask
+
+def center_line(modeL, mL, bL, modeR, mR, bR, w, h):
+    """
+    Best fit line through the (smoothed) midpoints of the left and right lines.
+
+    Parameters:
+    modeL, mL, bL : left line from pleaseWork
+    modeR, mR, bR : right line from pleaseWork
+    w, h : crop size
+
+    Return:
+    p1, p2 : (x,y) integer tuples clipped to the crop
+    """
+    # get midpoints to draw the best fit line using averaging of the slope
+    midpoints = []
+
+    if modeL == "v" and modeR == "v":
+        ys = np.linspace(0, h-1, NUM_SAMPLES)
+        for yy in ys:
+            xL = mL*yy + bL
+            xR = mR*yy + bR
+            midpoints.append(((xL+xR)/2.0, yy))
+    elif modeL == "h" and modeR == "h":
+        xs = np.linspace(0, w-1, NUM_SAMPLES)
+        for xx in xs:
+            yL = mL*xx + bL
+            yR = mR*xx + bR
+            midpoints.append((xx, (yL+yR)/2.0))
+    else:
+        ts = np.linspace(0.0, 1.0, NUM_SAMPLES)
+        for t in ts:
+            xx = t*(w-1)
+            yy = t*(h-1)
+            if modeL == "v":
+                xL = mL*yy + bL; yL = yy
+            else:
+                yL = mL*xx + bL; xL = xx
+            if modeR == "v":
+                xR = mR*yy + bR; yR = yy
+            else:
+                yR = mR*xx + bR; xR = xx
+            midpoints.append(((xL+xR)/2.0, (yL+yR)/2.0))
+
+    pts = np.array(midpoints)
+    xs = checkIfMoving(pts[:,0], SMOOTH_WIN)
+    ys = checkIfMoving(pts[:,1], SMOOTH_WIN)
+    mid_s = np.vstack((xs, ys)).T
+
+    # bunch of try/except so code dont break
+    err_v = err_h = 1e12
+    try:
+        mcv, bcv = np.polyfit(mid_s[:,1], mid_s[:,0], 1)
+        err_v = np.mean((mid_s[:,0] - (mcv*mid_s[:,1] + bcv))**2)
+    except Exception:
+        pass
+    try:
+        mch, bch = np.polyfit(mid_s[:,0], mid_s[:,1], 1)
+        err_h = np.mean((mid_s[:,1] - (mch*mid_s[:,0] + bch))**2)
+    except Exception:
+        pass
+
+    if err_v <= err_h:
+        p_top = (int(round(mcv*0 + bcv)), 0)
+        p_bot = (int(round(mcv*(h-1) + bcv)), h-1)
+    else:
+        p_top = (0, int(round(mch*0 + bch)))
+        p_bot = (w-1, int(round(mch*(w-1) + bch)))
+
+    def clip(p):
+        return (int(max(0,min(w-1,p[0]))), int(max(0,min(h-1,p[1]))))
+
+    return clip(p_top), clip(p_bot)
+
+def lines_from_mask(mask, offset=(CROP_X, CROP_Y)):
+    """
+    Pick the two biggest lane contours in the mask and fit the left, right and center lines.
+
+    Parameters:
+    mask : lane mask of the crop (from lane_mask)
+    offset : (x, y) of the crop in the full frame
+
+    Return:
+    list of (p1, p2, color) in full-frame coordinates: center (if it fits), left, right.
+    Empty if fewer than two lane contours were found.
+    """
+    h, w = mask.shape[:2]
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    good = []
+    for cnt in contours:
+        al = cv2.arcLength(cnt, closed=False)
+        area = cv2.contourArea(cnt)
+        if al >= MIN_ARCLEN and area >= MIN_AREA:
+            good.append((al, cnt))
+
+    # fallback: if we don't have 2 big contours, take top few by area (like before)
+    if len(good) < 2:
+        contours_sorted = sorted(contours, key=lambda c: cv2.contourArea(c), reverse=True)
+        for cnt in contours_sorted[:3]:
+            if cv2.contourArea(cnt) >= 50:
+                good.append((cv2.arcLength(cnt, False), cnt))
+
+    good = sorted(good, key=lambda x: x[0], reverse=True)[:2]
+
+    fullframe_lines = []
+    if len(good) < 2:
+        return fullframe_lines
+
+    cntA = good[0][1]
+    cntB = good[1][1]
+
+    def mean_x(cnt):
+        pts = cnt.reshape(-1,2)
+        return pts[:,0].mean()
+
+    if mean_x(cntA) <= mean_x(cntB):
+        left_cnt, right_cnt = cntA, cntB
+    else:
+        left_cnt, right_cnt = cntB, cntA
+
+    modeL, mL, bL, _ = pleaseWork(left_cnt)
+    modeR, mR, bR, _ = pleaseWork(right_cnt)
+
+    # add the cropped frame x and y to the lines so that the lines don't show in the wrong place for the main frame
+    ox, oy = offset
+    def shift(p):
+        return (p[0] + ox, p[1] + oy)
+
+    p1, p2 = center_line(modeL, mL, bL, modeR, mR, bR, w, h)
+    fullframe_lines.append((shift(p1), shift(p2), CENTER_COLOR))
+
+    pL1, pL2 = extendLines(modeL, mL, bL, w, h)
+    fullframe_lines.append((shift(pL1), shift(pL2), LEFT_COLOR))
+
+    pR1, pR2 = extendLines(modeR, mR, bR, w, h)
+    fullframe_lines.append((shift(pR1), shift(pR2), RIGHT_COLOR))
+    return fullframe_lines
+
+def detect_lanes(frame, background=None):
+    """
+    Run the lane fitter on one BGR frame (no camera, no drawing, no server needed).
+
+    Parameters:
+    frame : BGR image, normally FRAME_W x FRAME_H
+    background : optional BackgroundCache, kept from frame to frame of one stream
+
+    Return:
+    list of (p1, p2, color) lines in full-frame coordinates (see lines_from_mask)
+    """
+    x1, y1, x2, y2 = crop_box(frame.shape[1], frame.shape[0])
+    gray = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+    blur = cv2.GaussianBlur(gray, (BLUR_K, BLUR_K), 0)
+    return lines_from_mask(lane_mask(blur, background), (x1, y1))
+
+def draw_lanes(frame, fullframe_lines):
+    """
+    Draw the crop box and the lane lines on the frame (in place).
+
+    Parameters:
+    frame : BGR image
+    fullframe_lines : from detect_lanes
+
+    Return:
+    None
+    """
+    x1, y1, x2, y2 = crop_box(frame.shape[1], frame.shape[0])
+    # draw crop rectangle box
+    cv2.rectangle(frame, (x1, y1), (x2, y2), (0,0,255), 2)
+
+    # draw all lines on the main frame instead of just crop
+    for (pa, pb, col) in fullframe_lines:
+        cv2.line(frame, pa, pb, col, LINE_THICK)
+
+def benchmark_background(frames=300, seed=0):
+    """
+    Time adaptiveThreshold against BackgroundCache on a synthetic drifting-lane clip
+    (with some glare and noise), and check how well their masks agree. The first
+    BackgroundCache row rebuilds every frame at scale 1, so it has to match exactly.
+    """
+    import synthetic
+
+    rng = np.random.default_rng(seed)
+    blurs = []
+    for frame, _ in synthetic.lane_frames(rng, frames, **synthetic.CONDITIONS["hard"]):
+        x1, y1, x2, y2 = crop_box(frame.shape[1], frame.shape[0])
+        gray = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+        blurs.append(cv2.GaussianBlur(gray, (BLUR_K, BLUR_K), 0))
+
+    def timed(fn):
+        start = time.perf_counter()
+        masks = [fn(blur) for blur in blurs]
+        return masks, (time.perf_counter() - start) / frames * 1000
+
+    reference, ref_ms = timed(lambda blur: cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                                                 cv2.THRESH_BINARY_INV, TH_BLOCK, TH_C))
+    print(f"{'adaptiveThreshold':>24}: {ref_ms:.3f} ms/frame")
+    for scale, refresh in ((1, 1), (1, BG_REFRESH_FRAMES), (BG_SCALE, BG_REFRESH_FRAMES)):
+        cache = BackgroundCache(refresh_frames=refresh, scale=scale)
+        masks, ms = timed(cache.threshold)
+        differing = sum(bool(np.any(m != r)) for m, r in zip(masks, reference))
+        agree = np.mean([np.mean(m == r) for m, r in zip(masks, reference)])
+        inter = sum(int(np.count_nonzero(m & r)) for m, r in zip(masks, reference))
+        union = sum(int(np.count_nonzero(m | r)) for m, r in zip(masks, reference))
+        # the masks after the morphology, which is what the contours are found on
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (MORPH_K, MORPH_K))
+        def clean(m):
+            m = cv2.morphologyEx(m, cv2.MORPH_CLOSE, kernel, iterations=2)
+            return cv2.morphologyEx(m, cv2.MORPH_OPEN, kernel, iterations=1)
+        agree_clean = np.mean([np.mean(clean(m) == clean(r)) for m, r in zip(masks, reference)])
+        print(f"{f'scale={scale} refresh={refresh}':>24}: {ms:.3f} ms/frame ({ref_ms / ms:.1f}x), "
+              f"{cache.rebuilds} rebuilds, {differing}/{frames} frames differ, pixels agreeing {agree:.2%} "
+              f"(after morphology {agree_clean:.2%}), foreground IoU {inter / max(union, 1):.3f}")
+
+
+def main():
+    """
+    python lanes.py [frames] : benchmark the cached background against adaptiveThreshold
+    """
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    benchmark_background(frames)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Memory Watch
+v1.0.0
+1. rss_bytes(): resident memory of this process right now (/proc/self/statm)
+2. MemoryTracker wraps tracemalloc: start() begins tracing and takes a
+   baseline snapshot; diff() takes a new snapshot and lists the allocation
+   sites that grew the most since the baseline (numpy arrays, and so OpenCV
+   images, are traced too); stop() ends tracing and its overhead
+3. Tracing is only on between start() and stop(), so a server that never
+   asks pays nothing
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# stack depth recorded per allocation (deeper = more useful sites, more overhead)
+MEMORY_FRAMES = 10
+TOP_SITES = 20
+
+# allocations by the tracing machinery itself
+_IGNORED = (tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"))
+
+
+def rss_bytes():
+    """
+    Resident set size of this process (falls back to the peak RSS where /proc is missing).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryTracker:
+    """
+    tracemalloc snapshots diffed against a baseline. Safe to share between threads.
+
+    Parameters:
+    frames : stack depth recorded per allocation
+
+    Return:
+    None
+    """
+    def __init__(self, frames=MEMORY_FRAMES):
+        self.frames = frames
+        self._baseline = None
+        self._baseline_time = None
+        self._baseline_rss = None
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        """
+        Start tracing (if it is not on) and take the baseline everything is compared to.
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            self._baseline = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+            self._baseline_time = time.time()
+            self._baseline_rss = rss_bytes()
+        return self.summary()
+
+    def stop(self):
+        with self._lock:
+            self._baseline = None
+            tracemalloc.stop()
+        return self.summary()
+
+    def summary(self):
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {"tracing": tracemalloc.is_tracing(), "rss": rss_bytes(), "traced": traced, "traced_peak": peak,
+                "baseline_time": self._baseline_time, "baseline_rss": self._baseline_rss}
+
+    def diff(self, top=TOP_SITES, group_by="lineno"):
+        """
+        Allocation sites that changed most since the baseline.
+
+        Parameters:
+        top : how many sites
+        group_by : "lineno" (one line), "traceback" (the whole recorded stack) or "filename"
+
+        Return:
+        dict: summary() + "sites": [{"site", "size", "size_diff", "count", "count_diff"}]
+              (sizes in bytes); "sites" is None if tracing is off
+        """
+        with self._lock:
+            if self._baseline is None:
+                return {**self.summary(), "sites": None}
+            snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+            stats = snapshot.compare_to(self._baseline, group_by)
+        sites = []
+        for stat in stats[:top]:
+            frames = stat.traceback if group_by == "traceback" else stat.traceback[:1]
+            sites.append({"site": " <- ".join(f"{os.path.basename(f.filename)}:{f.lineno}" for f in frames),
+                          "size": stat.size, "size_diff": stat.size_diff,
+                          "count": stat.count, "count_diff": stat.count_diff})
+        return {**self.summary(), "sites": sites}
+
+
+def main():
+    """
+    Self-check: grow a list between baseline and diff and find the line that did it.
+    """
+    tracker = MemoryTracker()
+    tracker.start()
+    leak = [bytes(1000) for _ in range(5000)]  # the "leak"
+    result = tracker.diff(top=3)
+    tracker.stop()
+    for site in result["sites"]:
+        print(f"  {site['size_diff'] / 1024:8.1f} KiB  {site['count_diff']:+6d}  {site['site']}")
+    ok = result["sites"][0]["site"].startswith("memory_watch.py:") and result["sites"][0]["size_diff"] >= 5000 * 1000
+    print(f"rss {result['rss'] / 2 ** 20:.1f} MiB, {len(leak)} objects kept: {'ok' if ok else 'FAILED'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
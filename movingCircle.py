@@ -1,29 +1,216 @@
 # Moving Circle Detection
-# v1.0.1
+# v1.4.0
 # 1. Import necessary libraries: OpenCV (cv2) for image processing, NumPy (np) for numerical operations, and sys for system-specific functions.
 # 2. Define a function `detect_can_bottom_video` that takes the path to a video file as input.
 # 3. Inside the function, attempt to open the video file. If it fails, raise an error.
-# 4. Initialize a frame counter.
+# 4. Create an AdaptiveScheduler for the video's frame rate and CPU budget.
 # 5. Start a continuous loop to read frames from the video.
 # 6. If a frame cannot be read (end of video), break the loop.
-# 7. Process only every fifth frame to improve performance.
-# 8. Convert the frame to grayscale and apply a Gaussian blur to reduce noise.
-# 9. Use the OpenCV `HoughCircles` function to detect circles within the processed image.
-# 10. If any circles are found, sort them to identify the largest one, which is assumed to be the can bottom.
-# 11. Draw the largest detected circle and its center point on the original color frame.
-# 12. Print the center coordinates (cx, cy) and radius of the detected circle to the console.
+# 7. Ask the AdaptiveScheduler whether this frame is worth detecting on: it compares a tiny downsampled copy of the frame
+#    with the last detected one (motion) and keeps detection within a CPU budget, forcing a detection every MAX_SKIP frames.
+# 8. Call `find_can_bottom` (through a `CanTracker`, which only searches a crop around where the can should be
+#    and with a narrowed radius range, and falls back to the full frame after a few misses), which converts the frame to grayscale and applies a Gaussian blur to reduce noise,
+# 9. uses the OpenCV `HoughCircles` function (or, with --ransac, a RANSAC fit to the edge points) to detect circles,
+# 10. and if any circles are found, returns the largest one, which is assumed to be the can bottom.
+# 11. Draw the last detected circle and its center point on the original color frame.
+# 12. Print the center coordinates (cx, cy) and radius of each new detection to the console.
 # 13. Display the resulting frame with the drawn circle in a window.
-# 14. Wait for a short period and check if the 'q' key is pressed; if so, break the loop.
+# 14. Wait for the rest of the frame's time slot and check if the 'q' key is pressed; if so, break the loop.
 # 15. After the loop, release the video capture object and close all OpenCV windows.
-# 16. Define a `main` function to call the `detect_can_bottom_video` function with a specific video file name (`movie.mp4`).
+# 16. Define a `main` function to call the `detect_can_bottom_video` function with a video file name (`movie.mp4` by default),
+#     or `evaluate_scheduler` with --evaluate to compare detection rate and accuracy against detecting every frame.
 # 17. The script execution starts here, calling the `main` function if the script is run directly.
 
 import cv2 
 import numpy as np 
 import sys 
+import time 
+from circle_detect import detect_circle_ransac
+
+# Radius range of the can bottom in pixels
+MIN_RADIUS = 90
+MAX_RADIUS = 105
+
+# Find the can bottom in one frame (no drawing, no windows), so other tools can reuse it.
+# window=(x0, y0, x1, y1) searches only that part of the frame; the result is still in frame coordinates.
+# engine="hough" uses HoughCircles, engine="ransac" fits a circle to the Canny edge points (circle_detect.py)
+# gray: the whole frame already grayscaled (the server's stages share it), to skip that step; only the
+# searched window is blurred either way
+def find_can_bottom(frame, window=None, min_radius=MIN_RADIUS, max_radius=MAX_RADIUS, engine="hough", gray=None):
+    x0, y0 = 0, 0
+    if window is not None:
+        x0, y0, x1, y1 = window
+        frame = frame[y0:y1, x0:x1]
+        if gray is not None:
+            gray = gray[y0:y1, x0:x1]
+
+    if gray is None:
+        # Convert the frame to grayscale for circle detection
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    # Apply Gaussian blur to reduce noise and help with circle detection
+    gray = cv2.GaussianBlur(gray, (9, 9), 2)
+
+    # Get the height of the image, used for setting the minimum distance between circles
+    img_height = gray.shape[0]
+
+    if engine == "ransac":
+        # A window is centered on where the can should be, so only edges in the radius band around it count
+        center = (gray.shape[1] / 2, gray.shape[0] / 2) if window is not None else None
+        found = detect_circle_ransac(gray, min_radius, max_radius, param1=120, center=center)
+        if found is None:
+            return None
+        cx, cy, radius = (int(round(v)) for v in found)
+        return cx + x0, cy + y0, radius
+
+    # Detect circles using the Hough Circle Transform
+    circles = cv2.HoughCircles(
+        gray, # Input image (grayscale)
+        cv2.HOUGH_GRADIENT, # Detection method
+        dp=1.2, # Inverse ratio of the accumulator resolution to the image resolution
+        minDist=max(1, img_height // 2), # Minimum distance between the centers of detected circles
+        param1=120, # Gradient value threshold for Canny edge detector (higher threshold)
+        param2=80, # Accumulator threshold for the circle centers (lower threshold)
+        minRadius=min_radius, # Minimum circle radius to detect
+        maxRadius=max_radius # Maximum circle radius to detect
+    )
+
+    # No circles found
+    if circles is None:
+        return None
+
+    # Convert the (x, y, radius) coordinates to integers
+    circles = np.uint16(np.around(circles[0]))
+
+    # Pick the largest circle found (assumed to be the can bottom)
+    cx, cy, radius = max(circles, key=lambda c: c[2])
+    return int(cx) + x0, int(cy) + y0, int(radius)
+
+# Extra pixels searched around the predicted can (on top of its radius), per side
+SEARCH_MARGIN = 40
+# How far the radius may change between detections
+RADIUS_SLACK = 6
+# Misses in a row before going back to searching the whole frame
+MAX_MISSES = 3
+
+# Tracking mode: once the can is found, look for it only in a crop around where it should be now
+# (constant velocity from the last two hits) with a narrow radius window. Each miss widens the crop;
+# after MAX_MISSES misses in a row the whole frame is searched again.
+class CanTracker:
+    def __init__(self, max_misses=MAX_MISSES, margin=SEARCH_MARGIN, radius_slack=RADIUS_SLACK, engine="hough"):
+        self.engine = engine
+        self.max_misses = max_misses
+        self.margin = margin
+        self.radius_slack = radius_slack
+        self.center = None # (x, y) of the last hit
+        self.velocity = (0.0, 0.0) # Pixels per frame
+        self.radius = None
+        self.last_frame = 0 # Frame number of the last hit
+        self.misses = 0
+        self.full_searches = 0
+
+    # Where the can should be in frame number frame_number
+    def predict(self, frame_number):
+        gap = frame_number - self.last_frame
+        return self.center[0] + self.velocity[0] * gap, self.center[1] + self.velocity[1] * gap
+
+    # Find the can in this frame; frame_number lets skipped frames be accounted for in the prediction
+    # (gray: optional grayscale of the whole frame, see find_can_bottom)
+    def detect(self, frame, frame_number, gray=None):
+        if self.center is None or self.misses >= self.max_misses:
+            self.full_searches += 1
+            found = find_can_bottom(frame, engine=self.engine, gray=gray)
+        else:
+            px, py = self.predict(frame_number)
+            height, width = frame.shape[:2]
+            reach = self.radius + self.radius_slack + self.margin * (1 + self.misses)
+            window = (max(0, int(px - reach)), max(0, int(py - reach)),
+                      min(width, int(px + reach)), min(height, int(py + reach)))
+            if window[2] - window[0] < 2 * MIN_RADIUS or window[3] - window[1] < 2 * MIN_RADIUS:
+                found = None # The prediction ran off the frame
+            else:
+                found = find_can_bottom(frame, window,
+                                        max(MIN_RADIUS, self.radius - self.radius_slack),
+                                        min(MAX_RADIUS, self.radius + self.radius_slack),
+                                        self.engine, gray)
+
+        if found is None:
+            self.misses += 1
+            if self.misses > self.max_misses:
+                self.center = None # Lost it; the next frame searches everything
+            return None
+
+        cx, cy, radius = found
+        if self.center is not None:
+            gap = max(1, frame_number - self.last_frame)
+            self.velocity = ((cx - self.center[0]) / gap, (cy - self.center[1]) / gap)
+        else:
+            self.velocity = (0.0, 0.0) # Reacquired: the old motion says nothing about the new position
+        self.center = (cx, cy)
+        self.radius = radius
+        self.last_frame = frame_number
+        self.misses = 0
+        return found
+
+# Share of one core the detector may use on average (0.3 = 30%)
+CPU_BUDGET = 0.3
+# Mean absolute difference (0-255) between downsampled frames that counts as the can moving
+MOTION_THRESHOLD = 3.0
+# Always detect at least this often, even in a still scene or over budget
+MAX_SKIP = 15
+# Width of the downsampled frame used for the motion check
+MOTION_WIDTH = 80
+
+# Decides per frame whether running HoughCircles is worth it.
+# It keeps a running estimate of what one detection costs, earns "CPU credit" every frame
+# (budget x frame time), and measures scene change with a tiny downsampled frame difference
+# against the last frame it detected on. Detection runs when the scene moved and there is
+# credit for it, or when MAX_SKIP frames went by without one.
+class AdaptiveScheduler:
+    def __init__(self, fps=30.0, cpu_budget=CPU_BUDGET, motion_threshold=MOTION_THRESHOLD, max_skip=MAX_SKIP):
+        self.frame_time = 1.0 / fps
+        self.cpu_budget = cpu_budget
+        self.motion_threshold = motion_threshold
+        self.max_skip = max_skip
+        self.cost = None # Running average of seconds per detection
+        self.credit = 0.0 # Seconds of detection we can still afford
+        self.reference = None # Small gray copy of the last frame we detected on
+        self.small = None
+        self.skipped = 0
+        self.frames = 0
+        self.detections = 0
+
+    # Cheap scene change score: shrink first, then grayscale and diff (a few hundred pixels)
+    def motion(self, frame):
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (MOTION_WIDTH, max(1, height * MOTION_WIDTH // width)), interpolation=cv2.INTER_AREA)
+        self.small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if self.reference is None:
+            return float("inf")
+        return float(cv2.absdiff(self.small, self.reference).mean())
+
+    # Returns True if the detector should run on this frame
+    def should_detect(self, frame):
+        self.frames += 1
+        # Earn credit for this frame, but never save up more than MAX_SKIP frames' worth
+        self.credit = min(self.credit + self.cpu_budget * self.frame_time, self.cpu_budget * self.frame_time * self.max_skip)
+        moved = self.motion(frame) >= self.motion_threshold
+        affordable = self.cost is None or self.credit >= self.cost
+        if self.skipped + 1 >= self.max_skip or (moved and affordable):
+            return True
+        self.skipped += 1
+        return False
+
+    # Tell the scheduler a detection ran and how long it took
+    def record(self, seconds):
+        self.cost = seconds if self.cost is None else 0.8 * self.cost + 0.2 * seconds
+        self.credit -= seconds
+        self.reference = self.small
+        self.skipped = 0
+        self.detections += 1
 
 # Define the function to perform can bottom detection in a video 
-def detect_can_bottom_video(video_path): 
+def detect_can_bottom_video(video_path, cpu_budget=CPU_BUDGET, tracking=True, engine="hough"): 
     # Open the video file
     cap = cv2.VideoCapture(video_path) 
 
@@ -32,9 +219,16 @@ def detect_can_bottom_video(video_path):
         # Raise an error if the file cannot be opened
         raise IOError(f"Cannot open video stream or file: {video_path}") 
 
+    # Play back at the file's own frame rate
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    scheduler = AdaptiveScheduler(fps, cpu_budget)
+    tracker = CanTracker(engine=engine) if tracking else None
+    last_found = None
     frameNumber = 0
+
     # Loop through each frame in the video
     while True: 
+        frame_start = time.perf_counter()
         # Read the next frame
         ret, frame = cap.read() 
 
@@ -42,65 +236,147 @@ def detect_can_bottom_video(video_path):
         if not ret: 
             break
 
-        # Process only every 5th frame for efficiency
-        if frameNumber % 5 == 0:
-            # Convert the frame to grayscale for circle detection
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) 
-
-            # Apply Gaussian blur to reduce noise and help with circle detection
-            gray = cv2.GaussianBlur(gray, (9, 9), 2) 
+        # Only run the detector when the scheduler says the frame is worth it
+        if scheduler.should_detect(frame):
+            t0 = time.perf_counter()
+            # Search near the last known can when tracking, else the whole frame
+            found = tracker.detect(frame, frameNumber) if tracker else find_can_bottom(frame, engine=engine)
+            scheduler.record(time.perf_counter() - t0)
 
-            # Create a copy of the original frame to draw the detection results on
-            output = frame.copy() 
+            # Keep the last circle if this frame had none
+            if found is not None:
+                last_found = found
 
-            # Get the height of the image, used for setting the minimum distance between circles
-            img_height = gray.shape[0] 
-
-            # Detect circles using the Hough Circle Transform
-            circles = cv2.HoughCircles(
-                gray, # Input image (grayscale)
-                cv2.HOUGH_GRADIENT, # Detection method
-                dp=1.2, # Inverse ratio of the accumulator resolution to the image resolution
-                minDist=img_height // 2, # Minimum distance between the centers of detected circles
-                param1=120, # Gradient value threshold for Canny edge detector (higher threshold)
-                param2=80, # Accumulator threshold for the circle centers (lower threshold)
-                minRadius=90, # Minimum circle radius to detect
-                maxRadius=105 # Maximum circle radius to detect
-            ) 
-
-            # If circles are found
-            if circles is not None:
-                # Convert the (x, y, radius) coordinates to integers
-                circles = np.uint16(np.around(circles[0])) 
+                # Print the center coordinates and radius to the console
+                print(*found) 
 
-                # Pick the largest circle found (assumed to be the can bottom)
-                cx, cy, radius = max(circles, key=lambda c: c[2]) 
+        # Create a copy of the original frame to draw the detection results on
+        output = frame.copy() 
 
-                # Draw the outer circle on the output frame
-                cv2.circle(output, (cx, cy), radius, (0, 255, 67), 4) # Green color, thickness 4
+        if last_found is not None:
+            cx, cy, radius = last_found
 
-                # Draw the center of the circle on the output frame
-                cv2.circle(output, (cx, cy), 4, (0, 255, 67), -1) # Green color, filled
+            # Draw the outer circle on the output frame
+            cv2.circle(output, (cx, cy), radius, (0, 255, 67), 4) # Green color, thickness 4
 
-                # Print the center coordinates and radius to the console
-                print(cx, cy, radius) 
+            # Draw the center of the circle on the output frame
+            cv2.circle(output, (cx, cy), 4, (0, 255, 67), -1) # Green color, filled
 
-            # Display the resulting frame with detections
-            cv2.imshow("Rolling Soda Can Detection (HoughCircles)", output) 
+        # Display the resulting frame with detections
+        cv2.imshow("Rolling Soda Can Detection (HoughCircles)", output) 
 
         frameNumber += 1
+        # Wait only for what is left of this frame's time slot
+        remaining_ms = int((1.0 / fps - (time.perf_counter() - frame_start)) * 1000)
         # Break the loop if the 'q' key is pressed
-        if cv2.waitKey(24) & 0xFF == ord('q'): 
+        if cv2.waitKey(max(1, remaining_ms)) & 0xFF == ord('q'): 
             break
 
     # Release the video capture object and close all OpenCV windows
     cap.release() 
     cv2.destroyAllWindows() 
+    print(f"Detected on {scheduler.detections} of {scheduler.frames} frames") 
+
+# Compare the scheduler against detecting on every frame of a clip:
+# how often it detects, how much detector time it uses, and how far its (held) circle is from the full result
+def evaluate_scheduler(video_path, cpu_budget=CPU_BUDGET, tolerance=10):
+    # Pass 1: reference result and cost of every frame
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video stream or file: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    reference = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        t0 = time.perf_counter()
+        found = find_can_bottom(frame)
+        reference.append((found, time.perf_counter() - t0))
+    cap.release()
+
+    # Pass 2: the scheduler decides, reusing pass 1's results and timings for the frames it picks
+    cap = cv2.VideoCapture(video_path)
+    scheduler = AdaptiveScheduler(fps, cpu_budget)
+    held = None
+    matches = 0
+    errors = []
+    spent = 0.0
+    for found, seconds in reference:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if scheduler.should_detect(frame):
+            scheduler.record(seconds)
+            spent += seconds
+            if found is not None:
+                held = found
+        if found is None or held is None:
+            matches += (found is None) == (held is None)
+        else:
+            error = np.hypot(found[0] - held[0], found[1] - held[1])
+            errors.append(error)
+            matches += error <= tolerance
+    cap.release()
+
+    frames = len(reference)
+    full_cost = sum(seconds for _, seconds in reference)
+    print(f"frames: {frames}, detections: {scheduler.detections} ({scheduler.detections / max(frames, 1):.0%} of frames)")
+    print(f"detector time: {spent:.2f} s vs {full_cost:.2f} s detecting every frame ({spent / max(full_cost, 1e-9):.0%})")
+    print(f"frames within {tolerance}px of the every-frame result: {matches / max(frames, 1):.1%}, "
+          f"mean center error: {np.mean(errors) if errors else 0:.1f}px")
+
+# Compare tracking mode against the full-frame search on every frame of a clip:
+# milliseconds per frame and how often each one finds the can
+def benchmark_tracking(video_path, tolerance=10):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video stream or file: {video_path}")
+    tracker = CanTracker()
+    frames = 0
+    full_time = track_time = 0.0
+    full_hits = track_hits = agree = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        t0 = time.perf_counter()
+        full = find_can_bottom(frame)
+        t1 = time.perf_counter()
+        tracked = tracker.detect(frame, frames)
+        t2 = time.perf_counter()
+        full_time += t1 - t0
+        track_time += t2 - t1
+        full_hits += full is not None
+        track_hits += tracked is not None
+        if full is not None and tracked is not None:
+            agree += np.hypot(full[0] - tracked[0], full[1] - tracked[1]) <= tolerance
+        frames += 1
+    cap.release()
+
+    frames = max(frames, 1)
+    print(f"full frame: {full_time / frames * 1000:.2f} ms/frame, hit rate {full_hits / frames:.1%}")
+    print(f"tracking:   {track_time / frames * 1000:.2f} ms/frame, hit rate {track_hits / frames:.1%}, "
+          f"{tracker.full_searches} full-frame searches")
+    print(f"tracked hits within {tolerance}px of the full-frame circle: {agree / max(min(full_hits, track_hits), 1):.1%}")
 
 # Main function to run the script
 def main(): 
-    # Call the detection function with a specific video file path
-    detect_can_bottom_video("movie.mp4") 
+    # Video file path from the command line (movie.mp4 if none)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    video_path = args[0] if args else "movie.mp4"
+
+    # --evaluate: report detection rate vs accuracy instead of showing the video
+    if "--evaluate" in sys.argv:
+        evaluate_scheduler(video_path)
+    # --benchmark-tracking: compare tracking mode with the full-frame search
+    elif "--benchmark-tracking" in sys.argv:
+        benchmark_tracking(video_path)
+    else:
+        # Call the detection function with the video file path
+        # (--full-frame turns tracking off, --ransac picks the edge-fit circle engine)
+        detect_can_bottom_video(video_path, tracking="--full-frame" not in sys.argv,
+                                engine="ransac" if "--ransac" in sys.argv else "hough") 
     return 0
 
 # Entry point of the script
@@ -1,40 +1,33 @@
 """
 Circle Detection Code
-v1.0.0
+v1.2.0
 1. Load the input image from file
 2. Convert the image to grayscale
-3. Apply Gaussian blur to reduce noise
-4. Determine the image height and compute minimum
+3. Determine the image height and compute minimum
    and maximum allowable circle radii
-5. Use the Hough Circle Transform to detect circles
-   in the image
+4. Detect the circle (circle_detect.py) with the chosen engine:
+   "hough" runs the Hough Circle Transform on a small
+   blurred pyramid level, keeping the circle with the
+   largest radius (the outer edge of the soda can);
+   "ransac" fits circles to the Canny edge points
+5. Refine its center and radius with a least-squares
+   fit on full-resolution edge points
 6. If no circles are detected, stop execution
-7. Round and convert detected circle parameters
-   to integer values
-8. Select the circle with the largest radius,
-   assuming it corresponds to the outer edge
-   of the soda can
-9. Draw the detected circle and its center
+7. Round the circle parameters to integer values
+8. Draw the detected circle and its center
    on a copy of the original image
-10. Display the resulting image in a window
+9. Display the resulting image in a window
+Steps 2-5 are find_can(), which needs no window (used by benchmark.py)
 """
 
 import cv2
-import numpy as np
 import sys
+from circle_detect import detect_circle
 
-def detect_can_bottom(image_path):
-    # Load the image in color format
-    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
-    if image is None:
-        raise FileNotFoundError("Image could not be loaded.")
-
+def find_can(image, engine="hough"):
     # Convert the image to grayscale for processing
     gray_img = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
-    # Apply Gaussian blur to reduce noise and smooth edges
-    gray_img = cv2.GaussianBlur(gray_img, (9, 9), 2)
-
     # Get the image height to scale circle size limits
     img_height = gray_img.shape[0]
 
@@ -42,28 +35,35 @@ def detect_can_bottom(image_path):
     r_min = int(img_height * 0.25)
     r_max = int(img_height * 0.60)
 
-    # Detect circles using the Hough Circle Transform
-    detected = cv2.HoughCircles(
+    # Detect the circle: "hough" runs the Hough Circle Transform coarse-to-fine (small blurred
+    # pyramid level, then refinement on full-resolution patches along its edge);
+    # "ransac" fits a circle to the Canny edge points directly (one dominant can)
+    return detect_circle(
         gray_img,
-        cv2.HOUGH_GRADIENT,
-        dp=1.0,
-        minDist=img_height,
+        min_radius=r_min,
+        max_radius=r_max,
+        engine=engine,
+        min_dist=img_height,
         param1=120,
-        param2=40,
-        minRadius=r_min,
-        maxRadius=r_max
+        param2=40
     )
 
+
+def detect_can_bottom(image_path, engine="hough"):
+    # Load the image in color format
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise FileNotFoundError("Image could not be loaded.")
+
+    # Find the can (no window; find_can is what other tools import)
+    detected = find_can(image, engine)
+
     # Stop execution if no circles are found
     if detected is None:
         raise RuntimeError("No circles detected.")
 
-    # Convert detected circle parameters to integer values
-    detected = np.int32(np.around(detected[0]))
-
-    # Select the circle with the largest radius (outer edge)
-    largest_circle = sorted(detected, key=lambda c: c[2], reverse=True)[0]
-    cx, cy, radius = largest_circle
+    # Convert the (largest) detected circle to integer values
+    cx, cy, radius = (int(round(v)) for v in detected)
 
     # Create a copy of the original image for drawing
     output = image.copy()
@@ -84,8 +84,8 @@ def main():
     # Specify the image file to process
     image_file = "soda_can_top.jpeg"
 
-    # Run the soda can bottom detection
-    detect_can_bottom(image_file)
+    # Run the soda can bottom detection (--ransac picks the edge-fit engine)
+    detect_can_bottom(image_file, engine="ransac" if "--ransac" in sys.argv else "hough")
     return 0
 
 
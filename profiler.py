@@ -0,0 +1,148 @@
+"""
+Sampling Profiler
+v1.0.0
+1. Off unless the flag file DEBUG_FLAG exists next to the server (create or
+   delete it while the server runs, no restart needed)
+2. A profile samples every thread in the process (vision loop, event loop,
+   recorder feed, ...) with sys._current_frames() for N seconds
+3. Each sample adds one count to the thread's whole stack ("collapsed"
+   format: thread;outer;...;inner count, one line per distinct stack, the
+   input of flamegraph.pl / speedscope) and one to its innermost function
+   (self time)
+4. Overhead is bounded: samples are taken every `interval`, and never more
+   often than keeps the sampler's own time under MAX_OVERHEAD of the wall
+   clock; profiles are capped at MAX_SECONDS and only one runs at a time
+5. Running this file directly profiles a busy demo thread and checks it is
+   at the top
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# the profiler only answers while this file exists
+DEBUG_FLAG = "debug.enabled"
+
+MAX_SECONDS = 30.0
+SAMPLE_INTERVAL = 0.005   # 200 samples per second
+MAX_OVERHEAD = 0.05       # share of wall time the sampler may use
+TOP_FUNCTIONS = 25
+
+_busy = threading.Lock()
+
+
+def debug_enabled(flag=DEBUG_FLAG):
+    """
+    True while the debug flag file exists.
+    """
+    return os.path.exists(flag)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds, interval=SAMPLE_INTERVAL, max_overhead=MAX_OVERHEAD):
+    """
+    Sample the stacks of every other thread for a while.
+
+    Parameters:
+    seconds : how long to sample
+    interval : time between samples
+    max_overhead : most share of the time spent taking samples
+
+    Return:
+    tuple: (Counter collapsed stack -> samples, Counter function -> self samples,
+            number of samples, seconds spent sampling)
+    """
+    me = threading.get_ident()
+    stacks = Counter()
+    self_time = Counter()
+    samples = 0
+    cost = 0.0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        t0 = time.perf_counter()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            self_time[_frame_name(frame)] += 1
+            names_in_stack = []
+            while frame is not None:
+                names_in_stack.append(_frame_name(frame))
+                frame = frame.f_back
+            names_in_stack.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(names_in_stack))] += 1
+        samples += 1
+        took = time.perf_counter() - t0
+        cost += took
+        # slow samples (many threads / deep stacks) space the next ones out
+        time.sleep(max(interval, took / max_overhead - took))
+    return stacks, self_time, samples, cost
+
+
+def profile(seconds, interval=SAMPLE_INTERVAL, top=TOP_FUNCTIONS):
+    """
+    Profile the running process.
+
+    Parameters:
+    seconds : how long (capped at MAX_SECONDS)
+    interval : time between samples
+    top : how many functions to list by self time
+
+    Return:
+    dict: {"seconds", "samples", "overhead", "collapsed": text, "top": [{"function", "self", "self_pct"}]},
+    or None if a profile is already running
+    """
+    if not _busy.acquire(blocking=False):
+        return None
+    try:
+        seconds = min(max(seconds, interval), MAX_SECONDS)
+        start = time.perf_counter()
+        stacks, self_time, samples, cost = sample_stacks(seconds, interval)
+        wall = time.perf_counter() - start
+    finally:
+        _busy.release()
+    thread_samples = sum(self_time.values()) or 1
+    return {
+        "seconds": round(wall, 3),
+        "samples": samples,
+        "overhead": round(cost / wall, 4) if wall else 0.0,
+        "collapsed": "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()),
+        "top": [{"function": name, "self": count, "self_pct": round(count / thread_samples * 100, 1)}
+                for name, count in self_time.most_common(top)],
+    }
+
+
+def _spin(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def main():
+    """
+    Self-check: profile a thread burning CPU next to one that sleeps.
+    """
+    stop = threading.Event()
+    threads = [threading.Thread(target=_spin, args=(stop,), name="spinner", daemon=True),
+               threading.Thread(target=stop.wait, name="sleeper", daemon=True)]
+    for t in threads:
+        t.start()
+    result = profile(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
+    stop.set()
+
+    spinner = [line for line in result["collapsed"].splitlines() if line.startswith("spinner;")]
+    print(f"{result['samples']} samples in {result['seconds']} s, overhead {result['overhead'] * 100:.2f}%")
+    for row in result["top"][:5]:
+        print(f"  {row['self_pct']:5.1f}%  {row['function']}")
+    ok = spinner and "_spin" in spinner[0] and result["overhead"] <= MAX_OVERHEAD * 1.5
+    print("ok" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
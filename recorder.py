@@ -0,0 +1,347 @@
+"""
+Background Recorder
+v1.0.0
+1. The vision loop hands every encoded frame to Recorder.put(), which only
+   copies it into a ring of fixed-size slots in shared memory (a /dev/shm
+   file, see control_state.py) and returns; it never waits
+2. Ring layout: [write count u64][read count u64][dropped u64][closed u64]
+   then slots of [length u32][pad u32][timestamp f64][jpeg bytes]. One writer
+   (the vision loop) and one reader (the recorder process): the writer only
+   moves the write count, the reader only the read count
+3. If the ring is full (the disk is slow) the frame is dropped and counted,
+   so capture is never held back
+4. The recorder process takes frames out in order and appends them to
+   .mjpeg files (JPEGs back to back), starting a new file every
+   segment_seconds of frame time
+5. After every segment (and at start) the oldest recordings are deleted until
+   the folder is under the disk quota
+6. Running this file directly measures the live-stream loop's frame latency
+   with recording off and on (and with a stalled disk)
+"""
+
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+
+from control_state import segment_path
+
+RECORD_DIR = "recordings"
+SEGMENT_SECONDS = 60
+DISK_QUOTA_BYTES = 2 * 1024 ** 3
+
+# ring: ~2 s of 30 fps frames, each at most RING_SLOT_BYTES
+RING_SLOTS = 64
+RING_SLOT_BYTES = 128 * 1024
+
+# how long the recorder sleeps when the ring is empty
+IDLE_SLEEP = 0.005
+
+_HEADER = 32  # write, read, dropped, closed (u64 each)
+_SLOT_HEADER = struct.Struct("<IId")  # length, pad, timestamp
+_WRITE, _READ, _DROPPED, _CLOSED = range(4)
+
+
+class FrameRing:
+    """
+    Single-producer single-consumer ring of encoded frames in a shared memory file.
+
+    Parameters:
+    name : name of the segment (in control_state.SHM_DIR)
+    slots, slot_bytes : ring size (only used by the creator)
+    create : True in the producer, False in the consumer
+
+    Return:
+    None
+    """
+    def __init__(self, name, slots=RING_SLOTS, slot_bytes=RING_SLOT_BYTES, create=False):
+        self.name = name
+        self.path = segment_path(name)
+        if create:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.ftruncate(fd, _HEADER + 16 + slots * (_SLOT_HEADER.size + slot_bytes))
+        else:
+            fd = os.open(self.path, os.O_RDWR)
+        self._mmap = mmap.mmap(fd, 0)
+        os.close(fd)
+        self.owner = create
+        self._buf = memoryview(self._mmap)
+        # aligned 8 byte counters, never seen half written
+        self._counters = self._buf[:_HEADER].cast("Q")
+        if create:
+            struct.pack_into("<QQ", self._buf, _HEADER, slots, slot_bytes)
+        self.slots, self.slot_bytes = struct.unpack_from("<QQ", self._buf, _HEADER)
+        self._stride = _SLOT_HEADER.size + self.slot_bytes
+        self._base = _HEADER + 16
+
+    @property
+    def written(self):
+        return self._counters[_WRITE]
+
+    @property
+    def read(self):
+        return self._counters[_READ]
+
+    @property
+    def dropped(self):
+        return self._counters[_DROPPED]
+
+    @property
+    def closed(self):
+        return self._counters[_CLOSED] != 0
+
+    def put(self, jpeg, timestamp):
+        """
+        Producer: copy one frame in, or drop it if the ring is full or the frame too big.
+
+        Return:
+        bool: True if the frame was queued
+        """
+        data = memoryview(jpeg).cast("B")
+        write = self._counters[_WRITE]
+        if write - self._counters[_READ] >= self.slots or len(data) > self.slot_bytes:
+            self._counters[_DROPPED] += 1
+            return False
+        start = self._base + (write % self.slots) * self._stride
+        _SLOT_HEADER.pack_into(self._buf, start, len(data), 0, timestamp)
+        self._buf[start + _SLOT_HEADER.size:start + _SLOT_HEADER.size + len(data)] = data
+        # publish only after the slot is complete
+        self._counters[_WRITE] = write + 1
+        return True
+
+    def get(self):
+        """
+        Consumer: take the oldest frame out.
+
+        Return:
+        tuple: (bytes, timestamp), or None if the ring is empty
+        """
+        read = self._counters[_READ]
+        if read == self._counters[_WRITE]:
+            return None
+        start = self._base + (read % self.slots) * self._stride
+        length, _, timestamp = _SLOT_HEADER.unpack_from(self._buf, start)
+        data = bytes(self._buf[start + _SLOT_HEADER.size:start + _SLOT_HEADER.size + length])
+        # the slot can be reused from here on
+        self._counters[_READ] = read + 1
+        return data, timestamp
+
+    def close(self):
+        """
+        Tell the consumer no more frames come (it drains what is left, then stops).
+        """
+        self._counters[_CLOSED] = 1
+
+    def release(self):
+        self._counters.release()
+        self._buf.release()
+        self._mmap.close()
+        if self.owner:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def enforce_quota(folder, quota_bytes, keep=None):
+    """
+    Delete the oldest recordings until the folder is under the quota.
+
+    Parameters:
+    folder : recording folder
+    quota_bytes : most bytes the .mjpeg files may take
+    keep : path never deleted (the file being written)
+
+    Return:
+    list of deleted paths
+    """
+    files = []
+    for name in os.listdir(folder):
+        if name.endswith(".mjpeg"):
+            path = os.path.join(folder, name)
+            files.append((os.path.getmtime(path), os.path.getsize(path), path))
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    deleted = []
+    for _, size, path in files:
+        if total <= quota_bytes:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total -= size
+        deleted.append(path)
+    return deleted
+
+
+def record(ring_name, folder=RECORD_DIR, segment_seconds=SEGMENT_SECONDS, quota_bytes=DISK_QUOTA_BYTES):
+    """
+    Recorder process main loop: drain the ring into time-segmented .mjpeg files.
+
+    Parameters:
+    ring_name : FrameRing segment to read from
+    folder : where the segments go
+    segment_seconds : frame time per file
+    quota_bytes : disk quota for the folder
+
+    Return:
+    None
+    """
+    ring = FrameRing(ring_name)
+    os.makedirs(folder, exist_ok=True)
+    enforce_quota(folder, quota_bytes)
+    out = None
+    path = None
+    segment_start = None
+    try:
+        while True:
+            item = ring.get()
+            if item is None:
+                if ring.closed:
+                    break
+                time.sleep(IDLE_SLEEP)
+                continue
+            data, timestamp = item
+            if out is None or timestamp - segment_start >= segment_seconds:
+                if out is not None:
+                    out.close()
+                    enforce_quota(folder, quota_bytes)
+                segment_start = timestamp
+                stamp = datetime.fromtimestamp(timestamp).strftime("%Y%m%d_%H%M%S_%f")[:-3]
+                path = os.path.join(folder, f"rec_{stamp}.mjpeg")
+                out = open(path, "ab")
+            out.write(data)
+    finally:
+        if out is not None:
+            out.close()
+            enforce_quota(folder, quota_bytes, keep=path)
+        ring.release()
+
+
+class Recorder:
+    """
+    Starts the recorder process and feeds it. put() is what the vision loop calls per frame.
+
+    Parameters:
+    folder, segment_seconds, quota_bytes : see record()
+    slots, slot_bytes : ring size
+    target : function run in the recorder process (record, or a stand-in for testing)
+
+    Return:
+    None
+    """
+    def __init__(self, folder=RECORD_DIR, segment_seconds=SEGMENT_SECONDS, quota_bytes=DISK_QUOTA_BYTES,
+                 slots=RING_SLOTS, slot_bytes=RING_SLOT_BYTES, target=record):
+        self.folder = folder
+        self._final = None  # stats at close(), once the ring is gone
+        self.ring = FrameRing(f"pwp_record_{os.getpid()}", slots, slot_bytes, create=True)
+        # spawn: the server has threads running, a forked child would inherit their locks
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(target=target, name="recorder", daemon=True,
+                                       args=(self.ring.name, folder, segment_seconds, quota_bytes))
+        self.process.start()
+
+    def put(self, jpeg, timestamp=None):
+        """
+        Queue one encoded frame for recording; never blocks (drops if the recorder is behind).
+        """
+        return self.ring.put(jpeg, time.time() if timestamp is None else timestamp)
+
+    def stats(self):
+        if self._final is not None:
+            return self._final
+        return {"folder": self.folder, "alive": self.process.is_alive(), "queued": self.ring.written,
+                "recorded": self.ring.read, "dropped": self.ring.dropped,
+                "backlog": self.ring.written - self.ring.read}
+
+    def close(self, timeout=5.0):
+        """
+        Let the recorder finish what is queued, then stop it and remove the ring.
+        """
+        self.ring.close()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self._final = self.stats()
+        self.ring.release()
+
+
+def _stalled_record(ring_name, folder, segment_seconds, quota_bytes):
+    # a disk that takes 100 ms per frame
+    import recorder
+    real_open = open
+
+    class SlowFile:
+        def __init__(self, path, mode):
+            self.f = real_open(path, mode)
+
+        def write(self, data):
+            time.sleep(0.1)
+            self.f.write(data)
+
+        def close(self):
+            self.f.close()
+
+    recorder.open = SlowFile
+    recorder.record(ring_name, folder, segment_seconds, quota_bytes)
+
+
+def main():
+    """
+    Live-stream latency with recording off / on / on with a stalled disk: a 30 fps loop that
+    "processes" each frame (~10 ms of work), publishes it, and records it if enabled.
+    Latency = capture to published; it must not change with recording on.
+    """
+    import tempfile
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    payloads = [bytes([i]) * 40000 for i in range(10)]
+
+    def run(recorder):
+        latencies = []
+        next_frame = time.perf_counter()
+        for i in range(frames):
+            captured = time.perf_counter()
+            end = captured + 0.010
+            while time.perf_counter() < end:  # vision work
+                pass
+            jpeg = payloads[i % len(payloads)]
+            if recorder is not None:
+                recorder.put(jpeg)
+            latencies.append((time.perf_counter() - captured) * 1000)
+            next_frame += 1 / 30
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+        latencies.sort()
+        return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+    with tempfile.TemporaryDirectory() as folder:
+        off = run(None)
+        rec = Recorder(folder, segment_seconds=2)
+        time.sleep(1.0)  # let the recorder process finish starting up
+        on = run(rec)
+        rec.close()
+        on_stats = rec.stats()
+        segments = sorted(os.listdir(folder))
+
+        rec = Recorder(folder, segment_seconds=2, target=_stalled_record)
+        time.sleep(1.0)
+        stalled = run(rec)
+        rec.close(timeout=1.0)
+        stalled_stats = rec.stats()
+
+    print(f"recording off:     p50 {off[0]:.2f} ms, p99 {off[1]:.2f} ms")
+    print(f"recording on:      p50 {on[0]:.2f} ms, p99 {on[1]:.2f} ms, "
+          f"{on_stats['recorded']} recorded, {on_stats['dropped']} dropped, {len(segments)} segments")
+    print(f"stalled disk:      p50 {stalled[0]:.2f} ms, p99 {stalled[1]:.2f} ms, "
+          f"{stalled_stats['dropped']} dropped instead of waiting")
+    # recording may add the ring copy (tens of microseconds), nothing more
+    ok = on[0] - off[0] < 0.5 and stalled[0] - off[0] < 0.5 and on_stats["dropped"] == 0
+    print("latency unchanged" if ok else "LATENCY CHANGED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Soak Test
+v1.0.1
+1. Local mode (default): replay an .mjpeg clip (or synthetic lane frames)
+   through the real vision loop (vision.run_vision with a capture.FileSource)
+   into a sink that does what the server's does: keep the latest frames and
+   fill a FrameHistory
+2. Server mode (--url): against a running curvedLine.py with debug.enabled,
+   keep opening /video_feed streams, reading a few frames and dropping the
+   connection (what a flaky browser does), and read /debug/memory
+3. Either way RSS is sampled every --interval seconds; the first --warmup
+   seconds fill caches and the history and are not counted
+4. Fail (exit 1) if RSS grew more than --max-growth-mb after the warmup,
+   (local mode) if the vision loop died or delivered no frames after the
+   warmup, or (server mode) if stream generators of dropped clients are
+   still alive; with --trace the top allocation sites are printed on failure
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from memory_watch import MemoryTracker, rss_bytes
+
+
+class HistorySink:
+    """
+    What curvedLine.FrameSink does with frames, minus the server.
+    """
+    def __init__(self):
+        from frame_history import FrameHistory
+        self.history = FrameHistory()
+        self.latest_raw = None
+        self.latest = None
+        self.frames = 0
+
+    def raw(self, seq, timestamp, jpeg):
+        self.latest_raw = jpeg
+
+    def processed(self, seq, timestamp, jpeg, detections):
+        self.latest = (jpeg, detections)
+        self.history.put(seq, timestamp, jpeg, detections["results"])
+        self.frames += 1
+
+
+def soak_local(args, sample):
+    from capture import FileSource, write_test_clip
+    from vision import FrameGovernor, run_vision
+    path = args.clip
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "lanes.mjpeg")
+        write_test_clip(path)
+    sink = HistorySink()
+    stop = threading.Event()
+    source = FileSource(path, fps=args.fps or None)
+    governor = FrameGovernor(target_fps=args.fps or 1000.0)
+    thread = threading.Thread(target=run_vision, kwargs=dict(sink=sink, stop=stop, source=source,
+                                                             governor=governor), daemon=True)
+    thread.start()
+    try:
+        result = sample(rss_bytes, lambda: {"frames": sink.frames})
+        # a loop that died or stalled allocates nothing: that must not pass as "no leak"
+        alive = thread.is_alive()
+        result["stalled"] = not alive or result["progress"]["frames"] <= result["progress_at_warmup"]["frames"]
+        if result["stalled"]:
+            print("the vision loop " + ("died" if not alive else "stopped delivering frames") + " during the run")
+        return result
+    finally:
+        stop.set()
+        thread.join(10)
+
+
+def soak_server(args, sample):
+    url = urlsplit(args.url)
+    stop = threading.Event()
+    dropped = [0]
+
+    def get_json(method, path):
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        conn.request(method, path)
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+        if response.status != 200:
+            raise RuntimeError(f"{method} {path}: {response.status} (is debug.enabled there?)")
+        return json.loads(body)
+
+    def churn():
+        # open a stream, take ~3 frames, hang up without closing it cleanly
+        while not stop.is_set():
+            try:
+                sock = socket.create_connection((url.hostname, url.port or 80), timeout=10)
+                sock.sendall(b"GET /video_feed HTTP/1.1\r\nHost: soak\r\n\r\n")
+                got = 0
+                while got < 3 * 20000:
+                    chunk = sock.recv(65536)
+                    if not chunk:
+                        break
+                    got += len(chunk)
+                sock.close()
+                dropped[0] += 1
+            except OSError:
+                time.sleep(1.0)
+            stop.wait(args.churn_interval)
+
+    if args.trace:
+        get_json("POST", "/debug/memory/baseline")
+    before = get_json("GET", "/debug/memory")["live_streams"]
+    thread = threading.Thread(target=churn, daemon=True)
+    thread.start()
+    try:
+        result = sample(lambda: get_json("GET", "/debug/memory?top=0")["rss"],
+                        lambda: {"dropped_clients": dropped[0]})
+    finally:
+        stop.set()
+        thread.join(15)
+    time.sleep(2.0)  # let the server notice the last disconnect
+    state = get_json("GET", f"/debug/memory?top={args.top}")
+    leaked = sum(state["live_streams"].values()) - sum(before.values())
+    result["leaked_streams"] = leaked
+    result["sites"] = state["sites"]
+    if args.trace:
+        get_json("POST", "/debug/memory/stop")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay frames for a long time and fail if memory keeps growing.")
+    parser.add_argument("clip", nargs="?", help=".mjpeg clip to replay (default: synthetic lane frames)")
+    parser.add_argument("--url", help="soak a running server instead (needs debug.enabled there)")
+    parser.add_argument("--minutes", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=60.0, help="seconds not counted")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between RSS samples")
+    parser.add_argument("--max-growth-mb", type=float, default=20.0)
+    parser.add_argument("--fps", type=float, default=30.0, help="local replay rate (0 = as fast as possible)")
+    parser.add_argument("--churn-interval", type=float, default=0.5, help="seconds between dropped stream clients")
+    parser.add_argument("--trace", action="store_true", help="trace allocations, print the top sites on failure")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    tracker = MemoryTracker() if args.trace and not args.url else None
+
+    def sample(read_rss, progress):
+        start = time.time()
+        end = start + args.minutes * 60
+        baseline = None
+        samples = []
+        while time.time() < end:
+            time.sleep(min(args.interval, max(0.0, end - time.time())))
+            elapsed = time.time() - start
+            rss = read_rss()
+            if baseline is None and elapsed >= args.warmup:
+                baseline = rss
+                at_warmup = progress()
+                if tracker is not None:
+                    tracker.start()
+            samples.append((elapsed, rss))
+            growth = (rss - baseline) / 2 ** 20 if baseline is not None else 0.0
+            print(f"{elapsed:8.0f} s  rss {rss / 2 ** 20:7.1f} MiB  growth {growth:+6.1f} MiB  {progress()}",
+                  flush=True)
+        if baseline is None:
+            raise SystemExit("the run is shorter than the warmup")
+        # the end of the run, not one noisy sample
+        tail = sorted(rss for _, rss in samples[-3:])
+        result = {"growth_mb": (tail[len(tail) // 2] - baseline) / 2 ** 20, "leaked_streams": 0, "sites": None,
+                  "progress_at_warmup": at_warmup, "progress": progress(), "stalled": False}
+        if tracker is not None:
+            result["sites"] = tracker.diff(args.top)["sites"]
+            tracker.stop()
+        return result
+
+    result = soak_server(args, sample) if args.url else soak_local(args, sample)
+
+    ok = result["growth_mb"] <= args.max_growth_mb and result["leaked_streams"] <= 0 and not result["stalled"]
+    print(f"rss grew {result['growth_mb']:.1f} MiB after warmup (limit {args.max_growth_mb} MiB)"
+          + (f", {result['leaked_streams']} stream generators left behind" if args.url else ""))
+    if not ok and result["sites"]:
+        print("top allocation sites since the baseline:")
+        for site in result["sites"]:
+            print(f"  {site['size_diff'] / 1024:10.1f} KiB  {site['count_diff']:+8d}  {site['site']}")
+    print("PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
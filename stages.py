@@ -0,0 +1,237 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+import lanes
+from movingCircle import CanTracker
+
+# threads the stages run on; OpenCV drops the GIL inside its calls so they overlap
+STAGE_WORKERS = 2
+
+
+class FrameContext:
+    """
+    One captured frame and the intermediate images stages ask for.
+    Each one (grayscale, a given blur, ...) is computed the first time a stage
+    needs it and then shared, also between stages running at the same time.
+
+    Parameters:
+    frame : BGR frame (stages must not draw on it)
+    seq : frame sequence number
+    timestamp : capture time (time.time())
+
+    Return:
+    None
+    """
+    def __init__(self, frame, seq=0, timestamp=None):
+        self.frame = frame
+        self.seq = seq
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self._cache = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def cached(self, key, compute):
+        """
+        Return the value stored under key, computing it once (other threads asking meanwhile wait for it).
+
+        Parameters:
+        key : hashable name of the intermediate
+        compute : function () -> value
+
+        Return:
+        the value
+        """
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._cache:
+                self._cache[key] = compute()
+            return self._cache[key]
+
+    @property
+    def gray(self):
+        """
+        Full-frame grayscale.
+        """
+        return self.cached("gray", lambda: cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY))
+
+    def blur(self, ksize, sigma=0, box=None):
+        """
+        Gaussian blur of the grayscale frame, or of a box (x1, y1, x2, y2) of it.
+        """
+        def compute():
+            gray = self.gray
+            if box is not None:
+                x1, y1, x2, y2 = box
+                gray = gray[y1:y2, x1:x2]
+            return cv2.GaussianBlur(gray, (ksize, ksize), sigma)
+        return self.cached(("blur", ksize, sigma, box), compute)
+
+
+class LaneStage:
+    """
+    curvedLine's lane fitter (lanes.py) as a stage.
+    Result: {"left": [[x, y], [x, y]] or None, "right": ..., "center": ...}
+    """
+    name = "lanes"
+    sides = {lanes.LEFT_COLOR: "left", lanes.RIGHT_COLOR: "right", lanes.CENTER_COLOR: "center"}
+
+    def __init__(self, cached_background=True):
+        # reuse the threshold background between frames (lanes.BackgroundCache)
+        self.background = lanes.BackgroundCache() if cached_background else None
+
+    def __call__(self, ctx):
+        height, width = ctx.frame.shape[:2]
+        box = lanes.crop_box(width, height)
+        mask = lanes.lane_mask(ctx.blur(lanes.BLUR_K, 0, box), self.background)
+        result = {side: None for side in self.sides.values()}
+        for p1, p2, color in lanes.lines_from_mask(mask, box[:2]):
+            result[self.sides[color]] = [list(p1), list(p2)]
+        return result
+
+    def draw(self, frame, result):
+        colors = {side: color for color, side in self.sides.items()}
+        lines = [(tuple(line[0]), tuple(line[1]), colors[side]) for side, line in result.items() if line]
+        lanes.draw_lanes(frame, lines)
+
+
+class CanStage:
+    """
+    Can bottom circle (movingCircle.CanTracker) as a stage, on the shared grayscale.
+    The tracker blurs only the crop it searches, so the blur is not shared.
+    Result: {"cx": ..., "cy": ..., "radius": ...} or None
+    """
+    name = "can"
+
+    def __init__(self, engine="hough"):
+        self.tracker = CanTracker(engine=engine)
+
+    def __call__(self, ctx):
+        found = self.tracker.detect(ctx.frame, ctx.seq, gray=ctx.gray)
+        if found is None:
+            return None
+        cx, cy, radius = found
+        return {"cx": cx, "cy": cy, "radius": radius}
+
+    def draw(self, frame, result):
+        if result is None:
+            return
+        cv2.circle(frame, (result["cx"], result["cy"]), result["radius"], (0, 255, 67), 3)
+        cv2.circle(frame, (result["cx"], result["cy"]), 4, (0, 255, 67), -1)
+
+
+# stage name -> class, for picking stages by name
+STAGES = {"lanes": LaneStage, "can": CanStage}
+
+
+def build_stages(names):
+    """
+    Make stages from names in STAGES.
+
+    Parameters:
+    names : iterable of stage names
+
+    Return:
+    list of stages
+    """
+    try:
+        return [STAGES[name]() for name in names]
+    except KeyError as e:
+        raise ValueError(f"unknown detector stage: {e.args[0]} (choose from {', '.join(STAGES)})")
+
+
+class StagePipeline:
+    """
+    Runs every stage on the same FrameContext at once and gathers their results.
+    A stage that raises gets {"error": ...} as its result; the others are not affected.
+
+    Parameters:
+    stages : list of stages (callables ctx -> JSON-able result, with a name and draw(frame, result))
+    workers : threads to run them on
+
+    Return:
+    None
+    """
+    def __init__(self, stages, workers=STAGE_WORKERS):
+        self.stages = list(stages)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(self.stages))),
+                                       thread_name_prefix="stage")
+
+    def _timed(self, stage, ctx):
+        t0 = time.perf_counter()
+        try:
+            result = stage(ctx)
+        except Exception as e:
+            result = {"error": f"{e.__class__.__name__}: {e}"}
+        return result, (time.perf_counter() - t0) * 1000
+
+    def run(self, ctx):
+        """
+        Run all stages on one frame.
+
+        Parameters:
+        ctx : FrameContext
+
+        Return:
+        dict: {"seq", "timestamp", "results": {name: result}, "ms": {name: ms}}
+        """
+        if len(self.stages) == 1:
+            done = [self._timed(self.stages[0], ctx)]
+        else:
+            futures = [self.pool.submit(self._timed, stage, ctx) for stage in self.stages]
+            done = [future.result() for future in futures]
+        return {"seq": ctx.seq, "timestamp": ctx.timestamp,
+                "results": {stage.name: result for stage, (result, _) in zip(self.stages, done)},
+                "ms": {stage.name: round(ms, 2) for stage, (_, ms) in zip(self.stages, done)}}
+
+    def draw(self, frame, detections):
+        """
+        Let every stage draw its result on the frame (in place).
+        """
+        for stage in self.stages:
+            result = detections["results"].get(stage.name)
+            if not (isinstance(result, dict) and "error" in result):
+                stage.draw(frame, result)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+def main():
+    """
+    Compare running lanes + can separately on every frame (each doing its own grayscale
+    and blur, one after the other) with the shared-context pipeline.
+    """
+    import numpy as np
+    import synthetic
+
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rng = np.random.default_rng(0)
+    samples = [frame for frame, _ in synthetic.can_frames(rng, frames)]
+
+    start = time.perf_counter()
+    tracker = CanTracker()
+    for seq, frame in enumerate(samples):
+        lanes.detect_lanes(frame)
+        tracker.detect(frame, seq)
+    separate = (time.perf_counter() - start) / frames * 1000
+
+    pipeline = StagePipeline(build_stages(STAGES))
+    start = time.perf_counter()
+    for seq, frame in enumerate(samples):
+        pipeline.run(FrameContext(frame, seq))
+    shared = (time.perf_counter() - start) / frames * 1000
+    pipeline.close()
+
+    print(f"separate: {separate:.2f} ms/frame, shared pipeline: {shared:.2f} ms/frame ({frames} frames)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
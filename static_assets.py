@@ -0,0 +1,139 @@
+"""
+Static Assets
+v1.0.0
+1. A StaticAsset is read from disk once, at startup, and compressed once:
+   gzip always, brotli too if the brotli package is installed
+2. Each encoding gets its own strong ETag (content hash + encoding)
+3. select() picks the smallest encoding the browser accepts (Accept-Encoding,
+   q=0 means "not this one") and answers 304 with no body if the browser's
+   If-None-Match already names that version
+4. Cache-Control "no-cache": browsers keep the page but check it on every
+   load, so a reload is a 304 and a new deploy shows up at once
+5. Running this file directly prints the sizes for static/index.html and
+   checks the negotiation
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+CACHE_CONTROL = "no-cache"
+
+
+def accepted_encodings(header):
+    """
+    Encodings a browser accepts, from its Accept-Encoding header.
+
+    Parameters:
+    header : the header value (None if missing)
+
+    Return:
+    set of encoding names ("identity" unless it was refused)
+    """
+    accepted = {"identity"}
+    refused = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        (accepted if q > 0 else refused).add(name)
+    if "*" in accepted:
+        accepted |= {"br", "gzip"}
+    return accepted - refused
+
+
+class StaticAsset:
+    """
+    One file served from memory, precompressed, with ETags.
+
+    Parameters:
+    path : file to serve
+    content_type : media type (default: from the file extension)
+    cache_control : Cache-Control header sent with it
+
+    Return:
+    None
+    """
+    def __init__(self, path, content_type=None, cache_control=CACHE_CONTROL):
+        with open(path, "rb") as f:
+            data = f.read()
+        self.path = path
+        self.cache_control = cache_control
+        self.content_type = content_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") and "charset" not in self.content_type:
+            self.content_type += "; charset=utf-8"
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        # encoding -> (body, etag); gzip with mtime=0 so the bytes (and ETag) only change with the file
+        self.versions = {"identity": (data, f'"{digest}"'),
+                         "gzip": (gzip.compress(data, 9, mtime=0), f'"{digest}-gz"')}
+        if brotli is not None:
+            self.versions["br"] = (brotli.compress(data, quality=11), f'"{digest}-br"')
+
+    def select(self, accept_encoding=None, if_none_match=None):
+        """
+        The response for one request.
+
+        Parameters:
+        accept_encoding : the request's Accept-Encoding header
+        if_none_match : the request's If-None-Match header
+
+        Return:
+        tuple: (status 200 or 304, body bytes, dict of headers)
+        """
+        accepted = accepted_encodings(accept_encoding)
+        encoding = min((e for e in self.versions if e in accepted),
+                       key=lambda e: len(self.versions[e][0]), default="identity")
+        body, etag = self.versions[encoding]
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        # weak comparison: W/"x" matches "x" (proxies may weaken ETags when they recompress)
+        tags = [tag.strip().removeprefix("W/") for tag in (if_none_match or "").split(",")]
+        if etag in tags or "*" in tags:
+            return 304, b"", headers
+        return 200, body, headers
+
+
+def main():
+    """
+    Sizes per encoding for the GUI page, and a check of the negotiation and 304s.
+    """
+    asset = StaticAsset(os.path.join(STATIC_DIR, "index.html"))
+    for encoding, (body, etag) in asset.versions.items():
+        print(f"{encoding:8s} {len(body):6d} bytes  ETag {etag}")
+    if brotli is None:
+        print("(brotli not installed: gzip only)")
+
+    best = "br" if brotli is not None else "gzip"
+    status, body, headers = asset.select("gzip, deflate, br")
+    assert status == 200 and headers["Content-Encoding"] == best
+    assert asset.select("gzip;q=0")[2].get("Content-Encoding") is None
+    assert asset.select(None)[1] == asset.versions["identity"][0]
+    assert gzip.decompress(asset.select("gzip")[1]) == asset.versions["identity"][0]
+    status, body, _ = asset.select("gzip, deflate, br", headers["ETag"])
+    assert status == 304 and body == b""
+    # an ETag for another encoding is another version: full response
+    assert asset.select("identity", headers["ETag"])[0] == 200
+    print("ok")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""
+Synthetic Test Scenes
+v1.0.1
+1. Draw scenes whose answer is known exactly:
+   a. can_image: a can bottom (dark metal disc, bright rim, inner ring) on a
+      shaded floor, with its true outer circle (sub-pixel drawing, no rounding)
+   b. can_frames: the can rolling across the floor frame by frame (bouncing off
+      the edges), with the true circle of every frame
+   c. lane_frames: two strips of dark tape seen in perspective, drifting
+      slowly from side to side, with the true left / right / center lines
+2. degrade() adds controlled trouble to any scene, in the order a camera would:
+   motion blur, defocus blur, a glare spot, then sensor noise
+3. CONDITIONS names the presets the benchmark runs every detector under
+4. Running this file writes the scenes as fixtures (images, .avi videos and a
+   truth .json per scene) into a folder, for the scripts that read files
+Lines are ((x1, y1), (x2, y2)) tuples in full-frame pixels, circles (cx, cy, r).
+"""
+
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# (height, width) of every generated frame
+FRAME_SIZE = (480, 640)
+
+# controlled trouble for degrade(): noise sigma (0-255), blur kernel (odd px),
+# glare strength (0-1 of white at the spot center), motion blur length (px)
+CONDITIONS = {
+    "clean": {},
+    "noise": {"noise": 12.0},
+    "blur": {"blur": 7},
+    "glare": {"glare": 0.6},
+    "motion": {"motion": 9},
+    "hard": {"noise": 10.0, "blur": 5, "glare": 0.4, "motion": 7},
+}
+
+# subpixel bits used when drawing, so the truth does not have to be rounded
+SHIFT_BITS = 4
+SHIFT = 1 << SHIFT_BITS
+
+
+def _sub(value):
+    return int(round(value * SHIFT))
+
+
+def motion_kernel(length, angle):
+    """
+    Normalized line kernel for motion blur.
+
+    Parameters:
+    length : blur length in pixels
+    angle : direction of travel in radians
+
+    Return:
+    float32 kernel (length x length)
+    """
+    length = max(1, int(length))
+    kernel = np.zeros((length, length), dtype=np.float32)
+    c = (length - 1) / 2
+    dx, dy = np.cos(angle) * c, np.sin(angle) * c
+    cv2.line(kernel, (int(round(c - dx)), int(round(c - dy))), (int(round(c + dx)), int(round(c + dy))), 1.0, 1)
+    return kernel / kernel.sum()
+
+
+def degrade(img, rng, noise=0.0, blur=0, glare=0.0, motion=0, motion_angle=None, glare_at=None):
+    """
+    Apply camera-like trouble to a clean scene.
+
+    Parameters:
+    img : uint8 image (gray or BGR)
+    rng : numpy Generator
+    noise : sigma of the Gaussian sensor noise
+    blur : Gaussian (defocus) kernel size, 0 = none
+    glare : brightness of the glare spot, 0 = none
+    motion : motion blur length in pixels, 0 = none
+    motion_angle : direction of the motion blur (random if None)
+    glare_at : (x, y) of the glare spot (random if None)
+
+    Return:
+    uint8 image of the same shape
+    """
+    out = img
+    if motion > 1:
+        angle = rng.uniform(0, np.pi) if motion_angle is None else motion_angle
+        out = cv2.filter2D(out, -1, motion_kernel(motion, angle))
+    if blur > 1:
+        k = int(blur) | 1
+        out = cv2.GaussianBlur(out, (k, k), 0)
+    if glare <= 0 and noise <= 0:
+        return out
+
+    out = out.astype(np.float32)
+    height, width = out.shape[:2]
+    if glare > 0:
+        gx, gy = (rng.uniform(0, width), rng.uniform(0, height)) if glare_at is None else glare_at
+        sigma = rng.uniform(0.08, 0.2) * max(height, width)
+        yy, xx = np.ogrid[:height, :width]
+        spot = np.exp(-((xx - gx) ** 2 + (yy - gy) ** 2) / (2 * sigma * sigma)).astype(np.float32) * (glare * 255)
+        out += spot if out.ndim == 2 else spot[..., None]
+    if noise > 0:
+        out += rng.normal(0, noise, out.shape).astype(np.float32)
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+
+def _floor(rng, size, base=(150, 150, 150)):
+    """
+    Floor with a gentle lighting gradient and a little texture (BGR).
+    """
+    height, width = size
+    tint = np.array(base, dtype=np.float32) + rng.uniform(-20, 20, 3)
+    ramp = np.linspace(-15, 15, width, dtype=np.float32)[None, :, None] * rng.choice((-1, 1))
+    texture = cv2.GaussianBlur(rng.normal(0, 6, (height, width)).astype(np.float32), (0, 0), 2)[..., None]
+    return np.clip(tint + ramp + texture, 0, 255).astype(np.uint8)
+
+
+def _draw_can(img, cx, cy, r):
+    """
+    Can bottom: dark metal disc, bright rolled rim centered on the outer edge, and the concave inner ring.
+    r is the middle of the rim, the circle the detectors find and the truth records.
+    """
+    center = (_sub(cx), _sub(cy))
+    cv2.circle(img, center, _sub(r), (95, 95, 100), -1, cv2.LINE_AA, SHIFT_BITS)
+    cv2.circle(img, center, _sub(r), (210, 210, 215), 4, cv2.LINE_AA, SHIFT_BITS)
+    cv2.circle(img, center, _sub(r * 0.7), (170, 170, 175), 2, cv2.LINE_AA, SHIFT_BITS)
+
+
+def can_image(rng, size=FRAME_SIZE, radius_range=(170, 225), **trouble):
+    """
+    One still image of a can bottom with a known circle.
+
+    Parameters:
+    rng : numpy Generator
+    size : (height, width)
+    radius_range : (min, max) radius in pixels
+    trouble : keyword arguments for degrade() (see CONDITIONS)
+
+    Return:
+    tuple: (BGR image, (cx, cy, r))
+    """
+    height, width = size
+    r = rng.uniform(*radius_range)
+    cx = rng.uniform(r + 5, width - r - 5)
+    cy = rng.uniform(r + 5, height - r - 5)
+    img = _floor(rng, size)
+    _draw_can(img, cx, cy, r)
+    return degrade(img, rng, **trouble), (cx, cy, r)
+
+
+def can_frames(rng, frames, size=FRAME_SIZE, radius_range=(90, 105), speed=(4.0, 9.0), **trouble):
+    """
+    The can rolling across the floor; yields one frame at a time.
+
+    Parameters:
+    rng : numpy Generator
+    frames : how many frames
+    size : (height, width)
+    radius_range : (min, max) radius in pixels (fixed for the whole clip)
+    speed : (min, max) pixels per frame
+    trouble : keyword arguments for degrade(); motion blur follows the direction of travel
+
+    Return:
+    generator of (BGR frame, (cx, cy, r))
+    """
+    height, width = size
+    r = rng.uniform(*radius_range)
+    cx = rng.uniform(r + 5, width - r - 5)
+    cy = rng.uniform(r + 5, height - r - 5)
+    angle = rng.uniform(0, 2 * np.pi)
+    v = rng.uniform(*speed)
+    vx, vy = v * np.cos(angle), v * np.sin(angle)
+    floor = _floor(rng, size)
+    glare_at = (rng.uniform(0, width), rng.uniform(0, height))
+
+    for _ in range(frames):
+        img = floor.copy()
+        _draw_can(img, cx, cy, r)
+        yield (degrade(img, rng, motion_angle=np.arctan2(vy, vx), glare_at=glare_at, **trouble),
+               (cx, cy, r))
+        cx += vx
+        cy += vy
+        # bounce off the edges
+        if not r < cx < width - r:
+            vx = -vx
+            cx = min(max(cx, r), width - r)
+        if not r < cy < height - r:
+            vy = -vy
+            cy = min(max(cy, r), height - r)
+
+
+def lane_frames(rng, frames, size=FRAME_SIZE, **trouble):
+    """
+    Two strips of dark tape running away from the camera; the robot drifts slowly
+    from side to side, so the lines move a little every frame.
+
+    Parameters:
+    rng : numpy Generator
+    frames : how many frames
+    size : (height, width)
+    trouble : keyword arguments for degrade()
+
+    Return:
+    generator of (BGR frame, {"left": line, "right": line, "center": line})
+    """
+    height, width = size
+    floor = _floor(rng, size, base=(190, 190, 185))
+    glare_at = (rng.uniform(0, width), rng.uniform(0, height))
+    top = 0.55 * height
+    horizon = 0.45 * height
+    phase = rng.uniform(0, 2 * np.pi)
+    half_gap = rng.uniform(0.22, 0.28) * width
+
+    for i in range(frames):
+        # vanishing point and robot offset sway slowly
+        sway = np.sin(phase + i * 0.05)
+        vx = width / 2 + 30 * sway
+        base_x = width / 2 - 25 * sway
+        truth = {}
+        img = floor.copy()
+        for side, sign in (("left", -1), ("right", 1)):
+            bottom = (base_x + sign * half_gap, height - 1)
+            t = (height - 1 - top) / (height - 1 - horizon)
+            end = (bottom[0] + (vx - bottom[0]) * t, top)
+            truth[side] = (bottom, end)
+            # tape is wider near the camera
+            wb, wt = 9.0, 3.0
+            poly = np.array([[_sub(bottom[0] - wb), _sub(bottom[1])], [_sub(end[0] - wt), _sub(end[1])],
+                             [_sub(end[0] + wt), _sub(end[1])], [_sub(bottom[0] + wb), _sub(bottom[1])]],
+                            dtype=np.int32)
+            cv2.fillPoly(img, [poly], (40, 40, 45), cv2.LINE_AA, SHIFT_BITS)
+        (lb, lt), (rb, rt) = truth["left"], truth["right"]
+        truth["center"] = (((lb[0] + rb[0]) / 2, lb[1]), ((lt[0] + rt[0]) / 2, lt[1]))
+        yield degrade(img, rng, glare_at=glare_at, **trouble), truth
+
+
+def line_x_error(line, truth, y_range=None):
+    """
+    Mean horizontal distance between a detected line and the true one, over the rows both cover.
+
+    Parameters:
+    line : ((x1, y1), (x2, y2)) detected, or None
+    truth : ((x1, y1), (x2, y2)) true line
+    y_range : optional (y_min, y_max) to limit the rows compared
+
+    Return:
+    float pixels, or None if the lines share no rows (or the detected one is horizontal)
+    """
+    if line is None:
+        return None
+    (ax, ay), (bx, by) = line
+    (tx1, ty1), (tx2, ty2) = truth
+    if abs(by - ay) < 1:
+        return None
+    lo = max(min(ay, by), min(ty1, ty2))
+    hi = min(max(ay, by), max(ty1, ty2))
+    if y_range is not None:
+        lo, hi = max(lo, y_range[0]), min(hi, y_range[1])
+    if hi - lo < 1:
+        return None
+    ys = np.linspace(lo, hi, 20)
+    x_det = ax + (bx - ax) * (ys - ay) / (by - ay)
+    x_true = tx1 + (tx2 - tx1) * (ys - ty1) / (ty2 - ty1)
+    return float(np.mean(np.abs(x_det - x_true)))
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (tuple, list)):
+        return [_jsonable(v) for v in value]
+    return round(float(value), 3)
+
+
+def write_fixtures(folder, frames=90, seed=0, conditions=None):
+    """
+    Write every scene under every condition to a folder, with its truth.
+
+    Parameters:
+    folder : output folder (created if missing)
+    frames : frames per video
+    seed : random seed (same seed = same files)
+    conditions : names from CONDITIONS (all if None)
+
+    Return:
+    list of files written
+    """
+    os.makedirs(folder, exist_ok=True)
+    written = []
+    for name in conditions or CONDITIONS:
+        trouble = CONDITIONS[name]
+        rng = np.random.default_rng(seed)
+
+        img, truth = can_image(rng, **trouble)
+        path = os.path.join(folder, f"can_{name}.png")
+        cv2.imwrite(path, img)
+        written.append(path)
+        still_truth = truth
+
+        videos = {"can": can_frames(rng, frames, **trouble), "lanes": lane_frames(rng, frames, **trouble)}
+        video_truth = {}
+        for scene, frame_iter in videos.items():
+            path = os.path.join(folder, f"{scene}_{name}.avi")
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30.0, FRAME_SIZE[::-1])
+            video_truth[scene] = []
+            for frame, truth in frame_iter:
+                writer.write(frame)
+                video_truth[scene].append(truth)
+            writer.release()
+            written.append(path)
+
+        path = os.path.join(folder, f"truth_{name}.json")
+        with open(path, "w") as f:
+            json.dump(_jsonable({"can_image": still_truth, "can_video": video_truth["can"],
+                                 "lanes_video": video_truth["lanes"]}), f)
+        written.append(path)
+    return written
+
+
+def main():
+    # Output folder from the command line (synthetic/ if none)
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    folder = args[0] if args else "synthetic"
+    for path in write_fixtures(folder):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
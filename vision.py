@@ -0,0 +1,817 @@
+"""
+Vision Loop
+v1.3.0
+1. run_vision() is the capture + detector stages + JPEG loop that used to live
+   inside curvedLine.py; it has no server state, it hands every frame to a
+   sink: sink.raw(seq, timestamp, jpeg) right after capture and
+   sink.processed(seq, timestamp, jpeg, detections) after the stages ran.
+   Frames come from capture.py; when the camera sends MJPEG its JPEGs are the
+   raw frames as they are, and are only decoded for the detectors
+2. In-process mode: curvedLine runs it on a thread with its own sink
+3. Child-process mode: VisionSupervisor spawns a process that runs it with an
+   ExchangeSink, so OpenCV and the per-sample Python loops no longer share a
+   GIL with the API event loop. Frames come back through two FrameExchange
+   double buffers in shared memory (raw and processed), each with sequence
+   numbers, and a supervisor thread hands them to the same server sink
+4. FrameExchange: two slots; the writer fills the slot readers are not
+   pointed at, then publishes its index and seq; readers copy the slot and
+   check its seq did not change meanwhile (retry up to READ_RETRIES times if
+   it did, then report nothing new until the next poll)
+5. A FrameGovernor paces the loop: frames are started on a fixed deadline
+   grid at target_fps (no busy loop); when nothing wants the output (no
+   viewers, robot not driving; the server's demand() says so) it drops to
+   idle_fps and comes back at once when demand returns. Failed reads back
+   off exponentially and reopen the source after a few in a row; a camera
+   missing at startup goes through the same backoff instead of ending the loop
+6. The child writes a heartbeat every loop; if it dies, or the heartbeat
+   stops (a hung camera), the supervisor restarts it with a growing delay,
+   continuing the sequence numbers where they left off
+7. Several server workers (--workers N): only the one running the camera
+   has the loop. It publishes every frame into two more FrameExchanges and
+   the other workers follow them with a FrameFollower (same delivery as the
+   supervisor's), so every worker serves the same frames. Demand is shared
+   too (SharedDemand): viewers and commands in any worker keep the loop at
+   full rate
+8. Running this file directly measures /status latency on a small HTTP
+   server while a Python-heavy vision loop runs in a thread vs a child process
+"""
+
+import json
+from collections import deque
+import mmap
+import multiprocessing
+import os
+import signal
+import struct
+import sys
+import threading
+import time
+
+from control_state import segment_path
+
+# camera params live in capture.py, lane processing params in lanes.py
+
+# detector stages run on every frame (see stages.STAGES); they share one grayscale per frame
+DETECTOR_STAGES = ("lanes", "can")
+
+# ---------------- Frame-rate governor ----------------
+TARGET_FPS = 30.0
+IDLE_FPS = 2.0           # when nobody uses the output
+WAKE_POLL = 0.02         # while waiting, how often demand is checked
+READ_RETRY = 0.01        # first wait after a failed read, doubles ...
+MAX_READ_RETRY = 2.0     # ... up to this
+REOPEN_AFTER = 5         # failed reads in a row before the source is reopened
+
+# biggest JPEG (+ detections JSON) one exchange slot holds
+EXCHANGE_BYTES = 512 * 1024
+# times a reader retries a frame the writer changed under it before giving up until the next poll
+# (a writer that died mid-publish would otherwise keep it spinning)
+READ_RETRIES = 3
+
+# supervisor: how often it looks for new frames, and when it restarts the child
+POLL_INTERVAL = 0.005
+HANG_TIMEOUT = 10.0      # seconds without a heartbeat
+STARTUP_GRACE = 30.0     # spawning + importing OpenCV + opening the camera
+RESTART_DELAY = 1.0      # doubles after every crash ...
+MAX_RESTART_DELAY = 30.0 # ... up to this
+STABLE_SECONDS = 60.0    # running this long resets the delay
+
+_EX_HEADER = 32  # seq u64, slot u64, heartbeat f64, demand u64
+_EX_SLOT = struct.Struct("<QIId")  # seq, data length, meta length, timestamp
+
+# frame follower: frames stopping this long makes it check whether the writer made a new exchange
+FOLLOW_RECHECK = 1.0
+
+
+class FrameGovernor:
+    """
+    Paces the vision loop and keeps its frame-rate numbers.
+
+    Parameters:
+    target_fps : frame rate while the output is used
+    idle_fps : frame rate while it is not
+    demand : function -> bool, True while something uses the output (None = always)
+
+    Return:
+    None
+    """
+    def __init__(self, target_fps=TARGET_FPS, idle_fps=IDLE_FPS, demand=None):
+        self.target_fps = target_fps
+        self.idle_fps = idle_fps
+        self.demand = demand or (lambda: True)
+        self.idle = False
+        self.idle_seconds = 0.0
+        self.frames = 0
+        self.failures = 0        # failed reads in a row
+        self.failed_reads = 0
+        self.reopens = 0
+        self._retry = READ_RETRY
+        self._wake = threading.Event()
+        self._next = None
+        self._times = deque(maxlen=max(2, int(target_fps * 2)))
+
+    def wake(self):
+        """
+        Output is wanted again (a viewer connected, a command came in): stop waiting now.
+        """
+        self._wake.set()
+
+    def _sleep(self, seconds, stop):
+        """
+        Wait seconds (or until stop is set). Only while idle does wake() or returning demand
+        end it early: at full rate the deadline holds, however often the output is polled.
+
+        Return:
+        bool: False if it was woken early
+        """
+        end = time.perf_counter() + seconds
+        while not (stop is not None and stop.is_set()):
+            left = end - time.perf_counter()
+            if left <= 0:
+                return True
+            if not self.idle:
+                (stop.wait if stop is not None else time.sleep)(min(left, WAKE_POLL))
+            elif self._wake.wait(min(left, WAKE_POLL)) or self.demand():
+                self._wake.clear()
+                return False
+        return True
+
+    def pace(self, stop=None):
+        """
+        Wait for the next frame's deadline (1 / fps after the last one; no catching up with
+        a burst if a frame ran late). Waiting while idle ends early once demand is back.
+        """
+        now = time.perf_counter()
+        idle = not self.demand()
+        if idle != self.idle:
+            self.idle = idle
+            self._next = None  # new rate: start the grid over
+            self._wake.clear()  # wakes from while it was busy are stale
+        interval = 1.0 / (self.idle_fps if idle else self.target_fps)
+        if self._next is None or self._next < now - interval:
+            self._next = now
+        else:
+            self._next += interval
+        if not self._sleep(self._next - now, stop):
+            self.idle = False
+            self._next = time.perf_counter()
+        if idle:
+            self.idle_seconds += time.perf_counter() - now
+
+    def frame_done(self):
+        self.frames += 1
+        self.failures = 0
+        self._retry = READ_RETRY
+        self._times.append(time.perf_counter())
+
+    def read_failed(self, stop=None):
+        """
+        Back off after a failed read.
+
+        Return:
+        bool: True if the source should be reopened now
+        """
+        self.failures += 1
+        self.failed_reads += 1
+        self._sleep(self._retry, stop)
+        self._retry = min(self._retry * 2, MAX_READ_RETRY)
+        if self.failures >= REOPEN_AFTER:
+            self.failures = 0
+            self.reopens += 1
+            return True
+        return False
+
+    @property
+    def fps(self):
+        if len(self._times) < 2 or self._times[-1] == self._times[0]:
+            return 0.0
+        # a long gap (idle, failures) since the last frame counts too
+        span = max(self._times[-1], time.perf_counter() - 1.0 / self.target_fps) - self._times[0]
+        return (len(self._times) - 1) / span
+
+    def report(self):
+        return {"target_fps": self.idle_fps if self.idle else self.target_fps, "actual_fps": round(self.fps, 2),
+                "idle": self.idle, "idle_seconds": round(self.idle_seconds, 1), "frames": self.frames,
+                "failed_reads": self.failed_reads, "reopens": self.reopens}
+
+
+class SharedDemand:
+    """
+    "Output wanted until" time in a shared memory file, so viewers and commands in every
+    server worker count for the FrameGovernor in the worker running the camera. Each
+    caller moves it forward; nothing has to be taken back, so a worker that dies with
+    viewers open stops counting on its own once its lease runs out.
+
+    Parameters:
+    name : segment name (in control_state.SHM_DIR); every worker opens the same one
+
+    Return:
+    None
+    """
+    def __init__(self, name):
+        self.name = name
+        fd = os.open(segment_path(name), os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < 8:
+            os.ftruncate(fd, 8)
+        self._mmap = mmap.mmap(fd, 8)
+        os.close(fd)
+        # one aligned 8 byte load / store
+        self._until = memoryview(self._mmap).cast("d")
+
+    def want(self, seconds):
+        """
+        The output is used for (at least) the next seconds: a viewer's lease, a command's hold.
+        """
+        until = time.time() + seconds
+        if until > self._until[0]:
+            self._until[0] = until
+
+    @property
+    def wanted(self):
+        return time.time() < self._until[0]
+
+    def close(self):
+        self._until.release()
+        self._mmap.close()
+
+
+def run_vision(sink, stop=None, stages=DETECTOR_STAGES, start_seq=1, heartbeat=None, source=None, governor=None):
+    """
+    Main OpenCV loop: capture frames, run the detector stages (lanes, can, ...) + drawing,
+    encode to JPEG, and hand both JPEGs to the sink.
+
+    Parameters:
+    sink : object with raw(seq, timestamp, jpeg) and processed(seq, timestamp, jpeg, detections)
+    stop : threading.Event that ends the loop (None = run forever)
+    stages : detector stage names
+    start_seq : sequence number of the first frame
+    heartbeat : function called once per loop (the child process uses it)
+    source : frame source (capture.open_source(): None = the camera, an .mjpeg file path, or a source object)
+    governor : FrameGovernor pacing the loop (None = one at TARGET_FPS, never idle)
+
+    Return:
+    None
+    """
+    import cv2
+    from capture import decode_jpeg, encode_frame, open_source
+    from stages import FrameContext, StagePipeline, build_stages
+
+    cap = open_source(source)
+    # a camera that is not there (yet) reads nothing: the failed-read backoff below keeps
+    # reopening it, so plugging it in later works without a restart
+    if not cap.isOpened():
+        print("ayyy camera not opened, check your camera index (retrying)")
+
+    governor = governor or FrameGovernor()
+    pipeline = StagePipeline(build_stages(stages))
+    seq = start_seq - 1
+    try:
+        while stop is None or not stop.is_set():
+            if heartbeat is not None:
+                heartbeat()
+            governor.pace(stop)
+            jpeg_raw, frame = cap.read()
+            if jpeg_raw is None and frame is None:
+                # frame not grabbed: wait longer every time, and after a few reopen the camera
+                if governor.read_failed(stop):
+                    print("camera stopped delivering frames, reopening it")
+                    cap.release()
+                    cap = open_source(source)
+                continue
+            governor.frame_done()
+            seq += 1
+            timestamp = time.time()
+
+            # RAW frame (no drawings): the camera's own JPEG when it sends MJPEG, else resize + encode
+            if frame is not None:
+                jpeg_raw, frame = encode_frame(frame)
+            if jpeg_raw is not None:
+                sink.raw(seq, timestamp, jpeg_raw)
+            if frame is None:
+                # passthrough: decoded once, only because the detectors use this frame
+                frame = decode_jpeg(jpeg_raw)
+                if frame is None:
+                    continue
+
+            # --------- detector stages (stages.py) + drawing -----------
+            # all stages see the same frame and share its grayscale; they run at the same time
+            detections = pipeline.run(FrameContext(frame, seq, timestamp))
+            pipeline.draw(frame, detections)
+
+            # --------- prepare jpeg and hand it over ---------
+            ret2, jpeg = cv2.imencode('.jpg', frame)
+            if ret2:
+                sink.processed(seq, timestamp, jpeg.tobytes(), detections)
+    finally:
+        cap.release()
+        pipeline.close()
+
+
+class FrameExchange:
+    """
+    Latest-frame double buffer in a shared memory file, one writer process and any readers.
+    Readers always get the newest complete frame; frames they were too slow for are skipped.
+
+    Parameters:
+    name : segment name (in control_state.SHM_DIR)
+    capacity : most bytes of data + meta per frame (only used by the creator)
+    create : True in the process that owns (and later removes) the segment
+
+    Return:
+    None
+    """
+    def __init__(self, name, capacity=EXCHANGE_BYTES, create=False):
+        self.name = name
+        self.path = segment_path(name)
+        self.owner = create
+        if create:
+            capacity = (capacity + 7) // 8 * 8
+            # always a new file: shrinking one a reader still has mapped would crash it (SIGBUS)
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+            os.ftruncate(fd, _EX_HEADER + 2 * (_EX_SLOT.size + capacity))
+        else:
+            fd = os.open(self.path, os.O_RDWR)
+        self._inode = os.fstat(fd).st_ino
+        self._mmap = mmap.mmap(fd, 0)
+        os.close(fd)
+        self._buf = memoryview(self._mmap)
+        # aligned 8 byte loads / stores for the seq fields, never seen half written
+        self._q = self._buf.cast("Q")
+        self._beat = self._buf[16:24].cast("d")
+        self.capacity = (len(self._buf) - _EX_HEADER) // 2 - _EX_SLOT.size
+        self._stride = _EX_SLOT.size + self.capacity
+        self._slot = self._q[1]
+        self.too_large = 0
+
+    # ---------------- writer ----------------
+    def publish(self, seq, timestamp, data, meta=b""):
+        """
+        Writer: make this the newest frame (seq must be > 0).
+
+        Return:
+        bool: False if data + meta do not fit
+        """
+        if len(data) + len(meta) > self.capacity:
+            self.too_large += 1
+            return False
+        slot = 1 - self._slot
+        start = _EX_HEADER + slot * self._stride
+        self._q[start // 8] = 0  # readers of this slot will notice it changing
+        _EX_SLOT.pack_into(self._buf, start, 0, len(data), len(meta), timestamp)
+        body = start + _EX_SLOT.size
+        self._buf[body:body + len(data)] = data
+        self._buf[body + len(data):body + len(data) + len(meta)] = meta
+        self._q[start // 8] = seq
+        self._q[1] = slot
+        self._q[0] = seq
+        self._slot = slot
+        return True
+
+    def beat(self):
+        """
+        Writer: record that the writing process is alive.
+        """
+        self._beat[0] = time.time()
+
+    @property
+    def demand(self):
+        """
+        Set by the reading side: whether anything uses the frames (see FrameGovernor).
+        """
+        return self._q[3] != 0
+
+    @demand.setter
+    def demand(self, wanted):
+        self._q[3] = 1 if wanted else 0
+
+    # ---------------- reader ----------------
+    @property
+    def seq(self):
+        return self._q[0]
+
+    @property
+    def heartbeat(self):
+        return self._beat[0]
+
+    def read(self, last_seq=0):
+        """
+        Reader: copy out the newest frame if it is not last_seq.
+
+        Return:
+        tuple: (seq, timestamp, data bytes, meta bytes), or None if there is nothing new
+        (or no consistent frame after READ_RETRIES tries)
+        """
+        for _ in range(READ_RETRIES):
+            seq = self._q[0]
+            if seq == 0 or seq == last_seq:
+                return None
+            slot = self._q[1]
+            if slot > 1:
+                return None  # not a slot index: a corrupt header
+            start = _EX_HEADER + slot * self._stride
+            if self._q[start // 8] != seq:
+                continue  # the writer moved on between the two loads
+            _, length, meta_length, timestamp = _EX_SLOT.unpack_from(self._buf, start)
+            if length + meta_length > self.capacity:
+                continue  # lengths being rewritten
+            body = start + _EX_SLOT.size
+            data = bytes(self._buf[body:body + length])
+            meta = bytes(self._buf[body + length:body + length + meta_length])
+            if self._q[start // 8] == seq:
+                return seq, timestamp, data, meta
+        return None
+
+    def replaced(self):
+        """
+        Reader: whether the segment is gone or was made anew (the writer restarted) since
+        this one opened it; this mapping then never sees another frame.
+        """
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return True
+
+    def close(self):
+        self._beat.release()
+        self._q.release()
+        self._buf.release()
+        self._mmap.close()
+        # not if a new writer already made its own under the same name
+        if self.owner and not self.replaced():
+            os.unlink(self.path)
+
+
+class ExchangeSink:
+    """
+    run_vision sink for the child process: writes into the two exchanges
+    (the governor's numbers go along with the detections). The server's FrameSink
+    also publishes through one for the other workers (see FrameFollower).
+    """
+    def __init__(self, raw_exchange, processed_exchange, governor=None):
+        self.raw_exchange = raw_exchange
+        self.processed_exchange = processed_exchange
+        self.governor = governor
+
+    def raw(self, seq, timestamp, jpeg):
+        self.raw_exchange.publish(seq, timestamp, jpeg)
+
+    def processed(self, seq, timestamp, jpeg, detections):
+        meta = {"detections": detections, "governor": self.governor.report() if self.governor else None}
+        self.processed_exchange.publish(seq, timestamp, jpeg, json.dumps(meta).encode())
+
+
+def child_main(raw_name, processed_name, stages, start_seq, source=None):
+    """
+    Entry point of the vision child process.
+    """
+    raw = FrameExchange(raw_name)
+    processed = FrameExchange(processed_name)
+    stop = threading.Event()
+    # terminate() from the supervisor: finish the frame and release the camera
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    # the server sets demand in the raw exchange; checked every WAKE_POLL while idle
+    governor = FrameGovernor(demand=lambda: raw.demand)
+    raw.beat()
+    try:
+        run_vision(ExchangeSink(raw, processed, governor), stop, stages, start_seq, raw.beat, source, governor)
+    finally:
+        raw.close()
+        processed.close()
+
+
+class ExchangeReader:
+    """
+    Hands the frames of a raw and a processed FrameExchange (as an ExchangeSink writes them)
+    to a server sink; what VisionSupervisor and FrameFollower have in common.
+
+    Parameters:
+    sink : the server's sink (raw(...), processed(...))
+
+    Return:
+    None
+    """
+    def __init__(self, sink):
+        self.sink = sink
+        self.raw = None
+        self.processed = None
+        self.raw_seq = 0
+        self.last_seq = 0
+        self.seq_offset = 0  # added to the exchanges' seqs on the way to the sink
+        self.last_frame_time = None
+        self.governor = None
+
+    def _deliver(self):
+        """
+        Hand the newest raw / processed frame to the sink if there is one we have not delivered.
+
+        Return:
+        bool: True if anything was delivered
+        """
+        got = False
+        item = self.raw.read(self.raw_seq)
+        if item is not None:
+            self.raw_seq, timestamp, data, _ = item
+            self.sink.raw(self.raw_seq + self.seq_offset, timestamp, data)
+            got = True
+        item = self.processed.read(self.last_seq)
+        if item is not None:
+            self.last_seq, timestamp, data, meta = item
+            self.last_frame_time = time.time()
+            meta = json.loads(meta)
+            self.governor = meta["governor"]
+            self.sink.processed(self.last_seq + self.seq_offset, timestamp, data, meta["detections"])
+            got = True
+        return got
+
+
+class VisionSupervisor(ExchangeReader):
+    """
+    Runs the vision loop in a child process and delivers its frames to a server sink
+    (same raw/processed calls as in-process mode) from a thread in this process.
+    Restarts the child if it exits or stops sending heartbeats.
+
+    Parameters:
+    sink : the server's sink (raw(...), processed(...))
+    stages : detector stage names for the child
+    target : function run in the child (child_main, or a stand-in for testing)
+    source : frame source for the child (see capture.open_source)
+    demand : function -> bool for the child's FrameGovernor, checked here and passed on
+
+    Return:
+    None
+    """
+    def __init__(self, sink, stages=DETECTOR_STAGES, target=child_main, source=None, demand=None):
+        super().__init__(sink)
+        self.stages = tuple(stages)
+        self.target = target
+        self.source = source
+        self.demand = demand or (lambda: True)
+        self.raw = FrameExchange(f"pwp_vision_raw_{os.getpid()}", create=True)
+        self.processed = FrameExchange(f"pwp_vision_out_{os.getpid()}", create=True)
+        self.raw.demand = self.demand()
+        self.process = None
+        self.restarts = 0
+        self._started = 0.0
+        self._stop = threading.Event()
+        # spawn: the server has threads running, a forked child would inherit their locks
+        self._context = multiprocessing.get_context("spawn")
+        self._thread = threading.Thread(target=self._run, name="vision-supervisor", daemon=True)
+        self._thread.start()
+
+    def _start_child(self):
+        # a restarted child continues the sequence numbers (history, ETags and clients rely on them growing)
+        start_seq = max(self.raw.seq, self.processed.seq) + 1
+        self.process = self._context.Process(target=self.target, name="vision", daemon=True,
+                                             args=(self.raw.name, self.processed.name, self.stages, start_seq, self.source))
+        self._started = time.time()
+        self.process.start()
+
+    def _hung(self):
+        now = time.time()
+        beat = self.raw.heartbeat
+        if beat < self._started:
+            return now - self._started > STARTUP_GRACE
+        return now - beat > HANG_TIMEOUT
+
+    def _run(self):
+        delay = RESTART_DELAY
+        self._start_child()
+        while not self._stop.is_set():
+            self.raw.demand = self.demand()
+            got = self._deliver()
+            alive = self.process.is_alive()
+            if not alive or self._hung():
+                if alive:
+                    self.process.kill()
+                self.process.join()
+                print(f"vision process {'hung' if alive else f'exited ({self.process.exitcode})'}, "
+                      f"restarting in {delay:.0f} s")
+                if self._stop.wait(delay):
+                    break
+                self.restarts += 1
+                delay = min(delay * 2, MAX_RESTART_DELAY)
+                self._start_child()
+            elif time.time() - self._started > STABLE_SECONDS:
+                delay = RESTART_DELAY
+            if not got:
+                self._stop.wait(POLL_INTERVAL)
+
+    def status(self):
+        return {"mode": "process", "alive": self.process is not None and self.process.is_alive(),
+                "pid": self.process.pid if self.process else None, "restarts": self.restarts,
+                "last_seq": self.last_seq,
+                "last_frame_age": None if self.last_frame_time is None else round(time.time() - self.last_frame_time, 3),
+                "governor": self.governor}
+
+    def close(self, timeout=5.0):
+        """
+        Stop the supervisor thread, then the child (SIGTERM lets it release the camera), and remove the exchanges.
+        """
+        self._stop.set()
+        self._thread.join(timeout)
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self.raw.close()
+        self.processed.close()
+
+
+class FrameFollower(ExchangeReader):
+    """
+    In a server worker without the camera: follows the two exchanges the camera worker
+    publishes to (through an ExchangeSink) and hands their frames to this worker's sink
+    from a thread. Waits for the exchanges to appear, and opens the new ones when the camera
+    worker restarts; its sequence numbers start over then, so an offset keeps the ones
+    handed to the sink growing (the frame history and ETags rely on it).
+
+    Parameters:
+    sink : the server's sink (raw(...), processed(...))
+    raw_name, processed_name : names of the exchanges the camera worker publishes to
+
+    Return:
+    None
+    """
+    def __init__(self, sink, raw_name, processed_name):
+        super().__init__(sink)
+        self.raw_name = raw_name
+        self.processed_name = processed_name
+        self.reopens = 0
+        self.writer_beat = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="frame-follower", daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        raw = None
+        try:
+            raw = FrameExchange(self.raw_name)
+            processed = FrameExchange(self.processed_name)
+        except (FileNotFoundError, ValueError):
+            # not there yet, or just created and not sized yet (mmap of an empty file)
+            if raw is not None:
+                raw.close()
+            return False
+        if self.raw_seq or self.last_seq:
+            self.seq_offset += max(self.raw_seq, self.last_seq)
+            self.raw_seq = self.last_seq = 0
+            self.reopens += 1
+        self.raw, self.processed = raw, processed
+        return True
+
+    def _close_exchanges(self):
+        if self.raw is not None:
+            self.raw.close()
+            self.processed.close()
+            self.raw = self.processed = None
+
+    def _run(self):
+        checked = time.time()
+        while not self._stop.is_set():
+            if self.raw is None and not self._open():
+                self._stop.wait(FOLLOW_RECHECK)
+                continue
+            self.writer_beat = self.raw.heartbeat
+            if self._deliver():
+                checked = time.time()
+                continue
+            if time.time() - checked > FOLLOW_RECHECK:
+                checked = time.time()
+                if self.raw.replaced() or self.processed.replaced():
+                    self._close_exchanges()
+                    continue
+            self._stop.wait(POLL_INTERVAL)
+        self._close_exchanges()
+
+    def status(self):
+        return {"mode": "shared", "alive": time.time() - self.writer_beat < HANG_TIMEOUT,
+                "last_seq": self.last_seq + self.seq_offset if self.last_seq else 0, "reopens": self.reopens,
+                "last_frame_age": None if self.last_frame_time is None else round(time.time() - self.last_frame_time, 3),
+                "governor": self.governor}
+
+    def close(self, timeout=5.0):
+        """
+        Stop following (the exchanges belong to the camera worker and stay).
+        """
+        self._stop.set()
+        self._thread.join(timeout)
+
+
+def _busy_vision(sink, stop, start_seq=1, heartbeat=None):
+    # stand-in for run_vision without a camera: ~25 ms of pure Python per frame (the
+    # per-sample loops in lanes.py hold the GIL like this), then a 40 KB "jpeg"
+    seq = start_seq
+    while stop is None or not stop.is_set():
+        if heartbeat is not None:
+            heartbeat()
+        end = time.perf_counter() + 0.025
+        x = 0
+        while time.perf_counter() < end:
+            x += 1
+        jpeg = bytes([seq % 251]) * 40000
+        sink.raw(seq, time.time(), jpeg)
+        sink.processed(seq, time.time(), jpeg, {"seq": seq})
+        seq += 1
+
+
+def _busy_child(raw_name, processed_name, stages, start_seq, source=None):
+    raw = FrameExchange(raw_name)
+    processed = FrameExchange(processed_name)
+    try:
+        _busy_vision(ExchangeSink(raw, processed), None, start_seq, raw.beat)
+    finally:
+        raw.close()
+        processed.close()
+
+
+def main():
+    """
+    Control endpoint latency with vision in a thread vs in a child process: a threaded HTTP
+    server answers GET /status (the robot state from SharedControls, like curvedLine's /status)
+    while a Python-heavy vision stand-in runs; a keep-alive client times requests.
+    """
+    import http.client
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from control_state import SharedControls, remove_segment
+
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    controls = SharedControls(f"pwp_vision_bench_{os.getpid()}")
+
+    class FrameSink:
+        def __init__(self):
+            self.frames = 0
+
+        def raw(self, seq, timestamp, jpeg):
+            self.latest_raw = jpeg
+
+        def processed(self, seq, timestamp, jpeg, detections):
+            self.latest = jpeg
+            self.frames += 1
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def do_GET(self):
+            body = json.dumps(controls.snapshot()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def measure():
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        latencies = []
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            conn.request("GET", "/status")
+            conn.getresponse().read()
+            latencies.append((time.perf_counter() - t0) * 1000)
+            time.sleep(0.01)
+        conn.close()
+        latencies.sort()
+        return [latencies[int(len(latencies) * q)] for q in (0.5, 0.95, 0.99)]
+
+    results = {"no vision": measure()}
+
+    sink, stop = FrameSink(), threading.Event()
+    thread = threading.Thread(target=_busy_vision, args=(sink, stop), daemon=True)
+    thread.start()
+    results["vision thread"] = measure()
+    stop.set()
+    thread.join()
+    thread_fps = sink.frames
+
+    sink = FrameSink()
+    supervisor = VisionSupervisor(sink, target=_busy_child)
+    time.sleep(1.0)  # let the child finish starting up
+    sink.frames = 0
+    results["vision process"] = measure()
+    child_fps = sink.frames
+    supervisor.close()
+
+    server.shutdown()
+    controls.close()
+    remove_segment(controls.name)
+    for name, (p50, p95, p99) in results.items():
+        print(f"{name:15s} /status p50 {p50:6.2f} ms  p95 {p95:6.2f} ms  p99 {p99:6.2f} ms")
+    print(f"frames delivered while measuring: thread {thread_fps}, process {child_fps} "
+          f"({os.cpu_count()} cores)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())